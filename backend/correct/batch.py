@@ -0,0 +1,178 @@
+"""
+Batched grading: grade several students' answers to the same question in one LLM call.
+
+The stem and rubric are sent once per batch instead of once per student, which cuts
+input tokens and wall-clock time for large classes. Results are mapped back by
+``answer_id``; any answer whose result is missing or fails validation comes back as
+``None`` so the caller can re-grade it on its own with the regular node.
+
+The batch prompt (prompts/batch.txt) carries the same inputs as the per-type prompts: the
+concept prompt's knowledge context, the calculation prompt's correct answer, and the
+whole answer text where the proof prompt has it as a single step. Only the output format
+differs, with one result per ``answer_id``.
+"""
+import os
+import structlog
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+from backend.models import Correction, StepScore, GradedStep
+from backend.correct.prompt_utils import prepare_batch_prompt
+from backend.correct.concept import DEFAULT_CONTEXT
+from backend.structured_output import ainvoke_structured
+from backend.retry import retry_async
+
+# Setup logger
+logger = structlog.get_logger()
+
+BATCH_TEMPLATE_NAME = "batch"
+
+# Answers per LLM call for each internal question type. 1 disables batching.
+# Programming answers are graded from their own execution results, so they are never batched.
+DEFAULT_BATCH_SIZES = {
+    "concept": 8,
+    "calculation": 4,
+    "proof": 2,
+    "programming": 1,
+}
+
+QUESTION_TYPE_NAMES = {
+    "concept": "concept",
+    "calculation": "calculation",
+    "proof": "proof / reasoning",
+}
+
+# Knowledge context per internal type, as the per-type prompts send it (only the concept prompt has one)
+CONTEXTS = {
+    "concept": DEFAULT_CONTEXT,
+}
+
+
+def get_batch_size(internal_type: str) -> int:
+    """Configured batch size for a question type (env GRADING_BATCH_SIZE_<TYPE>)."""
+    if internal_type == "programming":
+        return 1
+    default = DEFAULT_BATCH_SIZES.get(internal_type, 1)
+    try:
+        return max(1, int(os.getenv(f"GRADING_BATCH_SIZE_{internal_type.upper()}", default)))
+    except ValueError:
+        return default
+
+
+class BatchGradingItem(BaseModel):
+    """Grading result for one answer inside a batch."""
+    answer_id: str
+    score: float
+    max_score: Optional[float] = None
+    confidence: float = 0.8
+    comment: str = ""
+    steps: List[GradedStep] = Field(default_factory=list)
+    hits: Optional[List[str]] = None
+
+
+class BatchGradingResult(BaseModel):
+    """Multi-result schema returned by the batched grading prompt."""
+    results: List[BatchGradingItem]
+
+
+def _item_to_correction(item: BatchGradingItem, q_id: str, question_type: str, max_score: float,
+                        with_hits: bool) -> Optional[Correction]:
+    """Validate one batch item and convert it to a Correction (None if invalid)."""
+    item_max_score = item.max_score if item.max_score and item.max_score > 0 else max_score
+    if not (0.0 <= item.score <= item_max_score):
+        logger.warning("batch_item_score_out_of_range", answer_id=item.answer_id, score=item.score, max_score=item_max_score)
+        return None
+
+    step_scores = []
+    for step in (graded.model_dump(exclude_none=True) for graded in item.steps):
+        try:
+            step_scores.append(StepScore(
+                step_no=step.get("step_no", len(step_scores) + 1),
+                desc=step.get("desc", step.get("comment", f"Step {step.get('step_no', len(step_scores) + 1)}")),
+                is_correct=step.get("is_correct", True) if step.get("is_correct") is not None else True,
+                score=step.get("score", 0.0)
+            ))
+        except Exception as step_creation_error:
+            logger.warning("step_creation_failed", error=str(step_creation_error), step_data=step)
+
+    return Correction(
+        q_id=q_id,
+        type=question_type,
+        score=item.score,
+        max_score=item_max_score,
+        confidence=max(0.0, min(item.confidence, 1.0)),
+        comment=item.comment,
+        steps=step_scores,
+        hits=item.hits if with_hits else None,
+        complete=True
+    )
+
+
+async def batch_grade_node(internal_type: str, q_id: str, question_type: str, stem: str, rubric: str,
+                           answers: List[str], max_score: float = 10.0, llm=None,
+                           correct_answer: str = "No answers provided. Please think deeply and derive correct answers based on the problem!") -> List[Optional[Correction]]:
+    """
+    Grade several answers to the same question with one LLM call.
+
+    Args:
+        internal_type: Internal question type ("concept", "calculation", "proof")
+        q_id: Question id, copied into every correction
+        question_type: Original (Chinese) question type for the corrections
+        stem: The problem statement
+        rubric: The grading rubric
+        answers: Student answer texts, in order
+        max_score: The maximum score for this question
+        llm: LLM client to use
+
+    Returns:
+        List[Optional[Correction]]: One entry per answer, in order; None where the
+        batch result was missing or invalid and the answer must be graded alone.
+    """
+    answer_ids = [f"A{i + 1}" for i in range(len(answers))]
+    prompt = prepare_batch_prompt(
+        BATCH_TEMPLATE_NAME,
+        QUESTION_TYPE_NAMES.get(internal_type, internal_type),
+        CONTEXTS.get(internal_type, []),
+        stem,
+        correct_answer,
+        rubric,
+        [{"answer_id": answer_id, "text": text} for answer_id, text in zip(answer_ids, answers)]
+    )
+    logger.info("batch_grading_start", q_id=q_id, batch_size=len(answers), prompt_chars=len(prompt))
+
+    from langchain.schema import HumanMessage
+
+    # Only transport errors are retried here; a malformed batch falls back to singletons instead
+    async def _call_llm():
+        try:
+            return await ainvoke_structured(llm, [HumanMessage(content=prompt)], BatchGradingResult, source="batch")
+        except ValueError as e:
+            logger.warning("batch_grading_failed", q_id=q_id, batch_size=len(answers), error=str(e))
+            return None
+
+    try:
+        parsed = await retry_async(_call_llm, description="Batch LLM call")
+    except Exception as e:
+        logger.warning("batch_grading_failed", q_id=q_id, batch_size=len(answers), error=str(e))
+        return [None] * len(answers)
+    if parsed is None:
+        return [None] * len(answers)
+
+    items_by_id: Dict[str, BatchGradingItem] = {}
+    duplicated = set()
+    for item in parsed.results:
+        if item.answer_id in items_by_id:
+            duplicated.add(item.answer_id)
+        items_by_id[item.answer_id] = item
+
+    corrections: List[Optional[Correction]] = []
+    for answer_id in answer_ids:
+        item = items_by_id.get(answer_id)
+        if item is None or answer_id in duplicated:
+            corrections.append(None)
+            continue
+        corrections.append(_item_to_correction(item, q_id, question_type, max_score, internal_type == "concept"))
+
+    logger.info("batch_grading_complete", q_id=q_id, batch_size=len(answers),
+                resolved=sum(1 for c in corrections if c is not None))
+    return corrections
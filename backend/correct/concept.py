@@ -7,11 +7,15 @@ import os
 import json
 import argparse
 from typing import Dict, Any
-from fastapi.concurrency import run_in_threadpool
 
-from backend.models import Correction, StepScore
+from backend.models import Correction, StepScore, GradingResponse
 from backend.correct.prompt_utils import prepare_concept_prompt
 from backend.dependencies import get_llm, OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL
+from backend.llm_invoke import ainvoke_llm
+from backend.llm_json import extract_json, mark_complete, pop_complete
+from backend.llm_failures import record_llm_failure
+from backend.structured_output import ainvoke_structured, structured_output_enabled, record_usage, record_parse_failure
+from backend.retry import retry_async
 
 # Setup logger
 logger = structlog.get_logger()
@@ -21,6 +25,9 @@ logger = structlog.get_logger()
 # Global LLM client for connection pooling
 LLM_CLIENT = None
 
+# Knowledge points for the prompt's {context} until a knowledge base provides real ones
+DEFAULT_CONTEXT = ["No standard knowledge points provided. Please extract knowledge points based on the problem!"]
+
 def get_llm_client():
     """Get or create a shared LLM client for connection pooling."""
     global LLM_CLIENT
@@ -41,33 +48,13 @@ def parse_llm_json_response(response_text: str) -> Dict[str, Any]:
     # Log the raw response for debugging
     logger.info("parsing_llm_response", response_text=response_text[:500] + "..." if len(response_text) > 500 else response_text)
     
-    # Use a more robust approach similar to what's in routers/new.py
-    # First try to find JSON objects in the response
-    import json
-    from pydantic import ValidationError
-    
-    # Match JSON objects or arrays
-    match = re.search(r'\{.*\}', response_text, re.DOTALL)
-    if not match:
-        match = re.search(r'\[.*\]', response_text, re.DOTALL)
-    
-    if match:
-        json_str = match.group(0)
-        try:
-            # Try to parse the JSON directly
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            # If direct parsing fails, try to fix common issues
-            try:
-                # Remove trailing commas before closing braces/brackets
-                json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-                # Remove comments
-                json_str = re.sub(r'//.*?(?=\n|$)', '', json_str)
-                json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
-                # Try parsing again
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
+    # Extract and repair the JSON object in one pass (LaTeX backslashes,
+    # truncated output, trailing commas, comments)
+    try:
+        return mark_complete(extract_json(response_text, container=dict))
+    except ValueError as e:
+        record_llm_failure(response_text, e, "concept")
+        record_parse_failure(GradingResponse, "text")
     
     # If all parsing attempts fail, create a fallback response
     # Extract individual fields with more robust regex patterns
@@ -171,7 +158,7 @@ async def concept_node(answer_unit: Dict[str, Any], rubric: str, max_score: floa
     try:
         template_path = "prompts/concept.txt"
         # context = keywords
-        context = "No standard knowledge points provided. Please extract knowledge points based on the problem!"
+        context = DEFAULT_CONTEXT
         problem = answer_unit.get("stem", "概念题")  # Mock problem statement
         answer = answer_unit.get("text", "")
         
@@ -188,32 +175,19 @@ async def concept_node(answer_unit: Dict[str, Any], rubric: str, max_score: floa
                 llm = get_llm_client()
             from langchain.schema import HumanMessage
             
-            # Add retry logic for LLM calls
-            max_retries = 3
-            retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    # Use ainvoke method for async calls
-                    # response = await llm.ainvoke([HumanMessage(content=prompt)])
-                    response = await run_in_threadpool(llm.invoke, [HumanMessage(content=prompt)])
-                    
-                    # Log the raw response for debugging
-                    logger.info("llm_raw_response", content=response.content[:500] + "..." if len(response.content) > 500 else response.content)
-                    
-                    # Parse the JSON response
-                    llm_response = parse_llm_json_response(response.content)
-                    break  # Success, exit retry loop
-                except Exception as e:
-                    retry_count += 1
-                    logger.warning(f"LLM call attempt {retry_count} failed: {str(e)}")
-                    if retry_count >= max_retries:
-                        raise  # Re-raise the exception if all retries failed
-                    # Wait a bit before retrying
-                    import time
-                    time.sleep(2)  # Increased delay to reduce API load
-            else:
-                # This should not happen, but just in case
-                raise Exception("LLM call failed after all retries")
+            # Retry with exponential backoff and full jitter (non-blocking)
+            async def _call_llm():
+                if structured_output_enabled(llm, GradingResponse):
+                    parsed = await ainvoke_structured(llm, [HumanMessage(content=prompt)], GradingResponse, source="concept")
+                    return mark_complete(parsed.model_dump(exclude_none=True))
+                response = await ainvoke_llm(llm, [HumanMessage(content=prompt)])
+                record_usage(GradingResponse, "text", response)
+                # Log the raw response for debugging
+                logger.info("llm_raw_response", content=response.content[:500] + "..." if len(response.content) > 500 else response.content)
+                return parse_llm_json_response(response.content)
+
+            llm_response = await retry_async(_call_llm, description="LLM call")
+            complete = pop_complete(llm_response)
             
             # Create step scores from LLM response
             step_scores = []
@@ -252,7 +226,8 @@ async def concept_node(answer_unit: Dict[str, Any], rubric: str, max_score: floa
                     confidence=overall_confidence,
                     comment=comment,
                     steps=step_scores,
-                    hits=hits
+                    hits=hits,
+                    complete=complete
                 )
             except Exception as correction_error:
                 logger.error("correction_creation_failed", error=str(correction_error), 
@@ -333,27 +308,14 @@ async def concept_node(answer_unit: Dict[str, Any], rubric: str, max_score: floa
                 llm = get_llm_client()
             from langchain.schema import HumanMessage
             
-            # Add retry logic for LLM calls
-            max_retries = 3
-            retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    # response = await llm.ainvoke([HumanMessage(content=default_prompt)])
-                    response = await run_in_threadpool(llm.invoke, [HumanMessage(content=default_prompt)])
-                    
-                    llm_response = parse_llm_json_response(response.content)
-                    break  # Success, exit retry loop
-                except Exception as e:
-                    retry_count += 1
-                    logger.warning(f"Fallback LLM call attempt {retry_count} failed: {str(e)}")
-                    if retry_count >= max_retries:
-                        raise  # Re-raise the exception if all retries failed
-                    # Wait a bit before retrying
-                    import time
-                    time.sleep(2)  # Increased delay to reduce API load
-            else:
-                # This should not happen, but just in case
-                raise Exception("Fallback LLM call failed after all retries")
+            # Retry with exponential backoff and full jitter (non-blocking)
+            async def _call_llm_fallback():
+                response = await ainvoke_llm(llm, [HumanMessage(content=default_prompt)])
+                record_usage(GradingResponse, "text", response)
+                return parse_llm_json_response(response.content)
+
+            llm_response = await retry_async(_call_llm_fallback, description="Fallback LLM call")
+            complete = pop_complete(llm_response)
             
             # Create step scores from LLM response
             step_scores = []
@@ -391,7 +353,8 @@ async def concept_node(answer_unit: Dict[str, Any], rubric: str, max_score: floa
                 confidence=overall_confidence,
                 comment=comment,
                 steps=step_scores,
-                hits=hits
+                hits=hits,
+                complete=complete
             )
             return correction
         except Exception as fallback_error:
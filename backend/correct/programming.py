@@ -4,23 +4,48 @@ Programming question correction node implementation.
 import structlog
 import re
 import os
+import ast
 import json
 import argparse
-# import subprocess
-# import tempfile
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Set
 from pydantic import BaseModel
-from fastapi.concurrency import run_in_threadpool
 
-from backend.models import Correction, StepScore
+from backend.models import Correction, StepScore, GradingResponse
 from backend.correct.prompt_utils import prepare_programming_prompt
+from backend.correct.sandbox import TestCase, ExecutionResult, run_submission
+from backend.correct.test_suite import TestSuite, get_test_suite, resolve_function, build_harness
 from backend.dependencies import get_llm, OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL
+from backend.llm_invoke import ainvoke_llm
+from backend.llm_json import extract_json, mark_complete, pop_complete
+from backend.llm_failures import record_llm_failure
+from backend.structured_output import ainvoke_structured, structured_output_enabled, record_usage, record_parse_failure
+from backend.retry import retry_async
 
 # Setup logger
 logger = structlog.get_logger()
 
 # Zhipu AI configuration is now imported from dependencies.py
 
+# Modules student code may not import; "pkg.mod" entries also match "from pkg import mod"
+BANNED_IMPORTS = tuple(
+    name.strip() for name in os.getenv(
+        "PROGRAMMING_BANNED_IMPORTS",
+        "subprocess,socket,ssl,ctypes,multiprocessing,pty,urllib.request,http.client,ftplib,smtplib,telnetlib,requests",
+    ).split(",") if name.strip()
+)
+# Modules exposing the os process functions (os re-exports them from posix/nt)
+OS_MODULES = {"os", "posix", "nt"}
+# os functions that start, replace, signal or detach processes. This is a pre-check that rejects
+# obvious misuse before anything runs; the sandbox (see sandbox.py) is the actual security boundary.
+BANNED_OS_CALLS = {
+    "system", "popen", "fork", "forkpty", "kill", "killpg", "setsid", "setpgid", "setpgrp", "startfile",
+    "execl", "execle", "execlp", "execlpe", "execv", "execve", "execvp", "execvpe",
+    "spawnl", "spawnle", "spawnlp", "spawnlpe", "spawnv", "spawnve", "spawnvp", "spawnvpe",
+    "posix_spawn", "posix_spawnp",
+}
+# Calls that may end a `while True` loop from inside its body (input() raises EOFError at end of input)
+_EXIT_CALLS = {"exit", "quit", "_exit", "abort", "input", "readline"}
+
 # Global LLM client for connection pooling
 LLM_CLIENT = None
 
@@ -31,52 +56,40 @@ def get_llm_client():
         LLM_CLIENT = get_llm()
     return LLM_CLIENT
 
-class TestCase(BaseModel):
-    """Model for a test case."""
-    input: str
-    expected_output: str
-    description: str
-
-class ExecutionResult(BaseModel):
-    """Model for code execution result."""
-    passed: bool
-    output: str
-    error: str
-    logs: str
-    pass_rate: float
-    coverage: float
-
 class TestCaseGenerator:
-    """Mock test case generator."""
-    def generate(self) -> List[TestCase]:
-        """Generate mock test cases."""
-        return [
-            TestCase(
-                input="",
-                expected_output="",
-                description="Default test cases"
-            )
-        ]
+    """Per-problem test suites (see test_suite.py), with a single run-only case as fallback."""
+    async def generate(self, q_id: str, problem: Optional[Dict[str, Any]] = None, llm=None) -> TestSuite:
+        """Return the problem's cached or newly generated suite, or the placeholder."""
+        if problem is not None and llm is not None:
+            suite = await get_test_suite(q_id, problem, llm)
+            if suite is not None and suite.test_cases:
+                return suite
+        return TestSuite(
+            fingerprint="",
+            test_cases=[
+                TestCase(
+                    input="",
+                    expected_output="",
+                    description="Default test cases"
+                )
+            ]
+        )
 
 class CodeExecutor:
-    """Simple code executor."""
-    def run(self, code: str, test_cases: List[TestCase]) -> ExecutionResult:
-        """Execute code with test cases."""
-        # In a real implementation, you would run the code in a sandbox
-        # For now, we'll just return a mock result
-        logger.info("executing_code", code_length=len(code), test_cases_count=len(test_cases))
-        
-        # Mock execution result
-        result = ExecutionResult(
-            passed=True,
-            output="Program executed successfully!",
-            error="",
-            logs="Execution log information",
-            pass_rate=1.0,
-            coverage=0.8
-        )
-        
-        return result
+    """Runs student code against test cases in the subprocess sandbox (see sandbox.py)."""
+    async def run(self, code: str, test_cases: List[TestCase], language: str = "python", harness: str = "") -> ExecutionResult:
+        """Execute code with test cases (and an optional test harness appended to it)."""
+        logger.info("executing_code", code_length=len(code), test_cases_count=len(test_cases), language=language)
+        if language.lower() not in ("python", "python3", "py"):
+            return ExecutionResult(
+                passed=False,
+                output="",
+                error=f"Execution of {language} code is not supported",
+                logs="Code was not executed",
+                pass_rate=0.0,
+                coverage=0.0
+            )
+        return await run_submission(code, test_cases, harness=harness)
 
 class AnswerUnit(BaseModel):
     """Model for programming answer unit."""
@@ -86,6 +99,201 @@ class AnswerUnit(BaseModel):
     language: str
     test_cases: List[TestCase]
 
+def extract_code(text: str) -> str:
+    """Return the code in fenced Markdown blocks if the answer has any, otherwise the text itself."""
+    blocks = re.findall(r"```[ \t]*(?:python3?|py)?[ \t]*\n(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return "\n".join(blocks) if blocks else text
+
+class StaticAnalysis(BaseModel):
+    """Result of the static pre-check of a Python submission."""
+    syntax_error: Optional[str] = None
+    banned: List[str] = []
+    infinite_loops: List[int] = []
+    functions: List[str] = []
+
+    @property
+    def rejected(self) -> bool:
+        """True if the submission can be graded without running it (it cannot pass any test)."""
+        return bool(self.syntax_error or self.banned or self.infinite_loops)
+
+    def reason(self) -> str:
+        if self.syntax_error:
+            return f"Syntax error: {self.syntax_error}"
+        if self.banned:
+            return "Forbidden operations: " + "; ".join(self.banned)
+        return "Infinite loop without exit at line " + ", ".join(map(str, self.infinite_loops))
+
+class StaticChecker(ast.NodeVisitor):
+    """
+    Parses the code once and checks it before any execution or LLM call:
+    syntax errors, banned imports/calls, and unconditional infinite loops at module level.
+    Also collects top-level function signatures for test harnessing.
+    """
+    def __init__(self):
+        self.banned: List[str] = []
+        self.infinite_loops: List[int] = []
+        self.functions: List[str] = []
+        self.defined: Set[str] = set()
+        self.os_names: Set[str] = set()
+
+    def check(self, code: str) -> StaticAnalysis:
+        try:
+            tree = ast.parse(code, filename="solution.py")
+            # compile() catches what the parser accepts but the compiler rejects (e.g. `return` outside a function)
+            compile(tree, "solution.py", "exec")
+        except SyntaxError as e:
+            return StaticAnalysis(syntax_error=f"line {e.lineno}: {e.msg}" if e.lineno else e.msg)
+        except ValueError as e:  # null bytes in the source
+            return StaticAnalysis(syntax_error=str(e))
+
+        self.defined = {node.name for node in ast.walk(tree)
+                        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                self.functions.append(f"{node.name}({ast.unparse(node.args)})")
+        self._collect_os_names(tree)
+        self.visit(tree)
+        self._check_loops(tree.body)
+        return StaticAnalysis(banned=self.banned, infinite_loops=self.infinite_loops, functions=self.functions)
+
+    def _ban(self, node: ast.AST, what: str) -> None:
+        self.banned.append(f"line {node.lineno}: {what}")
+
+    @staticmethod
+    def _is_banned(module: str) -> bool:
+        return any(module == name or module.startswith(name + ".") for name in BANNED_IMPORTS)
+
+    @staticmethod
+    def _dynamic_import_name(node: ast.expr) -> Optional[str]:
+        """Module name of `__import__("x")` / `importlib.import_module("x")`, if the name is a literal."""
+        if not isinstance(node, ast.Call) or not node.args:
+            return None
+        func = node.func
+        if not ((isinstance(func, ast.Name) and func.id in ("__import__", "import_module"))
+                or (isinstance(func, ast.Attribute) and func.attr == "import_module")):
+            return None
+        arg = node.args[0]
+        return arg.value if isinstance(arg, ast.Constant) and isinstance(arg.value, str) else None
+
+    def _collect_os_names(self, tree: ast.AST) -> None:
+        """Find every name bound to the os module: `import os as o`, `o = os`, `o = __import__("os")`."""
+        changed = True
+        while changed:
+            changed = False
+            for node in ast.walk(tree):
+                names: List[str] = []
+                if isinstance(node, ast.Import):
+                    for alias in node.names:
+                        if alias.asname is None and alias.name.split(".")[0] in OS_MODULES:
+                            names.append(alias.name.split(".")[0])
+                        elif alias.asname is not None and alias.name in OS_MODULES:
+                            names.append(alias.asname)
+                elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.NamedExpr)) and node.value is not None:
+                    if self._is_os(node.value):
+                        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                        names.extend(t.id for t in targets if isinstance(t, ast.Name))
+                new = set(names) - self.os_names
+                if new:
+                    self.os_names |= new
+                    changed = True
+
+    def _is_os(self, node: ast.expr) -> bool:
+        """Whether an expression evaluates to the os module (by name or dynamic import)."""
+        if isinstance(node, ast.Name):
+            return node.id in self.os_names
+        return self._dynamic_import_name(node) in OS_MODULES
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            if self._is_banned(alias.name):
+                self._ban(node, f"import {alias.name}")
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        module = node.module or ""
+        if self._is_banned(module):
+            self._ban(node, f"from {module} import ...")
+            return
+        for alias in node.names:
+            if module in OS_MODULES and alias.name == "*":
+                self._ban(node, f"from {module} import *")
+            elif self._is_banned(f"{module}.{alias.name}") or (module in OS_MODULES and alias.name in BANNED_OS_CALLS):
+                self._ban(node, f"from {module} import {alias.name}")
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        # Any reference counts, not just calls: `f = os.fork; f()`
+        if (node.attr in BANNED_OS_CALLS or node.attr == "__dict__") and self._is_os(node.value):
+            self._ban(node, f"os.{node.attr}")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == "getattr" and node.args and self._is_os(node.args[0]):
+            self._check_os_getattr(node)
+        elif isinstance(func, ast.Name) and func.id == "vars" and node.args and self._is_os(node.args[0]):
+            self._ban(node, "vars(os)")
+        name = self._dynamic_import_name(node)
+        if name is not None and self._is_banned(name):
+            self._ban(node, f"dynamic import of {name}")
+        self.generic_visit(node)
+
+    def _check_os_getattr(self, node: ast.Call) -> None:
+        """`getattr(os, "fork")`; a computed attribute name on os cannot be checked, so it is rejected too."""
+        attr = node.args[1] if len(node.args) > 1 else None
+        if not (isinstance(attr, ast.Constant) and isinstance(attr.value, str)):
+            self._ban(node, "getattr(os, ...) with a computed name")
+        elif attr.value in BANNED_OS_CALLS:
+            self._ban(node, f"getattr(os, {attr.value!r})")
+
+    def _check_loops(self, body: List[ast.stmt]) -> None:
+        """Flag `while True` loops that always run (module level or the __main__ guard) and cannot exit."""
+        for node in body:
+            if isinstance(node, ast.If) and self._is_main_guard(node.test):
+                self._check_loops(node.body)
+            elif (isinstance(node, ast.While) and isinstance(node.test, ast.Constant)
+                  and node.test.value and not self._can_exit(node.body)):
+                self.infinite_loops.append(node.lineno)
+
+    @staticmethod
+    def _is_main_guard(test: ast.expr) -> bool:
+        return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == "__name__"
+                and len(test.comparators) == 1 and isinstance(test.comparators[0], ast.Constant)
+                and test.comparators[0].value == "__main__")
+
+    def _can_exit(self, nodes: List[ast.AST], nested_loop: bool = False) -> bool:
+        """Whether the loop body contains a break, return, raise or a call that may end the program."""
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if isinstance(node, (ast.Return, ast.Raise, ast.Yield, ast.YieldFrom)):
+                return True
+            # A break inside a nested loop only ends that loop
+            if isinstance(node, ast.Break) and not nested_loop:
+                return True
+            if isinstance(node, ast.Call):
+                func = node.func
+                name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+                # User-defined functions may call sys.exit(); so may anything we cannot name
+                if name is None or name in _EXIT_CALLS or name in self.defined:
+                    return True
+            in_loop = nested_loop or isinstance(node, (ast.While, ast.For, ast.AsyncFor))
+            if self._can_exit(list(ast.iter_child_nodes(node)), in_loop):
+                return True
+        return False
+
+def static_rejection(answer_unit_model: "AnswerUnit", analysis: StaticAnalysis, max_score: float) -> Correction:
+    """Deterministic correction for a submission that fails the static pre-check."""
+    reason = analysis.reason()
+    return Correction(
+        q_id=answer_unit_model.q_id,
+        type="编程题",
+        score=0.0,
+        max_score=max_score,
+        confidence=1.0,
+        comment=f"The code was not executed. {reason}",
+        steps=[StepScore(step_no=1, desc=f"Static check failed: {reason}", is_correct=False, score=0.0)],
+        logs=reason
+    )
+
 def parse_llm_json_response(response_text: str) -> Dict[str, Any]:
     """
     Parse LLM JSON response, handling common formatting issues.
@@ -99,33 +307,13 @@ def parse_llm_json_response(response_text: str) -> Dict[str, Any]:
     # Log the raw response for debugging
     logger.info("parsing_llm_response", response_text=response_text[:500] + "..." if len(response_text) > 500 else response_text)
     
-    # Use a more robust approach similar to what's in routers/new.py
-    # First try to find JSON objects in the response
-    import json
-    from pydantic import ValidationError
-    
-    # Match JSON objects or arrays
-    match = re.search(r'\{.*\}', response_text, re.DOTALL)
-    if not match:
-        match = re.search(r'\[.*\]', response_text, re.DOTALL)
-    
-    if match:
-        json_str = match.group(0)
-        try:
-            # Try to parse the JSON directly
-            return json.loads(json_str)
-        except json.JSONDecodeError as e:
-            # If direct parsing fails, try to fix common issues
-            try:
-                # Remove trailing commas before closing braces/brackets
-                json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-                # Remove comments
-                json_str = re.sub(r'//.*?(?=\n|$)', '', json_str)
-                json_str = re.sub(r'/\*.*?\*/', '', json_str, flags=re.DOTALL)
-                # Try parsing again
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
+    # Extract and repair the JSON object in one pass (LaTeX backslashes,
+    # truncated output, trailing commas, comments)
+    try:
+        return mark_complete(extract_json(response_text, container=dict))
+    except ValueError as e:
+        record_llm_failure(response_text, e, "programming")
+        record_parse_failure(GradingResponse, "text")
     
     # If all parsing attempts fail, create a fallback response
     # Extract individual fields with more robust regex patterns
@@ -196,7 +384,8 @@ def parse_llm_json_response(response_text: str) -> Dict[str, Any]:
                 response_keys=list(llm_response.keys()) if isinstance(llm_response, dict) else "Not a dict")
     return llm_response
 
-async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score: float = 10.0, llm=None) -> Correction:
+async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score: float = 10.0, llm=None,
+                           problem: Optional[Dict[str, Any]] = None) -> Correction:
     """
     Programming question correction node.
     
@@ -205,6 +394,8 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
         rubric: The grading rubric
         max_score: The maximum score for this question
         llm: Optional LLM client to use for processing (if None, uses shared client)
+        problem: The problem's entry in the problem store; when the answer unit has no test
+            cases, the problem's test suite is generated once and cached on it
         
     Returns:
         Correction: The correction result
@@ -224,24 +415,40 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
     
     answer_unit_model = AnswerUnit(**answer_unit)
     
-    # Step 1: Generate test cases if none provided
+    # Step 1: Static pre-check; code that cannot pass any test never reaches the executor or the LLM
+    source = extract_code(answer_unit_model.code)
+    analysis = StaticAnalysis()
+    if answer_unit_model.language.lower() in ("python", "python3", "py"):
+        analysis = StaticChecker().check(source)
+        logger.info("static_analysis_complete", q_id=answer_unit_model.q_id, rejected=analysis.rejected,
+                    functions=analysis.functions)
+        if analysis.rejected:
+            logger.info("programming_node_static_rejection", q_id=answer_unit_model.q_id, reason=analysis.reason())
+            return static_rejection(answer_unit_model, analysis, max_score)
+
+    # Step 2: Use the provided test cases, or the problem's shared test suite
     test_cases = answer_unit_model.test_cases
+    harness = ""
     if not test_cases:
-        generator = TestCaseGenerator()
-        test_cases = generator.generate()
-        logger.info("test_cases_generated", count=len(test_cases))
+        if llm is None and problem is not None:
+            llm = get_llm_client()
+        suite = await TestCaseGenerator().generate(answer_unit_model.q_id, problem, llm)
+        test_cases = suite.test_cases
+        if suite.mode == "function" and suite.function_name:
+            harness = build_harness(resolve_function(suite.function_name, analysis.functions))
+        logger.info("test_cases_generated", count=len(test_cases), mode=suite.mode, validated=suite.validated)
     
-    # Step 2: Execute code with test cases
+    # Step 3: Execute code with test cases
     executor = CodeExecutor()
-    result = executor.run(answer_unit_model.code, test_cases)
+    result = await executor.run(source, test_cases, answer_unit_model.language, harness)
     
-    # Step 3: Calculate score based on pass rate
+    # Step 4: Calculate score based on pass rate
     score = max_score * result.pass_rate
     
-    # Step 4: Calculate confidence based on pass rate and coverage
+    # Step 5: Calculate confidence based on pass rate and coverage
     confidence = 0.7 * result.pass_rate + 0.3 * result.coverage
     
-    # Step 5: Create step score
+    # Step 6: Create step score
     steps = [
         StepScore(
             step_no=1,
@@ -251,34 +458,40 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
         )
     ]
     
-    # Step 6: Prepare prompt using the new prompt_utils module
+    # Step 7: Prepare prompt using the new prompt_utils module
     try:
         template_path = "prompts/programming.txt"
         problem = answer_unit.get("stem", "Programming problem")
         code = answer_unit.get("code", "")
         execution_result = result.model_dump()
-        prompt = prepare_programming_prompt(template_path, problem, code, execution_result, rubric)
+        execution_result["functions"] = analysis.functions
+        prompt = prepare_programming_prompt(template_path, problem, code, [tc.model_dump() for tc in test_cases],
+                                            execution_result, rubric)
         
         # In a real implementation, you would call an LLM with this prompt
         # For now, we'll just log that we would use it
         logger.info("programming_prompt_prepared", prompt=prompt[:100] + "..." if len(prompt) > 100 else prompt)
         
-        # Step 7: Call LLM with the prepared prompt using connection pooling
+        # Step 8: Call LLM with the prepared prompt using connection pooling
         try:
             # Use provided LLM client or get shared LLM client for connection pooling
             if llm is None:
                 llm = get_llm_client()
             from langchain.schema import HumanMessage
             
-            # Use ainvoke method for async calls
-            # response = await llm.ainvoke([HumanMessage(content=prompt)])
-            response = await run_in_threadpool(llm.invoke, [HumanMessage(content=prompt)])
-            
-            # Log the raw response for debugging
-            logger.info("llm_raw_response", content=response.content[:500] + "..." if len(response.content) > 500 else response.content)
-            
-            # Parse the JSON response
-            llm_response = parse_llm_json_response(response.content)
+            # Retry with exponential backoff and full jitter (non-blocking)
+            async def _call_llm():
+                if structured_output_enabled(llm, GradingResponse):
+                    parsed = await ainvoke_structured(llm, [HumanMessage(content=prompt)], GradingResponse, source="programming")
+                    return mark_complete(parsed.model_dump(exclude_none=True))
+                response = await ainvoke_llm(llm, [HumanMessage(content=prompt)])
+                record_usage(GradingResponse, "text", response)
+                # Log the raw response for debugging
+                logger.info("llm_raw_response", content=response.content[:500] + "..." if len(response.content) > 500 else response.content)
+                return parse_llm_json_response(response.content)
+
+            llm_response = await retry_async(_call_llm, description="LLM call")
+            complete = pop_complete(llm_response)
             
             # Create step scores from LLM response
             step_scores = []
@@ -317,7 +530,8 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
                     confidence=overall_confidence,
                     comment=comment,
                     steps=step_scores,
-                    logs=logs
+                    logs=logs,
+                    complete=complete
                 )
             except Exception as correction_error:
                 logger.error("correction_creation_failed", error=str(correction_error), 
@@ -394,10 +608,14 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
                 llm = get_llm_client()
             from langchain.schema import HumanMessage
             
-            # response = await llm.ainvoke([HumanMessage(content=default_prompt)])
-            response = await run_in_threadpool(llm.invoke, [HumanMessage(content=default_prompt)])
+            # Retry with exponential backoff and full jitter (non-blocking)
+            async def _call_llm_fallback():
+                response = await ainvoke_llm(llm, [HumanMessage(content=default_prompt)])
+                record_usage(GradingResponse, "text", response)
+                return parse_llm_json_response(response.content)
 
-            llm_response = parse_llm_json_response(response.content)
+            llm_response = await retry_async(_call_llm_fallback, description="Fallback LLM call")
+            complete = pop_complete(llm_response)
             
             # Create step scores from LLM response
             step_scores = []
@@ -435,7 +653,8 @@ async def programming_node(answer_unit: Dict[str, Any], rubric: str, max_score:
                 confidence=overall_confidence,
                 comment=comment,
                 steps=step_scores,
-                logs=logs
+                logs=logs,
+                complete=complete
             )
             return correction
         except Exception as fallback_error:
@@ -1,19 +1,164 @@
 """
 Utility functions for preparing prompts for AI grading.
+
+Templates are served from an in-memory registry: every file in backend/prompts is loaded
+once (at startup, or on first use), relative template paths resolve against the backend
+package rather than the working directory, and each template carries a content hash that
+result caches use as its version.
+
+Every prepare_*_prompt helper renders through PromptTemplate.render: the template is
+compiled once into a str.format pattern, so a render is a single pass that builds one
+output string, and a placeholder left without a value raises MissingPlaceholderError
+instead of reaching the LLM as literal "{name}" text.
 """
-# import os
+import os
+import re
+import hashlib
+import threading
 import structlog
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 logger = structlog.get_logger()
 
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPTS_DIR = os.path.join(BACKEND_DIR, "prompts")
+# {name} placeholders; JSON braces in the templates never match because they are not identifiers
+_PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+class MissingPlaceholderError(ValueError):
+    """A prompt was rendered without a value for one of its template's placeholders."""
+
+
+class PromptTemplate:
+    """A prompt template loaded once and compiled for single-pass rendering."""
+
+    def __init__(self, name: str, path: str, text: str):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        parts = _PLACEHOLDER_RE.split(text)
+        # Alternating literal / placeholder-name segments: literals at even, names at odd indexes
+        literals, fields = parts[0::2], parts[1::2]
+        self.placeholders = frozenset(fields)
+        # Compiled to a str.format pattern: literal braces (the JSON examples) are doubled so that
+        # only the placeholders are fields
+        pieces = []
+        for index, literal in enumerate(literals):
+            pieces.append(literal.replace("{", "{{").replace("}", "}}"))
+            if index < len(fields):
+                pieces.append("{" + fields[index] + "}")
+        self._pattern = "".join(pieces)
+
+    def render(self, **values: Any) -> str:
+        """
+        Substitute all placeholders in one pass into a single output string. Substituted
+        text is never scanned again, so braces inside values (student answers, code) are
+        left alone.
+
+        Raises:
+            MissingPlaceholderError: If a placeholder of the template has no value
+        """
+        try:
+            return self._pattern.format_map(values)
+        except KeyError:
+            missing = sorted(self.placeholders.difference(values))
+            raise MissingPlaceholderError(
+                f"Prompt template {self.name!r} has no value for: {', '.join(missing)}"
+            ) from None
+
+
+class PromptRegistry:
+    """Loads prompt templates once and serves them from memory."""
+
+    def __init__(self, prompts_dir: str = PROMPTS_DIR):
+        self.prompts_dir = prompts_dir
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, name_or_path: str) -> str:
+        """
+        Absolute path of a template: a bare name ("calc") or file name ("calc.txt") is looked
+        up in the prompts directory, a relative path ("prompts/calc.txt") is relative to the
+        backend package, and an absolute path is used as is.
+        """
+        if os.path.isabs(name_or_path):
+            return os.path.normpath(name_or_path)
+        if os.sep not in name_or_path and "/" not in name_or_path:
+            file_name = name_or_path if name_or_path.endswith(".txt") else f"{name_or_path}.txt"
+            return os.path.join(self.prompts_dir, file_name)
+        return os.path.normpath(os.path.join(BACKEND_DIR, name_or_path))
+
+    def _load(self, path: str) -> PromptTemplate:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        return PromptTemplate(name, path, text)
+
+    def load_all(self) -> int:
+        """(Re)load every template in the prompts directory; returns the number loaded."""
+        loaded = {}
+        for file_name in sorted(os.listdir(self.prompts_dir)):
+            if file_name.endswith(".txt"):
+                path = os.path.join(self.prompts_dir, file_name)
+                loaded[path] = self._load(path)
+        with self._lock:
+            self._templates.update(loaded)
+        logger.info("prompt_templates_loaded", count=len(loaded),
+                    versions={template.name: template.version for template in loaded.values()})
+        return len(loaded)
+
+    def get(self, name_or_path: str) -> PromptTemplate:
+        """
+        Return a template, loading it on first use.
+
+        Raises:
+            FileNotFoundError: If the template file does not exist
+        """
+        path = self.resolve(name_or_path)
+        template = self._templates.get(path)
+        if template is None:
+            try:
+                template = self._load(path)
+            except FileNotFoundError:
+                logger.error("prompt_template_not_found", template_path=name_or_path, resolved_path=path)
+                raise
+            with self._lock:
+                template = self._templates.setdefault(path, template)
+        return template
+
+    def versions(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            templates = list(self._templates.values())
+        return {
+            template.name: {"version": template.version, "placeholders": sorted(template.placeholders), "path": template.path}
+            for template in templates
+        }
+
+
+prompt_registry = PromptRegistry()
+
+
+def get_prompt_template(name_or_path: str) -> PromptTemplate:
+    """Template from the shared registry (see PromptRegistry.resolve for how names are looked up)."""
+    return prompt_registry.get(name_or_path)
+
+
+def get_template_version(name_or_path: str) -> Optional[str]:
+    """Content hash of a template, or None if it does not exist."""
+    try:
+        return prompt_registry.get(name_or_path).version
+    except FileNotFoundError:
+        return None
+
 
 def load_prompt_template(template_path: str) -> str:
     """
-    Load a prompt template from a file.
+    Load a prompt template (from the in-memory registry).
     
     Args:
-        template_path: Path to the prompt template file
+        template_path: Template name or path (relative paths are relative to the backend package)
         
     Returns:
         str: The prompt template content
@@ -21,12 +166,7 @@ def load_prompt_template(template_path: str) -> str:
     Raises:
         FileNotFoundError: If the template file is not found
     """
-    try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        logger.error("prompt_template_not_found", template_path=template_path)
-        raise
+    return prompt_registry.get(template_path).text
 
 
 def prepare_concept_prompt(template_path: str, context: List[str], problem: str, answer: str, rubric: str) -> str:
@@ -34,7 +174,7 @@ def prepare_concept_prompt(template_path: str, context: List[str], problem: str,
     Prepare a prompt for concept question grading.
     
     Args:
-        template_path: Path to the prompt template file
+        template_path: Template name or path (see PromptRegistry.resolve)
         context: List of relevant knowledge points
         problem: The problem statement
         answer: The student's answer
@@ -43,16 +183,8 @@ def prepare_concept_prompt(template_path: str, context: List[str], problem: str,
     Returns:
         str: The prepared prompt
     """
-    template = load_prompt_template(template_path)
-    context_str = "\n".join(context)
-    
-    # Replace the placeholders carefully to avoid JSON format issues
-    prompt = template.replace("{context}", context_str)
-    prompt = prompt.replace("{problem}", problem)
-    prompt = prompt.replace("{answer}", answer)
-    prompt = prompt.replace("{rubric}", rubric)
-    
-    return prompt
+    template = get_prompt_template(template_path)
+    return template.render(context="\n".join(context), problem=problem, answer=answer, rubric=rubric)
 
 
 def prepare_calc_prompt(template_path: str, problem: str, student_answer: str, correct_answer: str, rubric: str) -> str:
@@ -60,7 +192,7 @@ def prepare_calc_prompt(template_path: str, problem: str, student_answer: str, c
     Prepare a prompt for calculation question grading.
     
     Args:
-        template_path: Path to the prompt template file
+        template_path: Template name or path (see PromptRegistry.resolve)
         problem: The problem statement
         student_answer: The student's numerical answer
         correct_answer: The correct numerical answer
@@ -69,15 +201,8 @@ def prepare_calc_prompt(template_path: str, problem: str, student_answer: str, c
     Returns:
         str: The prepared prompt
     """
-    template = load_prompt_template(template_path)
-    
-    # Format prompt
-    prompt = template.replace("{problem}", problem)
-    prompt = prompt.replace("{answer}", student_answer)
-    prompt = prompt.replace("{correct_answer}", str(correct_answer))
-    prompt = prompt.replace("{rubric}", rubric)
-    
-    return prompt
+    template = get_prompt_template(template_path)
+    return template.render(problem=problem, answer=student_answer, correct_answer=correct_answer, rubric=rubric)
 
 
 def prepare_proof_prompt(template_path: str, problem: str, steps: List[Dict[str, Any]], rubric: str) -> str:
@@ -85,7 +210,7 @@ def prepare_proof_prompt(template_path: str, problem: str, steps: List[Dict[str,
     Prepare a prompt for proof question grading.
     
     Args:
-        template_path: Path to the prompt template file
+        template_path: Template name or path (see PromptRegistry.resolve)
         problem: The problem statement
         steps: List of proof steps
         rubric: The grading rubric
@@ -93,38 +218,84 @@ def prepare_proof_prompt(template_path: str, problem: str, steps: List[Dict[str,
     Returns:
         str: The prepared prompt
     """
-    template = load_prompt_template(template_path)
-    
-    # Format prompt
+    template = get_prompt_template(template_path)
     steps_str = "\n".join([f"Step{i+1}: {step['content']}" for i, step in enumerate(steps)])
-    prompt = template.replace("{steps}", steps_str)
-    prompt = prompt.replace("{rubric}", rubric)
-    prompt = prompt.replace("{problem}", problem)
-    
-    return prompt
+    return template.render(steps=steps_str, rubric=rubric, problem=problem)
 
 
-def prepare_programming_prompt(template_path: str, problem: str, code: str, test_cases: List[Dict[str, str]], rubric: str) -> str:
+def prepare_programming_prompt(template_path: str, problem: str, code: str, test_cases: List[Dict[str, str]],
+                               execution_result: Dict[str, Any], rubric: str) -> str:
     """
     Prepare a prompt for programming question grading.
     
     Args:
-        template_path: Path to the prompt template file
+        template_path: Template name or path (see PromptRegistry.resolve)
         problem: The problem statement
         code: The student's code
-        test_cases: List of test cases
+        test_cases: Test cases the code was run against ({"input", "expected_output", ...})
+        execution_result: Sandbox result (ExecutionResult.model_dump()), plus "functions": the
+            answer's top-level function signatures from the static check
         rubric: The grading rubric
         
     Returns:
         str: The prepared prompt
     """
-    template = load_prompt_template(template_path)
+    template = get_prompt_template(template_path)
+    test_cases_str = "\n".join(
+        f"Input: {tc['input']!r}, Expected Output: {tc['expected_output']!r}" for tc in test_cases
+    )
+    return template.render(
+        problem=problem if problem else "Problem description missing.",
+        code=code,
+        functions="\n".join(execution_result.get("functions", [])) or "None.",
+        test_cases=test_cases_str or "None.",
+        pass_rate=f"{execution_result.get('pass_rate', 0.0):.2%}",
+        coverage=f"{execution_result.get('coverage', 0.0):.2%}",
+        output=execution_result.get("output", ""),
+        errors=execution_result.get("error", ""),
+        logs=execution_result.get("logs", ""),
+        rubric=rubric,
+    )
+
+def prepare_batch_prompt(template_path: str, question_type: str, context: List[str], problem: str,
+                         correct_answer: str, rubric: str, answers: List[Dict[str, str]]) -> str:
+    """
+    Prepare a prompt that grades several students' answers to one question in a single call.
     
-    # Format prompt
-    test_cases_str = "\n".join([f"Input: {tc['input']}, Expected Output: {tc['output']}" for tc in test_cases])
-    prompt = template.replace("{problem}", problem if problem else "Problem description missing.")
-    prompt = template.replace("{code}", code)
-    prompt = template.replace("{test_cases}", test_cases_str)
-    prompt = template.replace("{rubric}", rubric)
+    Args:
+        template_path: Template name or path (see PromptRegistry.resolve)
+        question_type: Human readable question type (e.g. "concept")
+        context: List of relevant knowledge points (empty for types whose prompt has none)
+        problem: The problem statement
+        correct_answer: The reference answer, if any
+        rubric: The grading rubric
+        answers: List of {"answer_id": ..., "text": ...} dicts
+        
+    Returns:
+        str: The prepared prompt
+    """
+    template = get_prompt_template(template_path)
+    answers_str = "\n\n".join(
+        f"=== Answer {ans['answer_id']} ===\n{ans['text']}\n=== End of {ans['answer_id']} ===" for ans in answers
+    )
+    return template.render(count=len(answers), question_type=question_type,
+                           context="\n".join(context) or "None provided.", problem=problem,
+                           correct_answer=correct_answer, rubric=rubric, answers=answers_str)
+
+def prepare_test_suite_prompt(template_path: str, problem: str, rubric: str, reference: str, count: int) -> str:
+    """
+    Prepare a prompt that generates the test suite for a programming problem.
     
-    return prompt
\ No newline at end of file
+    Args:
+        template_path: Template name or path (see PromptRegistry.resolve)
+        problem: The problem statement
+        rubric: The grading rubric
+        reference: The reference solution, if any
+        count: Number of test cases to ask for
+        
+    Returns:
+        str: The prepared prompt
+    """
+    template = get_prompt_template(template_path)
+    return template.render(count=count, rubric=rubric, reference=reference or "None provided.", problem=problem)
+
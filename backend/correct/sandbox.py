@@ -0,0 +1,641 @@
+"""
+Sandboxed execution of student Python code for programming questions.
+
+Every test case runs in its own process (see sandbox_worker.py for the code that runs
+inside the sandbox):
+
+- the sandbox runs in new network, PID and mount namespaces, with an empty
+  network, a read-only filesystem on which the project, home and temp directories are
+  hidden, and only its own working directory writable;
+- each case process is PID 1 of its own PID namespace, so everything it forks (including
+  processes that leave its process group with setsid) is killed when it exits or times out;
+- student code runs unprivileged: as SANDBOX_UID when the server runs as root, otherwise
+  as the server's uid inside a user namespace with every capability dropped;
+- CPU time, address space, file size, core dumps and the number of processes
+  (SANDBOX_MAX_PROCESSES) are capped with rlimits, which are set before any student code
+  runs;
+- wall-clock time is capped from the outside;
+- stdout/stderr are captured to files capped by RLIMIT_FSIZE, so a print loop cannot fill
+  memory or disk;
+- the socket modules are also made unimportable as a second line of defence;
+- each case gets a fresh temporary working directory and a minimal environment.
+
+Host requirement: Linux with unprivileged user namespaces (or a root server process) and
+util-linux ``unshare``. The isolation is checked once at start-up; without it student code
+is not executed at all (fail closed) and programming answers are graded as "not executed".
+SANDBOX_ISOLATION=none turns the check off and runs code with rlimits only; only use it on
+a development machine with trusted input.
+
+Test cases are stdin/stdout based: the case input is fed to stdin and stdout is compared
+with the expected output, ignoring trailing whitespace. A case with an empty expected
+output is a run-only check that passes when the program exits cleanly. Function-style
+problems append a harness to the code that reads the arguments from stdin and prints the
+return value after OUTPUT_MARKER; only the output after the marker is compared. With a
+harness the file runs as module HARNESS_RUN_NAME rather than __main__, so the answer's own
+``if __name__ == "__main__":`` block (which typically reads input) does not run and cannot
+consume the harness's arguments.
+
+Two execution modes (SANDBOX_MODE):
+
+- "warm" (default where fork is available): a pool of SANDBOX_POOL_SIZE pre-started worker
+  interpreters per event loop. A submission and all its test cases go to one worker in a
+  single round-trip; the worker forks a fresh child per case from its clean, already-
+  initialised interpreter, so interpreter start-up is paid once per worker rather than once
+  per case, and no state carries over between cases or students. Students are spread
+  across the workers, i.e. across cores.
+- "cold": a new ``python -I`` process per test case, at most SANDBOX_MAX_PROCS at a time.
+  Used as the fallback when a warm worker fails.
+
+Line coverage of the student file is traced inside the sandbox and merged across cases.
+
+Benchmark (cold vs warm): ``python -m backend.correct.sandbox --submissions 50 --cases 5``.
+"""
+import os
+import json
+import sys
+import ast
+import dis
+import time
+import types
+import signal
+import shutil
+import asyncio
+import argparse
+import tempfile
+import sysconfig
+import subprocess
+import weakref
+import structlog
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+# Setup logger
+logger = structlog.get_logger()
+
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "2"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_WALL_SECONDS = float(os.getenv("SANDBOX_WALL_SECONDS", "5"))
+SANDBOX_MAX_OUTPUT_BYTES = int(os.getenv("SANDBOX_MAX_OUTPUT_BYTES", str(64 * 1024)))
+SANDBOX_MAX_PROCS = int(os.getenv("SANDBOX_MAX_PROCS", str(os.cpu_count() or 2)))
+SANDBOX_MODE = os.getenv("SANDBOX_MODE", "warm" if hasattr(os, "fork") else "cold").lower()
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", str(SANDBOX_MAX_PROCS)))
+# "required" refuses to run code without namespace isolation, "none" runs it with rlimits only
+SANDBOX_ISOLATION = os.getenv("SANDBOX_ISOLATION", "required").lower()
+# Processes the sandbox user may have at once (RLIMIT_NPROC, counted per uid)
+SANDBOX_MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", "64"))
+# Unprivileged uid/gid student code runs as when the server itself runs as root (nobody)
+SANDBOX_UID = int(os.getenv("SANDBOX_UID", "65534"))
+# Extra directories to hide from student code, separated by os.pathsep
+SANDBOX_HIDDEN_PATHS = [path for path in os.getenv("SANDBOX_HIDDEN_PATHS", "").split(os.pathsep) if path]
+# Largest file the sandbox may write, including captured stdout/stderr
+SANDBOX_MAX_FILE_BYTES = 1024 * 1024
+
+SOLUTION_FILENAME = "solution.py"
+# A test harness prints this line right before the value under test (see run_cases)
+OUTPUT_MARKER = "#--smartai-harness-output--#"
+# Module name the code runs under when a harness drives it, so its __main__ block is skipped
+HARNESS_RUN_NAME = "solution"
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Must match sandbox_worker.SETUP_FAILED_EXIT / SETUP_FAILED_MARKER
+SETUP_FAILED_EXIT = 121
+SETUP_FAILED_MARKER = "smartai-sandbox-setup-failed:"
+# Upper bound for one worker response line (all cases' captured output)
+_WORKER_READ_LIMIT = 64 * 1024 * 1024
+
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SandboxPool]" = weakref.WeakKeyDictionary()
+
+
+class SandboxUnavailableError(Exception):
+    """Student code cannot be run with the required isolation on this host."""
+
+
+class TestCase(BaseModel):
+    """Model for a test case."""
+    input: str
+    expected_output: str
+    description: str
+
+
+class ExecutionResult(BaseModel):
+    """Model for code execution result."""
+    passed: bool
+    output: str
+    error: str
+    logs: str
+    pass_rate: float
+    coverage: float
+
+
+class CaseResult(BaseModel):
+    """Outcome of one test case."""
+    index: int
+    description: str = ""
+    status: str  # passed / wrong_answer / runtime_error / timeout / memory_error / output_limit
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+
+    @property
+    def passed(self) -> bool:
+        return self.status == "passed"
+
+
+def _isolated() -> bool:
+    return SANDBOX_ISOLATION != "none"
+
+
+def _sandbox_uid() -> Optional[int]:
+    """Uid to drop to inside the sandbox; None when a user namespace is used instead."""
+    return SANDBOX_UID if hasattr(os, "geteuid") and os.geteuid() == 0 else None
+
+
+def _hidden_paths() -> List[str]:
+    return [PROJECT_ROOT, os.path.expanduser("~"), "/root", "/home", tempfile.gettempdir()] + SANDBOX_HIDDEN_PATHS
+
+
+def _kept_paths() -> List[str]:
+    """The Python installation stays visible (read-only) even inside a hidden directory."""
+    paths = {sys.prefix, sys.base_prefix, os.path.dirname(os.path.realpath(sys.executable))}
+    paths.update(sysconfig.get_paths().values())
+    return sorted(paths)
+
+
+def sandbox_config(workdir: str) -> Dict:
+    """Isolation settings and limits passed to sandbox_worker.enter_sandbox."""
+    return {
+        "workdir": workdir,
+        "isolate": _isolated(),
+        "uid": _sandbox_uid() if _isolated() else None,
+        "hidden": _hidden_paths(),
+        "keep": _kept_paths(),
+        "cpu_seconds": SANDBOX_CPU_SECONDS,
+        "memory_bytes": SANDBOX_MEMORY_MB * 1024 * 1024,
+        "file_bytes": SANDBOX_MAX_FILE_BYTES,
+        "max_processes": SANDBOX_MAX_PROCESSES,
+    }
+
+
+def _sandbox_prefix() -> Tuple[str, ...]:
+    """
+    Command prefix that starts the sandbox in new network and mount namespaces.
+
+    Raises SandboxUnavailableError when the start-up check failed, so no code runs unisolated.
+    """
+    prefix, error = _probe_sandbox()
+    if error:
+        raise SandboxUnavailableError(error)
+    return prefix
+
+
+@lru_cache(maxsize=1)
+def _probe_sandbox() -> Tuple[Tuple[str, ...], Optional[str]]:
+    """Set up a full sandbox around an empty directory once; returns (prefix, error)."""
+    if not _isolated():
+        logger.warning("sandbox_isolation_disabled", detail="SANDBOX_ISOLATION=none: student code runs with rlimits only")
+        return (), None
+    if not shutil.which("unshare"):
+        return (), "util-linux unshare is not installed"
+    # The PID namespace is created per case by sandbox_worker itself
+    prefix = ("unshare", "-nm" if _sandbox_uid() is not None else "-rnm")
+    probe_dir = tempfile.mkdtemp(prefix="smartai-sandbox-probe-")
+    try:
+        command = list(prefix) + [sys.executable, "-I", "-B", WORKER_SCRIPT, "--probe",
+                                  json.dumps(sandbox_config(probe_dir))]
+        completed = subprocess.run(command, timeout=30, env=_sandbox_env(), cwd=probe_dir,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except (OSError, subprocess.SubprocessError) as e:
+        return (), f"sandbox probe failed: {e}"
+    finally:
+        shutil.rmtree(probe_dir, ignore_errors=True)
+    if completed.returncode != 0:
+        detail = completed.stderr.decode("utf-8", errors="replace").strip()[-500:]
+        logger.error("sandbox_isolation_unavailable", prefix=" ".join(prefix), detail=detail)
+        return (), f"sandbox isolation is not available on this host: {detail}"
+    logger.info("sandbox_isolation_ready", prefix=" ".join(prefix), uid=_sandbox_uid())
+    return prefix, None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, SANDBOX_MAX_PROCS))
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def _sandbox_env() -> Dict[str, str]:
+    return {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "LANG": "C.UTF-8",
+        "PYTHONIOENCODING": "utf-8",
+        "PYTHONHASHSEED": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+
+
+def executable_lines(code: str) -> Set[int]:
+    """Line numbers that carry bytecode, i.e. the denominator for line coverage."""
+    try:
+        compiled = compile(code, SOLUTION_FILENAME, "exec")
+    except (SyntaxError, ValueError):
+        return set()
+    lines: Set[int] = set()
+    stack = [compiled]
+    while stack:
+        code_object = stack.pop()
+        lines.update(line for _, line in dis.findlinestarts(code_object) if line)
+        stack.extend(const for const in code_object.co_consts if isinstance(const, types.CodeType))
+    return lines
+
+
+def main_block_lines(code: str) -> Set[int]:
+    """Lines inside top-level ``if __name__ == "__main__":`` blocks, which do not run under a harness."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return set()
+    lines: Set[int] = set()
+    for node in tree.body:
+        if (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+                and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__"
+                and len(node.test.comparators) == 1 and isinstance(node.test.comparators[0], ast.Constant)
+                and node.test.comparators[0].value == "__main__"):
+            for child in node.body:
+                lines.update(range(child.lineno, child.end_lineno + 1))
+    return lines
+
+
+def outputs_match(actual: str, expected: str) -> bool:
+    """Compare program output with the expected output, ignoring trailing whitespace."""
+    def normalize(text: str) -> List[str]:
+        return [line.rstrip() for line in text.replace("\r\n", "\n").rstrip().split("\n")]
+    return normalize(actual) == normalize(expected)
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    """Kill the sandbox and anything it forked (also after the main process has exited)."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+
+
+def _classify(returncode: Optional[int], timed_out: bool, truncated: bool, stderr: str) -> Optional[str]:
+    """Status for an abnormal run, or None if the program exited cleanly."""
+    if timed_out:
+        return "timeout"
+    if truncated:
+        return "output_limit"
+    if returncode == 0:
+        return None
+    if returncode is not None and returncode < 0 and -returncode in (signal.SIGKILL, getattr(signal, "SIGXCPU", -1)):
+        return "timeout"
+    if "MemoryError" in stderr:
+        return "memory_error"
+    return "runtime_error"
+
+
+def _read_capped(path: str) -> Tuple[str, bool]:
+    """Read at most SANDBOX_MAX_OUTPUT_BYTES of a captured stream; returns (text, truncated)."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(SANDBOX_MAX_OUTPUT_BYTES + 1)
+    except OSError:
+        return "", False
+    truncated = len(data) > SANDBOX_MAX_OUTPUT_BYTES
+    return data[:SANDBOX_MAX_OUTPUT_BYTES].decode("utf-8", errors="replace"), truncated
+
+
+def _case_result(test_case: TestCase, index: int, returncode: Optional[int], timed_out: bool, truncated: bool,
+                 stdout: str, stderr: str, duration: float) -> CaseResult:
+    if returncode == SETUP_FAILED_EXIT and stderr.startswith(SETUP_FAILED_MARKER):
+        # The sandbox could not be set up and no student code ran: never report it as the student's failure
+        raise SandboxUnavailableError(stderr[len(SETUP_FAILED_MARKER):].strip())
+    if "File too large" in stderr:
+        truncated = True
+    status = _classify(returncode, timed_out, truncated, stderr)
+    if status is None:
+        expected = test_case.expected_output
+        # With a harness, anything the code printed before the marker is not part of the answer
+        actual = stdout.rsplit(OUTPUT_MARKER, 1)[-1].lstrip("\n") if OUTPUT_MARKER in stdout else stdout
+        status = "passed" if not expected.strip() or outputs_match(actual, expected) else "wrong_answer"
+    return CaseResult(index=index, description=test_case.description, status=status,
+                      stdout=stdout, stderr=stderr, duration=round(duration, 4))
+
+
+async def run_case(solution_path: str, test_case: TestCase, index: int, workdir: str,
+                   run_name: str = "__main__") -> Tuple[CaseResult, Set[int]]:
+    """Run one test case in a fresh (cold) sandbox process; returns the result and the covered lines."""
+    case_dir = os.path.join(workdir, f"case{index}")
+    os.makedirs(case_dir, exist_ok=True)
+    coverage_path = os.path.join(case_dir, ".coverage")
+    stdin_path = os.path.join(case_dir, ".stdin")
+    stdout_path = os.path.join(case_dir, ".stdout")
+    stderr_path = os.path.join(case_dir, ".stderr")
+    with open(stdin_path, "w", encoding="utf-8") as f:
+        f.write(test_case.input)
+    request = dict(sandbox_config(workdir), solution=solution_path, coverage=coverage_path, run_name=run_name)
+    command = list(_sandbox_prefix()) + [
+        sys.executable, "-I", "-B", WORKER_SCRIPT, "--once", json.dumps(request),
+    ]
+
+    # Streams go to files rather than pipes: RLIMIT_FSIZE caps their size in the kernel, and
+    # waiting for the process never depends on draining pipes that a runaway child holds open
+    async with _get_semaphore():
+        started = time.monotonic()
+        with open(stdin_path, "rb") as stdin, open(stdout_path, "wb") as stdout, open(stderr_path, "wb") as stderr:
+            proc = await asyncio.create_subprocess_exec(
+                *command, stdin=stdin, stdout=stdout, stderr=stderr,
+                cwd=case_dir, env=_sandbox_env(), start_new_session=True,
+            )
+        timed_out = False
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=SANDBOX_WALL_SECONDS)
+        except asyncio.TimeoutError:
+            timed_out = True
+        finally:
+            _kill_group(proc)
+            await proc.wait()
+        duration = time.monotonic() - started
+
+    stdout_text, truncated = _read_capped(stdout_path)
+    stderr_text, _ = _read_capped(stderr_path)
+    covered: Set[int] = set()
+    try:
+        with open(coverage_path, "r") as f:
+            covered = {int(line) for line in f.read().split()}
+    except (OSError, ValueError):
+        pass
+    return _case_result(test_case, index, proc.returncode, timed_out, truncated,
+                        stdout_text, stderr_text, duration), covered
+
+
+class WarmWorker:
+    """A pre-started sandbox interpreter serving whole submissions over a JSON-lines pipe."""
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+
+    @classmethod
+    async def start(cls) -> "WarmWorker":
+        command = list(_sandbox_prefix()) + [sys.executable, "-I", "-B", WORKER_SCRIPT, "--serve"]
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=_sandbox_env(),
+            start_new_session=True,
+            limit=_WORKER_READ_LIMIT,
+        )
+        return cls(proc)
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    async def request(self, payload: Dict, timeout: float) -> Dict:
+        self.proc.stdin.write(json.dumps(payload).encode("utf-8") + b"\n")
+        await self.proc.stdin.drain()
+        line = await asyncio.wait_for(self.proc.stdout.readline(), timeout=timeout)
+        if not line:
+            raise RuntimeError("sandbox worker exited")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"sandbox worker error: {response['error']}")
+        return response
+
+    def close(self) -> None:
+        _kill_group(self.proc)
+
+
+class SandboxPool:
+    """Fixed-size pool of warm workers; each submission holds one worker for one round-trip."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._idle: "asyncio.Queue[Optional[WarmWorker]]" = asyncio.Queue()
+        for _ in range(self.size):
+            # None = not started yet (or discarded); started on first use
+            self._idle.put_nowait(None)
+
+    async def start(self) -> None:
+        """Pre-start all workers so the first submissions do not pay interpreter start-up."""
+        workers = [await self._idle.get() for _ in range(self.size)]
+        try:
+            for index, worker in enumerate(workers):
+                if worker is None or not worker.alive:
+                    workers[index] = None
+                    workers[index] = await WarmWorker.start()
+        finally:
+            for worker in workers:
+                self._idle.put_nowait(worker)
+
+    async def run(self, payload: Dict, timeout: float) -> Dict:
+        worker = await self._idle.get()
+        try:
+            if worker is None or not worker.alive:
+                worker = await WarmWorker.start()
+            return await worker.request(payload, timeout)
+        except BaseException:
+            # Timed out, crashed or cancelled mid-request: the worker's state is unknown
+            if worker is not None:
+                worker.close()
+            worker = None
+            raise
+        finally:
+            self._idle.put_nowait(worker)
+
+
+def get_sandbox_pool() -> SandboxPool:
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = SandboxPool(SANDBOX_POOL_SIZE)
+        _pools[loop] = pool
+    return pool
+
+
+async def _run_cases_warm(solution_path: str, test_cases: List[TestCase], workdir: str,
+                          run_name: str) -> List[Tuple[CaseResult, Set[int]]]:
+    payload = dict(
+        sandbox_config(workdir),
+        solution=solution_path,
+        run_name=run_name,
+        cases=[{"input": test_case.input} for test_case in test_cases],
+        wall_seconds=SANDBOX_WALL_SECONDS,
+        max_output_bytes=SANDBOX_MAX_OUTPUT_BYTES,
+    )
+    # Cases run one after another inside the worker
+    timeout = len(test_cases) * (SANDBOX_WALL_SECONDS + 1) + 5
+    response = await get_sandbox_pool().run(payload, timeout)
+    return [
+        (_case_result(test_case, index, raw["returncode"], raw["timed_out"], raw["truncated"],
+                      raw["stdout"], raw["stderr"], raw["duration"]), set(raw["covered"]))
+        for index, (test_case, raw) in enumerate(zip(test_cases, response["results"]))
+    ]
+
+
+async def _run_cases_cold(solution_path: str, test_cases: List[TestCase], workdir: str,
+                          run_name: str) -> List[Tuple[CaseResult, Set[int]]]:
+    return list(await asyncio.gather(*(
+        run_case(solution_path, test_case, index, workdir, run_name) for index, test_case in enumerate(test_cases)
+    )))
+
+
+def summarize_cases(results: List[CaseResult], covered: Set[int], executable: Set[int]) -> ExecutionResult:
+    """Fold per-case results into the ExecutionResult consumed by programming_node."""
+    passed_count = sum(1 for result in results if result.passed)
+    failed = [result for result in results if not result.passed]
+    log_lines = []
+    for result in results:
+        line = f"Case {result.index + 1}"
+        if result.description:
+            line += f" ({result.description})"
+        log_lines.append(f"{line}: {result.status} in {result.duration:.3f}s")
+    shown = failed[0] if failed else (results[-1] if results else None)
+    return ExecutionResult(
+        passed=bool(results) and not failed,
+        output=shown.stdout[:2000] if shown else "",
+        error=shown.stderr[-2000:] if shown and failed else "",
+        logs="\n".join(log_lines),
+        pass_rate=passed_count / len(results) if results else 0.0,
+        coverage=len(covered & executable) / len(executable) if executable else 0.0,
+    )
+
+
+async def _in_workdir(runner, source: str, test_cases: List[TestCase],
+                      run_name: str) -> List[Tuple[CaseResult, Set[int]]]:
+    workdir = await asyncio.to_thread(tempfile.mkdtemp, prefix="smartai-sandbox-")
+    try:
+        solution_path = os.path.join(workdir, SOLUTION_FILENAME)
+        with open(solution_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        return await runner(solution_path, test_cases, workdir, run_name)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, workdir, True)
+
+
+async def run_cases(code: str, test_cases: List[TestCase], mode: Optional[str] = None,
+                    harness: str = "") -> Tuple[List[CaseResult], Set[int]]:
+    """
+    Run code against each test case in the sandbox.
+
+    Args:
+        code: Python source
+        test_cases: Stdin/stdout test cases
+        mode: "warm" or "cold"; defaults to SANDBOX_MODE
+        harness: Source appended after the code, e.g. to call a function and print its result
+            after OUTPUT_MARKER; the code then runs as HARNESS_RUN_NAME instead of __main__
+
+    Returns:
+        The per-case results, in order, and the lines executed in any case
+    """
+    mode = (mode or SANDBOX_MODE) if hasattr(os, "fork") else "cold"
+    source = code + harness
+    run_name = HARNESS_RUN_NAME if harness else "__main__"
+    outcomes = None
+    if mode == "warm":
+        try:
+            outcomes = await _in_workdir(_run_cases_warm, source, test_cases, run_name)
+        except (RuntimeError, OSError, ValueError, asyncio.TimeoutError) as e:
+            logger.warning("sandbox_warm_worker_failed", error=str(e))
+    if outcomes is None:
+        outcomes = await _in_workdir(_run_cases_cold, source, test_cases, run_name)
+
+    covered: Set[int] = set()
+    for _, lines in outcomes:
+        covered |= lines
+    return [case for case, _ in outcomes], covered
+
+
+async def run_submission(code: str, test_cases: List[TestCase], mode: Optional[str] = None,
+                         harness: str = "") -> ExecutionResult:
+    """
+    Run one student's code against all test cases in the sandbox.
+
+    Args:
+        code: The student's Python source
+        test_cases: Stdin/stdout test cases
+        mode: "warm" or "cold"; defaults to SANDBOX_MODE
+        harness: Test harness appended after the code (not counted in coverage)
+
+    Returns:
+        ExecutionResult: Real pass rate, line coverage, first failure's output and error;
+            "not executed" when the host cannot isolate student code
+    """
+    try:
+        results, covered = await run_cases(code, test_cases, mode, harness)
+    except SandboxUnavailableError as e:
+        logger.error("sandbox_unavailable", error=str(e))
+        return ExecutionResult(
+            passed=False,
+            output="",
+            error=f"Code was not executed: sandbox isolation is unavailable ({e})",
+            logs="Code was not executed",
+            pass_rate=0.0,
+            coverage=0.0
+        )
+    # The harness comes after the student's code, so restricting to the student's lines excludes it;
+    # the __main__ block is skipped under a harness and is not held against the answer either
+    executable = executable_lines(code)
+    if harness:
+        executable -= main_block_lines(code)
+    result = summarize_cases(results, covered, executable)
+    logger.info("sandbox_submission_complete", cases=len(test_cases),
+                pass_rate=result.pass_rate, coverage=result.coverage)
+    return result
+
+
+_BENCHMARK_SOLUTION = """
+import sys
+numbers = [int(token) for token in sys.stdin.read().split()]
+def quick_sort(items):
+    if len(items) <= 1:
+        return items
+    pivot, rest = items[0], items[1:]
+    return quick_sort([x for x in rest if x < pivot]) + [pivot] + quick_sort([x for x in rest if x >= pivot])
+print(" ".join(map(str, quick_sort(numbers))))
+"""
+
+
+async def _benchmark(submissions: int, cases: int, modes: List[str], seed: int) -> None:
+    import random
+    rng = random.Random(seed)
+    test_cases = []
+    for index in range(cases):
+        numbers = [rng.randint(-1000, 1000) for _ in range(200)]
+        test_cases.append(TestCase(input=" ".join(map(str, numbers)),
+                                   expected_output=" ".join(map(str, sorted(numbers))),
+                                   description=f"random {index + 1}"))
+    print(f"max procs {SANDBOX_MAX_PROCS}, pool size {SANDBOX_POOL_SIZE}, "
+          f"isolation {' '.join(_sandbox_prefix()) or 'off'}")
+    for mode in modes:
+        if mode == "warm":
+            await get_sandbox_pool().start()
+        started = time.monotonic()
+        results = await asyncio.gather(*(run_submission(_BENCHMARK_SOLUTION, test_cases, mode) for _ in range(submissions)))
+        elapsed = time.monotonic() - started
+        print(f"{mode}: {submissions} submissions x {cases} cases in {elapsed:.2f}s "
+              f"({submissions / elapsed:.1f} submissions/s, {submissions * cases / elapsed:.1f} cases/s, "
+              f"pass rate {sum(r.pass_rate for r in results) / len(results):.2%}, "
+              f"coverage {sum(r.coverage for r in results) / len(results):.2%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sandbox throughput benchmark (cold vs warm execution)")
+    parser.add_argument("--submissions", type=int, default=50, help="Number of submissions to run")
+    parser.add_argument("--cases", type=int, default=5, help="Test cases per submission")
+    parser.add_argument("--mode", choices=["cold", "warm", "both"], default="both", help="Execution mode to measure")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated test inputs")
+    args = parser.parse_args()
+    asyncio.run(_benchmark(args.submissions, args.cases, ["cold", "warm"] if args.mode == "both" else [args.mode],
+                           args.seed))
@@ -0,0 +1,470 @@
+"""
+Sandbox process for student code. Standard library only: it runs as a script under
+``python -I`` and never imports the backend package.
+
+The caller starts this script inside fresh network and mount namespaces (``unshare``; with
+``-r`` as well when the server is not root). Before any student code runs, each case
+process (see enter_sandbox):
+
+- gets a private mount namespace in which every mount is read-only, the directories in
+  ``hidden`` (project, home and temp directories) are covered with empty tmpfs mounts, and
+  only the Python installation and the submission's working directory are mounted back;
+  the working directory is the only writable place;
+- gets rlimits for CPU, address space, file size, core dumps and number of processes;
+- loses all privileges: as root it switches to the unprivileged ``uid``; inside a user
+  namespace it drops every capability and locks the securebits so they cannot come back;
+- runs as PID 1 of its own PID namespace, so when it exits the kernel kills everything it
+  forked, including processes that called setsid() to leave its process group; this is set
+  up first, so the rest of the isolation applies to that PID 1.
+
+Modes:
+
+``sandbox_worker.py --once REQUEST_JSON``
+    Run one test case in this process. The caller has already redirected stdin/stdout/
+    stderr and placed the process in its own session (cold execution, one process per case).
+
+``sandbox_worker.py --serve``
+    Warm worker. Reads one JSON request per line on stdin and writes one JSON response per
+    line on stdout. A request is a whole submission: the solution path, a working directory
+    and all its test cases. The worker never runs student code itself; it forks a fresh
+    child per test case, so each case starts from the same clean, already-initialised
+    interpreter and no state survives between cases or submissions.
+
+``sandbox_worker.py --probe REQUEST_JSON``
+    Set up the sandbox around an empty directory and exit 0 on success; used by the server
+    to check at start-up that the host supports the isolation.
+"""
+import io
+import os
+import sys
+import json
+import time
+import runpy
+import ctypes
+import select
+import signal
+import traceback
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Student code cannot import these (the process also runs in an empty network namespace)
+BLOCKED_MODULES = ("socket", "_socket", "ssl", "_ssl")
+# Poll interval when pidfd_open is unavailable
+_POLL_INTERVAL = 0.002
+# Exit status of a case process whose sandbox could not be set up (no student code ran)
+SETUP_FAILED_EXIT = 121
+SETUP_FAILED_MARKER = "smartai-sandbox-setup-failed:"
+
+# Linux constants (sched.h, sys/mount.h, linux/prctl.h, linux/securebits.h)
+CLONE_NEWNS = 0x00020000
+CLONE_NEWPID = 0x20000000
+MS_RDONLY = 1
+MS_NOSUID = 2
+MS_NODEV = 4
+MS_NOEXEC = 8
+MS_REMOUNT = 32
+MS_NOATIME = 1024
+MS_NODIRATIME = 2048
+MS_BIND = 4096
+MS_REC = 16384
+MS_PRIVATE = 1 << 18
+MS_RELATIME = 1 << 21
+MS_STRICTATIME = 1 << 24
+PR_CAPBSET_DROP = 24
+PR_SET_SECUREBITS = 28
+PR_SET_NO_NEW_PRIVS = 38
+# NOROOT, NO_SETUID_FIXUP, KEEP_CAPS and NO_CAP_AMBIENT_RAISE, each set and locked
+SECUREBITS_LOCKED = 0b11101111
+_LINUX_CAPABILITY_VERSION_3 = 0x20080522
+# Mount options that are locked inside a user namespace and must be kept on remount
+_MOUNT_OPTION_FLAGS = {
+    "nosuid": MS_NOSUID, "nodev": MS_NODEV, "noexec": MS_NOEXEC, "noatime": MS_NOATIME,
+    "nodiratime": MS_NODIRATIME, "relatime": MS_RELATIME, "strictatime": MS_STRICTATIME,
+}
+# Kernel pseudo filesystems; failing to make these read-only does not expose any files
+_PSEUDO_FILESYSTEMS = {
+    "proc", "sysfs", "cgroup", "cgroup2", "devpts", "mqueue", "securityfs", "debugfs", "tracefs",
+    "bpf", "fusectl", "configfs", "pstore", "binfmt_misc", "hugetlbfs", "autofs", "efivarfs", "nsfs",
+}
+
+_libc = None
+
+
+class SandboxSetupError(Exception):
+    """The sandbox could not be set up; student code must not run."""
+
+
+class _CapHeader(ctypes.Structure):
+    _fields_ = [("version", ctypes.c_uint32), ("pid", ctypes.c_int)]
+
+
+class _CapData(ctypes.Structure):
+    _fields_ = [("effective", ctypes.c_uint32), ("permitted", ctypes.c_uint32), ("inheritable", ctypes.c_uint32)]
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_void_p]
+        _libc.prctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong]
+    return _libc
+
+
+def _check(result, what):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise SandboxSetupError(f"{what}: {os.strerror(errno)}")
+
+
+def unshare(flags):
+    _check(_get_libc().unshare(flags), "unshare")
+
+
+def _mount(source, target, fstype, flags, data=None):
+    encode = lambda value: value.encode() if value is not None else None
+    _check(_get_libc().mount(encode(source), encode(target), encode(fstype), flags, encode(data)),
+           f"mount {target}")
+
+
+def _prctl(option, arg):
+    _check(_get_libc().prctl(option, arg, 0, 0, 0), f"prctl {option}")
+
+
+def _mounts():
+    """(mount point, per-mount options, filesystem type) for every mount, in mount order."""
+    mounts = []
+    with open("/proc/self/mountinfo") as f:
+        for line in f:
+            fields = line.split()
+            separator = fields.index("-")
+            mount_point = fields[4].encode().decode("unicode_escape")
+            mounts.append((mount_point, fields[5].split(","), fields[separator + 1]))
+    return mounts
+
+
+def _within(path, parent):
+    return path == parent or path.startswith(parent.rstrip("/") + "/")
+
+
+def _outermost(paths):
+    """Existing directories among paths, dropping those inside another one."""
+    real = sorted({os.path.realpath(path) for path in paths if path and os.path.isdir(path)})
+    return [path for path in real if not any(other != path and _within(path, other) for other in real)]
+
+
+def isolate_filesystem(workdir, hidden, keep):
+    """
+    Give this process a private, read-only view of the filesystem.
+
+    The hidden directories are covered with empty tmpfs mounts; keep (plus workdir) is
+    mounted back on top where it falls inside one of them. Everything is then remounted
+    read-only, except workdir.
+    """
+    unshare(CLONE_NEWNS)
+    _mount(None, "/", None, MS_REC | MS_PRIVATE)
+    workdir = os.path.realpath(workdir)
+    # Make the working directory its own mount so it can stay writable
+    _mount(workdir, workdir, None, MS_BIND | MS_REC)
+    handles = [(path, os.open(path, os.O_PATH)) for path in _outermost(list(keep) + [workdir])]
+    try:
+        hidden = _outermost(hidden)
+        for path in hidden:
+            _mount("tmpfs", path, "tmpfs", MS_NOSUID | MS_NODEV, "size=64k,mode=755")
+        for path, fd in handles:
+            if any(_within(path, parent) for parent in hidden):
+                os.makedirs(path, exist_ok=True)
+                _mount(f"/proc/self/fd/{fd}", path, None, MS_BIND | MS_REC)
+    finally:
+        for _, fd in handles:
+            os.close(fd)
+    for mount_point, options, fstype in reversed(_mounts()):
+        if _within(mount_point, workdir):
+            continue
+        flags = MS_REMOUNT | MS_BIND | MS_RDONLY
+        for option in options:
+            flags |= _MOUNT_OPTION_FLAGS.get(option, 0)
+        try:
+            _mount(None, mount_point, None, flags)
+        except SandboxSetupError:
+            if fstype not in _PSEUDO_FILESYSTEMS:
+                raise
+
+
+def drop_privileges(uid):
+    """
+    Switch to uid when running as real root; inside a user namespace (uid is None) drop every
+    capability and lock the securebits so that exec as uid 0 cannot regain them.
+    """
+    _prctl(PR_SET_NO_NEW_PRIVS, 1)
+    if uid is not None:
+        os.setgroups([])
+        os.setresgid(uid, uid, uid)
+        os.setresuid(uid, uid, uid)
+        return
+    _prctl(PR_SET_SECUREBITS, SECUREBITS_LOCKED)
+    cap = 0
+    while _get_libc().prctl(PR_CAPBSET_DROP, cap, 0, 0, 0) == 0:
+        cap += 1
+    header = _CapHeader(_LINUX_CAPABILITY_VERSION_3, 0)
+    data = (_CapData * 2)()
+    _check(_get_libc().capset(ctypes.byref(header), ctypes.byref(data)), "capset")
+
+
+def apply_limits(cpu_seconds, memory_bytes, file_bytes, max_processes):
+    if resource is None:
+        return
+    for limit, soft, hard in ((resource.RLIMIT_CPU, cpu_seconds, cpu_seconds + 1),
+                              (resource.RLIMIT_AS, memory_bytes, memory_bytes),
+                              (resource.RLIMIT_FSIZE, file_bytes, file_bytes),
+                              (resource.RLIMIT_CORE, 0, 0),
+                              (resource.RLIMIT_NPROC, max_processes, max_processes)):
+        resource.setrlimit(limit, (soft, hard))
+
+
+def enter_sandbox(request, case_dir):
+    """Isolate, limit and de-privilege this process before student code runs."""
+    uid = request.get("uid")
+    if request["isolate"]:
+        _become_pid_namespace_init()
+        isolate_filesystem(request["workdir"], request["hidden"], request["keep"])
+        if uid is not None:
+            # mkdtemp directories are private to the server's uid
+            for path in (request["workdir"], case_dir):
+                os.chown(path, uid, uid)
+    apply_limits(request["cpu_seconds"], request["memory_bytes"], request["file_bytes"], request["max_processes"])
+    if request["isolate"]:
+        drop_privileges(uid)
+
+
+def _setup_failed(error):
+    """Report a sandbox set-up failure on stderr and exit without running student code."""
+    try:
+        os.write(2, f"{SETUP_FAILED_MARKER} {type(error).__name__}: {error}\n".encode("utf-8", "replace"))
+    finally:
+        os._exit(SETUP_FAILED_EXIT)
+
+
+def run_solution(path, coverage_path, run_name="__main__"):
+    """Run the student file as run_name (__main__ unless a test harness drives it), recording the lines it executes."""
+    for name in BLOCKED_MODULES:
+        sys.modules[name] = None
+    lines = set()
+
+    def trace_lines(frame, event, arg):
+        if event == "line":
+            lines.add(frame.f_lineno)
+        return trace_lines
+
+    def trace_calls(frame, event, arg):
+        return trace_lines if frame.f_code.co_filename == path else None
+
+    sys.argv = [path]
+    sys.settrace(trace_calls)
+    try:
+        runpy.run_path(path, run_name=run_name)
+    finally:
+        sys.settrace(None)
+        with open(coverage_path, "w") as f:
+            f.write(" ".join(map(str, sorted(lines))))
+
+
+def _once(request):
+    case_dir = os.getcwd()
+    try:
+        enter_sandbox(request, case_dir)
+    except Exception as e:
+        _setup_failed(e)
+    os.chdir(case_dir)
+    run_solution(request["solution"], request["coverage"], request["run_name"])
+
+
+def _probe(request):
+    try:
+        os.makedirs(request["workdir"], exist_ok=True)
+        enter_sandbox(request, request["workdir"])
+    except Exception as e:
+        _setup_failed(e)
+
+
+def _exit_code(exc):
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _become_pid_namespace_init():
+    """
+    Continue as PID 1 of a new PID namespace: when it exits, the kernel kills everything it
+    forked. A process enters a new PID namespace only through fork (and the warm worker can
+    unshare its own only once), so this process stays behind to pass on the exit status.
+    """
+    unshare(CLONE_NEWPID)
+    pid = os.fork()
+    if pid == 0:
+        return
+    try:
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            # Die from the same signal so the caller sees the same wait status
+            signum = os.WTERMSIG(status)
+            if signum not in (signal.SIGKILL, signal.SIGSTOP):
+                signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+        os._exit(os.waitstatus_to_exitcode(status))
+    finally:
+        os._exit(1)
+
+
+def _child(request, case_dir):
+    """Body of the forked per-case process; never returns."""
+    code = 1
+    try:
+        os.setsid()
+        for fd, name, flags in ((0, ".stdin", os.O_RDONLY),
+                                (1, ".stdout", os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+                                (2, ".stderr", os.O_WRONLY | os.O_CREAT | os.O_TRUNC)):
+            opened = os.open(os.path.join(case_dir, name), flags, 0o600)
+            os.dup2(opened, fd)
+            os.close(opened)
+        try:
+            enter_sandbox(request, case_dir)
+        except Exception as e:
+            _setup_failed(e)
+        # Resolve the working directory again inside the new mount namespace
+        os.chdir(case_dir)
+        # Fresh text streams on the redirected descriptors (the worker's own are the protocol pipe)
+        sys.stdin = io.TextIOWrapper(io.FileIO(0, "r", closefd=False), encoding="utf-8")
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding="utf-8")
+        sys.stderr = io.TextIOWrapper(io.FileIO(2, "w", closefd=False), encoding="utf-8", line_buffering=True)
+        try:
+            run_solution(request["solution"], os.path.join(case_dir, ".coverage"), request["run_name"])
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+    finally:
+        os._exit(code)
+
+
+def _wait(pid, timeout):
+    """Wait for a child with a wall-clock limit; returns (wait status, timed_out)."""
+    deadline = time.monotonic() + timeout
+    pidfd = None
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+    timed_out = False
+    if pidfd is not None:
+        try:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            timed_out = not poller.poll(timeout * 1000)
+        finally:
+            os.close(pidfd)
+    else:
+        while True:
+            reaped, status = os.waitpid(pid, os.WNOHANG)
+            if reaped:
+                _kill_group(pid)
+                return status, False
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            time.sleep(_POLL_INTERVAL)
+    if timed_out:
+        _kill_group(pid)
+    _, status = os.waitpid(pid, 0)
+    # Kill anything the case forked before exiting
+    _kill_group(pid)
+    return status, timed_out
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _read_capped(path, limit):
+    try:
+        with open(path, "rb") as f:
+            data = f.read(limit + 1)
+    except OSError:
+        return "", False
+    return data[:limit].decode("utf-8", errors="replace"), len(data) > limit
+
+
+def _run_case(request, index, case):
+    case_dir = os.path.join(request["workdir"], f"case{index}")
+    os.makedirs(case_dir, exist_ok=True)
+    with open(os.path.join(case_dir, ".stdin"), "w", encoding="utf-8") as f:
+        f.write(case["input"])
+
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        _child(request, case_dir)
+    status, timed_out = _wait(pid, request["wall_seconds"])
+    duration = time.monotonic() - started
+
+    stdout, truncated = _read_capped(os.path.join(case_dir, ".stdout"), request["max_output_bytes"])
+    stderr, _ = _read_capped(os.path.join(case_dir, ".stderr"), request["max_output_bytes"])
+    try:
+        with open(os.path.join(case_dir, ".coverage")) as f:
+            covered = [int(line) for line in f.read().split()]
+    except (OSError, ValueError):
+        covered = []
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "stdout": stdout,
+        "stderr": stderr,
+        "duration": duration,
+        "covered": covered,
+    }
+
+
+def _serve():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    while True:
+        line = stdin.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            response = {"results": [_run_case(request, index, case) for index, case in enumerate(request["cases"])]}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(response).encode("utf-8") + b"\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        _serve()
+    elif sys.argv[1:2] == ["--once"] and len(sys.argv) == 3:
+        _once(json.loads(sys.argv[2]))
+    elif sys.argv[1:2] == ["--probe"] and len(sys.argv) == 3:
+        _probe(json.loads(sys.argv[2]))
+    else:
+        sys.exit("usage: sandbox_worker.py --serve | --once REQUEST_JSON | --probe REQUEST_JSON")
@@ -0,0 +1,264 @@
+"""
+Per-problem test suites for programming questions.
+
+Generating test cases per student would multiply LLM calls, so each problem gets one suite:
+generated once per q_id from the stem and rubric, validated against the problem's reference
+solution when there is one (``problem["reference_solution"]``), and cached on the problem
+in the problem store (``problem["test_suite"]``). Every student's answer to the problem
+then runs against the same suite, so execution-based grading costs one extra LLM call per
+problem however large the class is.
+
+The cached suite carries a fingerprint of the stem, rubric and reference solution, so
+editing the problem regenerates it. Concurrent graders of the same problem share a single
+in-flight generation, and a failed generation is remembered for TEST_SUITE_RETRY_AFTER
+seconds so that a class graded while the LLM is failing does not retry it per student.
+The reference solution comes from the problem upload (ProblemInfo.reference_solution) or
+the teacher's edit of the problem.
+
+Two kinds of suites:
+
+- "stdin": the answer is a complete program; inputs go to stdin and stdout is compared.
+- "function": the answer defines a function; a harness appended to the code reads the
+  arguments (a Python list literal) from stdin, calls the function and prints ``repr`` of
+  the result after sandbox.OUTPUT_MARKER. The answer runs as a module named
+  sandbox.HARNESS_RUN_NAME rather than __main__, so a ``__main__`` block that reads input
+  does not run and cannot swallow the arguments. The function is looked up by name in the
+  answer's top-level signatures, tolerating a different spelling when the answer defines
+  a single function.
+"""
+import os
+import ast
+import time
+import asyncio
+import hashlib
+import weakref
+import structlog
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+
+from backend.correct.prompt_utils import prepare_test_suite_prompt
+from backend.correct.sandbox import TestCase, OUTPUT_MARKER, run_cases
+from backend.structured_output import ainvoke_structured
+from backend.retry import retry_async
+
+# Setup logger
+logger = structlog.get_logger()
+
+TEST_SUITE_TEMPLATE_NAME = "test_suite"
+TEST_SUITE_ENABLED = os.getenv("PROGRAMMING_TEST_SUITE_ENABLED", "true").lower() in ("1", "true", "yes")
+TEST_SUITE_SIZE = int(os.getenv("PROGRAMMING_TEST_SUITE_SIZE", "6"))
+# Seconds a failed generation is cached before the next grader tries again
+TEST_SUITE_RETRY_AFTER = float(os.getenv("PROGRAMMING_TEST_SUITE_RETRY_AFTER", "60"))
+
+# Problem store keys
+SUITE_KEY = "test_suite"
+REFERENCE_KEY = "reference_solution"
+
+HARNESS_TEMPLATE = """
+
+# --- test harness ---
+import ast as _harness_ast
+import sys as _harness_sys
+_harness_args = _harness_ast.literal_eval(_harness_sys.stdin.read())
+_harness_result = {function_name}(*_harness_args)
+print()
+print({marker!r})
+print(repr(_harness_result))
+"""
+
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], asyncio.Future]]" = weakref.WeakKeyDictionary()
+# (q_id, fingerprint) -> time.monotonic() of the last failed generation
+_failures: Dict[Tuple[str, str], float] = {}
+
+
+class GeneratedTestCase(BaseModel):
+    input: str = Field(description="Stdin text, or in function mode a Python list literal of the arguments")
+    expected_output: str = Field(description="Expected stdout, or in function mode the Python literal of the return value")
+    description: str = Field("", description="What the case checks")
+
+
+class GeneratedTestSuite(BaseModel):
+    """LLM output for one problem's test suite."""
+    mode: str = Field("stdin", description='"stdin" for complete programs, "function" when the problem asks for a function')
+    function_name: Optional[str] = Field(None, description="Name of the function under test in function mode")
+    test_cases: List[GeneratedTestCase]
+
+
+class TestSuite(BaseModel):
+    """A problem's cached test suite."""
+    fingerprint: str
+    mode: str = "stdin"
+    function_name: Optional[str] = None
+    test_cases: List[TestCase] = []
+    validated: bool = False
+
+
+def suite_fingerprint(problem: Dict[str, Any]) -> str:
+    """Hash of everything the suite is generated from."""
+    parts = [problem.get("stem", ""), problem.get("criterion", ""), problem.get(REFERENCE_KEY) or ""]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def cached_suite(problem: Dict[str, Any]) -> Optional[TestSuite]:
+    """The suite cached on the problem, if it is still up to date."""
+    stored = problem.get(SUITE_KEY)
+    if not isinstance(stored, dict) or stored.get("fingerprint") != suite_fingerprint(problem):
+        return None
+    try:
+        return TestSuite.model_validate(stored)
+    except ValidationError:
+        return None
+
+
+def resolve_function(function_name: str, functions: List[str]) -> str:
+    """Name to call: the requested function, a differently spelled match, or the only function defined."""
+    names = [signature.split("(", 1)[0] for signature in functions]
+    if function_name in names:
+        return function_name
+
+    def squash(name: str) -> str:
+        return name.replace("_", "").lower()
+    matches = [name for name in names if squash(name) == squash(function_name)]
+    if len(matches) == 1:
+        return matches[0]
+    return names[0] if len(names) == 1 else function_name
+
+
+def build_harness(function_name: str) -> str:
+    return HARNESS_TEMPLATE.format(function_name=function_name, marker=OUTPUT_MARKER)
+
+
+def _normalize_cases(generated: GeneratedTestSuite) -> List[TestCase]:
+    """Drop duplicate and (in function mode) unparseable cases, and canonicalize literal outputs."""
+    cases: List[TestCase] = []
+    seen = set()
+    for case in generated.test_cases:
+        if case.input in seen:
+            continue
+        expected = case.expected_output
+        if generated.mode == "function":
+            try:
+                if not isinstance(ast.literal_eval(case.input), (list, tuple)):
+                    continue
+                # The harness prints repr(), so compare against the canonical repr of the literal
+                expected = repr(ast.literal_eval(expected))
+            except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                continue
+        seen.add(case.input)
+        cases.append(TestCase(input=case.input, expected_output=expected, description=case.description))
+    return cases[:TEST_SUITE_SIZE]
+
+
+async def validate_against_reference(suite: TestSuite, reference: str) -> TestSuite:
+    """
+    Run the reference solution on every case: its output becomes the expected output, and
+    cases it cannot run cleanly (errors, timeouts) are dropped.
+    """
+    from backend.correct.programming import StaticChecker, extract_code
+
+    code = extract_code(reference)
+    harness = ""
+    if suite.mode == "function" and suite.function_name:
+        functions = StaticChecker().check(code).functions
+        harness = build_harness(resolve_function(suite.function_name, functions))
+    # Run-only copies: the reference's own output is what we want, whatever the LLM expected
+    probes = [case.model_copy(update={"expected_output": ""}) for case in suite.test_cases]
+    results, _ = await run_cases(code, probes, harness=harness)
+
+    validated: List[TestCase] = []
+    corrected = 0
+    for case, result in zip(suite.test_cases, results):
+        if not result.passed:
+            continue
+        stdout = result.stdout
+        actual = stdout.rsplit(OUTPUT_MARKER, 1)[-1].lstrip("\n") if harness and OUTPUT_MARKER in stdout else stdout
+        actual = actual.rstrip()
+        if actual != case.expected_output.rstrip():
+            corrected += 1
+        validated.append(case.model_copy(update={"expected_output": actual}))
+    logger.info("test_suite_validated", cases=len(suite.test_cases), kept=len(validated),
+                corrected=corrected, dropped=len(suite.test_cases) - len(validated))
+    return suite.model_copy(update={"test_cases": validated, "validated": True})
+
+
+async def generate_test_suite(problem: Dict[str, Any], llm) -> TestSuite:
+    """Generate (and validate, if there is a reference solution) a problem's test suite with one LLM call."""
+    reference = problem.get(REFERENCE_KEY) or ""
+    prompt = prepare_test_suite_prompt(
+        TEST_SUITE_TEMPLATE_NAME, problem.get("stem", ""), problem.get("criterion", ""), reference, TEST_SUITE_SIZE
+    )
+
+    from langchain.schema import HumanMessage
+
+    async def _call_llm():
+        return await ainvoke_structured(llm, [HumanMessage(content=prompt)], GeneratedTestSuite, source="test_suite")
+
+    generated = await retry_async(_call_llm, description="Test suite LLM call")
+    mode = "function" if generated.mode == "function" and generated.function_name else "stdin"
+    generated = generated.model_copy(update={"mode": mode})
+    suite = TestSuite(
+        fingerprint=suite_fingerprint(problem),
+        mode=mode,
+        function_name=generated.function_name if mode == "function" else None,
+        test_cases=_normalize_cases(generated),
+    )
+    if reference.strip() and suite.test_cases:
+        suite = await validate_against_reference(suite, reference)
+    return suite
+
+
+def _recently_failed(key: Tuple[str, str]) -> bool:
+    failed_at = _failures.get(key)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at < TEST_SUITE_RETRY_AFTER:
+        return True
+    _failures.pop(key, None)
+    return False
+
+
+async def _build_and_store(q_id: str, problem: Dict[str, Any], llm) -> Optional[TestSuite]:
+    key = (q_id, suite_fingerprint(problem))
+    try:
+        suite = await generate_test_suite(problem, llm)
+    except Exception as e:
+        # Cached briefly: graders of this problem use the fallback until TEST_SUITE_RETRY_AFTER passes
+        _failures[key] = time.monotonic()
+        logger.warning("test_suite_generation_failed", q_id=q_id, error=str(e), retry_after=TEST_SUITE_RETRY_AFTER)
+        return None
+    _failures.pop(key, None)
+    problem[SUITE_KEY] = suite.model_dump()
+    logger.info("test_suite_generated", q_id=q_id, mode=suite.mode, cases=len(suite.test_cases),
+                validated=suite.validated)
+    return suite
+
+
+async def get_test_suite(q_id: str, problem: Dict[str, Any], llm) -> Optional[TestSuite]:
+    """
+    The problem's test suite, generating and caching it on first use.
+
+    Args:
+        q_id: Question id
+        problem: The problem's entry in the problem store (the suite is cached on it)
+        llm: LLM client used if the suite has to be generated
+
+    Returns:
+        Optional[TestSuite]: None when generation is disabled or failed (within the last
+        TEST_SUITE_RETRY_AFTER seconds)
+    """
+    suite = cached_suite(problem)
+    if suite is not None or not TEST_SUITE_ENABLED:
+        return suite
+
+    key = (q_id, suite_fingerprint(problem))
+    if _recently_failed(key):
+        return None
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.setdefault(loop, {})
+    future = inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_build_and_store(q_id, problem, llm))
+        inflight[key] = future
+        future.add_done_callback(lambda _: inflight.pop(key, None))
+    # One cancelled grader must not cancel the generation the others are waiting for
+    return await asyncio.shield(future)
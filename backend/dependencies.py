@@ -27,10 +27,11 @@ class ProblemInfo(BaseModel):
     type: str = Field(description="题目类型，包括:概念题、计算题、编程题、证明题、推理题；如果无法归为以上5类，则为其他。")
     stem: str = Field(description="题目**完整**的题干内容，包括所有文字、公式和代码块。**[重要指令]：请保证提取题干的完整性，你被禁止自行删减内容，也不允许进行翻译，请“完整”保留题干信息，你的工作只是将他们划分为多个题目。**")
     criterion: str = Field(description="题目评分标准细则")
+    reference_solution: str = Field("", description="题目材料中给出的参考答案或参考程序（编程题用它校验测试用例），原样保留；若不存在，则为空字符串。")
 
 class ProblemSet(BaseModel):
     """A collection of problems extracted from a document."""
-    problems: List[ProblemInfo] = Field(description="将所有处理好的题目整合成一个字典，key为\"problems\"，value为一个列表，列表每个元素是一个JSON对象字典，包含 \"q_id\", \"number\", \"type\", \"stem\", \"criterion\" 这几个字段。")
+    problems: List[ProblemInfo] = Field(description="将所有处理好的题目整合成一个字典，key为\"problems\"，value为一个列表，列表每个元素是一个JSON对象字典，包含 \"q_id\", \"number\", \"type\", \"stem\", \"criterion\", \"reference_solution\" 这几个字段。")
 
 
 # 单个题目答案的结构
@@ -46,6 +47,10 @@ class StudentSubmission(BaseModel):
     stu_id: str = Field(description="从文件名中提取的学生学号，通常是字母和数字的组合或者纯数字；若不存在，则填写空字符串。")
     stu_name: str = Field(description="从文件名中提取的学生姓名，通常是2~4个汉字，或者是包含首字母大写的拼音名或英文名；若不存在，则填写空字符串。")
     stu_ans: List[StudentAnswerInfo] = Field(description="一个包含该生所有题目答案的列表，列表每个元素是一个json字典，包含key:\"q_id\"（题目唯一标识，来自【题目数据】）、\"number\"（题目作答中显示的题号，来自【题目数据】）、\"type\"（题目类型分类，来自【题目数据】）、\"content\"（识别得到的解答过程）、\"flag\"（识别异常情况，见下面详述）")
+
+# 学号、姓名已从文件名解析时，LLM 只需返回答案分割结果
+class StudentAnswers(BaseModel):
+    stu_ans: List[StudentAnswerInfo] = Field(description="一个包含该生所有题目答案的列表，格式同 StudentSubmission.stu_ans")
   
 # ... (Student 和 StudentAnswer 的 Pydantic 模型定义，如果需要的话) ...
 
@@ -176,137 +181,29 @@ def get_llm(model=MODEL_PROVIDER) -> ChatOpenAI:
 
         return zhipu_ai
 
-import re
-import json
-
-def fix_incomplete_json(json_str: str) -> str:
-    """
-    尝试修复不完整的JSON字符串
-    """
-    # 检查并修复缺失的闭合符号
-    open_braces = json_str.count('{')
-    close_braces = json_str.count('}')
-    open_brackets = json_str.count('[')
-    close_brackets = json_str.count(']')
-    
-    # 尝试添加缺失的闭合符号
-    json_str_fixed = json_str
-    while close_braces < open_braces:
-        json_str_fixed += '}'
-        close_braces += 1
-    while close_brackets < open_brackets:
-        json_str_fixed += ']'
-        close_brackets += 1
-        
-    # 检查引号是否匹配
-    quote_count = json_str_fixed.count('"')
-    if quote_count % 2 != 0:
-        # 如果引号数量是奇数，尝试添加一个引号
-        json_str_fixed += '"'
-        
-    # 特殊处理：检查是否在某个字符串值中间截断
-    # 查找最后一个未闭合的字符串
-    last_quote_pos = json_str_fixed.rfind('"')
-    if last_quote_pos != -1:
-        # 检查在这个引号之后是否有未闭合的结构
-        text_after_last_quote = json_str_fixed[last_quote_pos+1:]
-        if text_after_last_quote.count('{') > text_after_last_quote.count('}'):
-            # 如果有未闭合的大括号，添加闭合符号
-            json_str_fixed += '}'
-        elif text_after_last_quote.count('[') > text_after_last_quote.count(']'):
-            # 如果有未闭合的方括号，添加闭合符号
-            json_str_fixed += ']'
-            
-    # 确保JSON结构完整
-    # 检查是否以 { 开始并以 } 结束
-    json_str_fixed = json_str_fixed.strip()
-    if json_str_fixed.startswith('{') and not json_str_fixed.endswith('}'):
-        json_str_fixed += '}'
-    elif json_str_fixed.startswith('[') and not json_str_fixed.endswith(']'):
-        json_str_fixed += ']'
-        
-    return json_str_fixed
+from .llm_json import extract_json
+from .llm_failures import record_llm_failure
 
 def parse_llm_json_output(llm_output: str, output_model: Type[BaseModel]) -> BaseModel:
     """
     一个通用的、健壮的函数，用于从LLM的原始文本输出中提取JSON并使用Pydantic模型进行解析。
 
-    [最终修复版]：通过简单地将所有反斜杠加倍来修复所有类型的非法反斜杠转义错误，
-    这对于处理包含大量LaTeX等内容的字符串尤为稳健。
+    JSON 的提取和修复（LaTeX 反斜杠、截断、尾逗号、注释等）由 llm_json.extract_json 一次完成。
+    解析失败时原始输出记入 llm_failures 的环形缓冲区（见 /debug/llm_failures）。
     """
-    # 优先匹配大括号，其次匹配方括号，以处理JSON对象和JSON数组
-    match = re.search(r'\{.*\}', llm_output, re.DOTALL)
-    if not match:
-        match = re.search(r'\[.*\]', llm_output, re.DOTALL)
-
-    if not match:
-        raise ValueError(f"在LLM输出中未找到有效的JSON结构。原始输出: '{llm_output[:200]}...'")
-
-    json_str = match.group(0)
-    logger.info(f"提取的JSON字符串: {json_str}")
-
     try:
-        # 第一次尝试直接解析
-        return output_model.model_validate_json(json_str)
-    except (ValidationError, json.JSONDecodeError) as e:
-        # 检查是否是由于非法转义引起的错误
-        # json.JSONDecodeError的错误信息通常包含 "Invalid \escape"
-        # Pydantic的ValidationError可能包装了底层的JSONDecodeError
-        if "invalid escape" in str(e).lower() or "invalid \\escape" in str(e).lower():
-            print("检测到JSON转义错误，尝试修复...")
-
-            # 放弃复杂的正则表达式，直接将所有反斜杠替换为转义后的反斜杠。
-            # 这能正确处理 \i, \g, 以及 \\ -> \\\\ 的情况。
-            json_str_fixed = json_str.replace('\\', '\\\\')
-            
-            try:
-                # 再次尝试解析修复后的字符串
-                print("修复成功，再次解析...")
-                return output_model.model_validate_json(json_str_fixed)
-            except Exception as final_e:
-                # 如果修复后仍然失败，则抛出信息更全的错误
-                logger.error(f"提取的字符串: {json_str}")
-                logger.error(f"修复后的字符串: {json_str_fixed}")
-                # 写入文件以供调试
-                with open("error_json.txt", "w", encoding="utf-8") as file:
-                    file.write(json_str)
-                with open("error_fixed_json.txt", "w", encoding="utf-8") as file:
-                    file.write(json_str_fixed)
-                raise ValueError(
-                    f"自动修复转义字符后解析仍然失败。\n"
-                    f"原始错误: {e}\n"
-                    f"最终错误: {final_e}"
-                )
-        elif "eof while parsing" in str(e).lower() or "unexpected end of input" in str(e).lower():
-            print("检测到JSON不完整错误，尝试修复...")
-            # 尝试修复不完整的JSON
-            json_str_fixed = fix_incomplete_json(json_str)
-                
-            try:
-                # 再次尝试解析修复后的字符串
-                print("修复成功，再次解析...")
-                return output_model.model_validate_json(json_str_fixed)
-            except Exception as final_e:
-                # 如果修复后仍然失败，则抛出信息更全的错误
-                logger.error(f"提取的字符串: {json_str}")
-                logger.error(f"修复后的字符串: {json_str_fixed}")
-                # 写入文件以供调试
-                with open("error_json.txt", "w", encoding="utf-8") as file:
-                    file.write(json_str)
-                with open("error_fixed_json.txt", "w", encoding="utf-8") as file:
-                    file.write(json_str_fixed)
-                raise ValueError(
-                    f"自动修复不完整JSON后解析仍然失败。\n"
-                    f"原始错误: {e}\n"
-                    f"最终错误: {final_e}"
-                )
-        else:
-            # 如果是其他类型的JSON错误，直接抛出
-            logger.error(f"提取的字符串：{json_str}，它不是一个有效的JSON。错误: {e}")
-            with open("error_json.txt", "w", encoding="utf-8") as file:
-                file.write(json_str)
+        data = extract_json(llm_output, container=dict)
+    except ValueError as e:
+        record_llm_failure(llm_output, e, output_model.__name__)
+        raise
+    logger.debug(f"提取的JSON: {data}")
 
-            raise ValueError(f"提取的字符串不是一个有效的JSON。错误: {e}")
+    try:
+        return output_model.model_validate(data)
+    except ValidationError as e:
+        logger.error(f"提取的JSON不符合 {output_model.__name__} 的结构。错误: {e}")
+        record_llm_failure(llm_output, e, output_model.__name__)
+        raise ValueError(f"提取的JSON不符合 {output_model.__name__} 的结构。错误: {e}")
         
 
 # --- dependencies.py 追加内容 ---
@@ -315,7 +212,7 @@ from typing import Callable
 def get_llm_factory() -> Callable[[], ChatOpenAI]:
     """
     返回一个工厂函数，每次调用该工厂函数都会创建一个全新的 LLM 实例。
-    用于在多线程环境中实现实例隔离，避免锁竞争。
+    调用方通过 llm_invoke.ainvoke_llm 异步调用，一个实例即可服务整个批次的并发请求。
     """
     def factory():
         # 这里复用 get_llm 的逻辑，或者直接实例化
@@ -0,0 +1,116 @@
+# filename_parser.py
+"""
+从提交文件名中解析学生学号和姓名。
+
+解析规则是带命名分组的正则模板：(?P<stu_id>...) 必须有，(?P<stu_name>...) 可选。
+模板按"模板集"组织，不同课程的命名约定可以放在不同模板集里：
+
+- 内置的 "default" 模板集覆盖 "学号_姓名"、"姓名_学号"、"作业1_学号_姓名" 等常见写法，
+  以及学号和中文姓名之间没有分隔符的 "PB20111639张三"、"张三PB20111639"；
+- FILENAME_TEMPLATES_PATH 指向的 JSON 文件可以追加或覆盖模板集，格式为
+  {"模板集名": ["正则1", "正则2", ...], ...}；
+- FILENAME_TEMPLATE_SET 指定默认使用的模板集，上传接口也可以按次指定。
+
+模板按顺序匹配文件名（不含目录和扩展名），第一个取到学号的模板生效；都不匹配时退回到
+按分隔符切分的启发式规则。
+"""
+import os
+import re
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FILENAME_TEMPLATES_PATH = os.getenv("FILENAME_TEMPLATES_PATH", "")
+FILENAME_TEMPLATE_SET = os.getenv("FILENAME_TEMPLATE_SET", "default")
+
+# 学号：可选的字母前缀 + 至少 4 位数字（可再跟字母数字），如 PB20111639、2021012345、SA21011001
+_ID = r"(?P<stu_id>[A-Za-z]{0,4}\d{4,}[A-Za-z\d]*)"
+# 姓名：2~8 个汉字（可含间隔号，兼顾复姓和少数民族姓名），或首字母大写的拼音/英文名
+_NAME = r"(?P<stu_name>[一-鿿·]{2,8}|[A-Z][a-z]+(?:[ _]?[A-Z][a-z]+)*)"
+_SEP = r"[\s_\-—－+，,]+"
+# 无分隔符时只接受中文姓名：拼音紧跟学号时无法区分学号末尾的字母和姓名
+_ID_DIGITS = r"(?P<stu_id>[A-Za-z]{0,4}\d{4,})"
+_CJK_NAME = r"(?P<stu_name>[一-鿿·]{2,8})"
+
+DEFAULT_FILENAME_TEMPLATES: Dict[str, List[str]] = {
+    "default": [
+        rf"^{_ID}{_SEP}{_NAME}",
+        rf"^{_NAME}{_SEP}{_ID}",
+        rf"(?:^|{_SEP}){_ID}{_SEP}{_NAME}(?:{_SEP}|$)",
+        rf"(?:^|{_SEP}){_NAME}{_SEP}{_ID}(?:{_SEP}|$)",
+        rf"^{_ID_DIGITS}{_CJK_NAME}$",
+        rf"^{_CJK_NAME}{_ID}$",
+        rf"^{_ID}$",
+    ],
+}
+
+
+def _compile_templates(patterns: List[str], template_set: str) -> List["re.Pattern"]:
+    compiled = []
+    for pattern in patterns:
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            logger.error(f"文件名模板集 '{template_set}' 中的正则无效，已忽略: {pattern} ({e})")
+            continue
+        if "stu_id" not in regex.groupindex:
+            logger.error(f"文件名模板集 '{template_set}' 中的正则缺少 stu_id 分组，已忽略: {pattern}")
+            continue
+        compiled.append(regex)
+    return compiled
+
+
+@lru_cache(maxsize=1)
+def load_template_sets() -> Dict[str, List["re.Pattern"]]:
+    """加载内置模板集和 FILENAME_TEMPLATES_PATH 中的自定义模板集（结果缓存，修改配置文件后需重启）。"""
+    sets = dict(DEFAULT_FILENAME_TEMPLATES)
+    if FILENAME_TEMPLATES_PATH:
+        try:
+            with open(FILENAME_TEMPLATES_PATH, "r", encoding="utf-8") as f:
+                custom = json.load(f)
+            sets.update({name: list(patterns) for name, patterns in custom.items()})
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"读取文件名模板配置 {FILENAME_TEMPLATES_PATH} 失败，仅使用内置模板: {e}")
+    return {name: _compile_templates(patterns, name) for name, patterns in sets.items()}
+
+
+def list_template_sets() -> List[str]:
+    return sorted(load_template_sets())
+
+
+def _split_filename(stem: str) -> Tuple[str, str]:
+    """兜底规则：按分隔符切分，第一个形如学号（至少 3 位数字）的片段作为学号，第一个不含数字的片段作为姓名。"""
+    stu_id, stu_name = "", ""
+    for token in re.split(_SEP, stem):
+        if not token:
+            continue
+        if not stu_id and re.fullmatch(r"[A-Za-z]{0,4}\d{3,}[A-Za-z\d]*", token):
+            stu_id = token
+        elif not stu_name and not re.search(r"\d", token):
+            stu_name = token
+    return stu_id, stu_name
+
+
+def parse_student_filename(filename: str, template_set: Optional[str] = None) -> Tuple[str, str]:
+    """
+    从文件名中解析 (学号, 姓名)，取不到的部分为空字符串。
+
+    Args:
+        filename: 提交文件名，可以带目录和扩展名，如 "hw/PB20111639_张三.txt"。
+        template_set: 使用的模板集名，默认取 FILENAME_TEMPLATE_SET；不存在时退回 "default"。
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0].strip()
+    sets = load_template_sets()
+    name = template_set or FILENAME_TEMPLATE_SET
+    if name not in sets:
+        logger.warning(f"文件名模板集 '{name}' 不存在，使用 default")
+        name = "default"
+    for regex in sets[name]:
+        match = regex.search(stem)
+        if match and match.group("stu_id"):
+            groups = match.groupdict()
+            return groups["stu_id"].strip(), (groups.get("stu_name") or "").strip()
+    return _split_filename(stem)
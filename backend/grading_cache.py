@@ -0,0 +1,228 @@
+# grading_cache.py
+"""
+批改结果的内容寻址缓存。
+
+缓存键为以下内容规范化后的 SHA-256：题干、评分标准、学生作答（按题型规范化）、题目类型、
+prompt 模板版本、模型名。批量批改（一次调用批改同一题的多份作答）得到的结果还依赖 batch 模板，
+单独存放在版本中带有 batch 模板哈希的键下；查找时两个键都会尝试。因此教师通过 /human_edit/problems 修改某一道题后重新批改，
+只有被修改的题目会重新调用 LLM，其余未变化的作答直接命中缓存。
+
+缓存持久化在 SQLite 中（进程重启后仍然有效），按最近访问时间做有界 LRU 淘汰，
+并记录命中/未命中/淘汰计数。
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import unicodedata
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from backend.models import Correction
+from backend.dependencies import MODEL_PROVIDER, GEMINI_MODEL, OPENAI_MODEL
+from backend.correct.prompt_utils import get_template_version
+
+logger = logging.getLogger(__name__)
+
+GRADING_CACHE_ENABLED = os.getenv("GRADING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+GRADING_CACHE_PATH = os.getenv(
+    "GRADING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "grading_cache.sqlite3"),
+)
+GRADING_CACHE_MAX_ENTRIES = int(os.getenv("GRADING_CACHE_MAX_ENTRIES", "50000"))
+
+# 内部题目类型 -> 影响批改结果的 prompt 模板（编程题还依赖测试用例生成模板）
+TEMPLATE_NAMES = {
+    "calculation": ("calc",),
+    "concept": ("concept",),
+    "proof": ("proof",),
+    "programming": ("programming", "test_suite"),
+}
+# 批量批改额外依赖的模板（batch.txt 的内容同样影响结果）
+BATCH_TEMPLATE_NAME = "batch"
+
+# 批改节点在 LLM 调用失败时返回的兜底结果，不能写入缓存
+FALLBACK_COMMENT_PREFIXES = (
+    "LLM call failed",
+    "Template file not found",
+    "Prompt preparation failed",
+    "Grading error",
+    "Processing error",
+    "Unsupported question type",
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """去掉首尾空白并把连续空白折叠为单个空格。"""
+    if not text:
+        return ""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def normalize_answer(text: Optional[str], internal_type: str) -> str:
+    """
+    规范化学生作答，用于缓存键和批次内去重。
+
+    编程题的缩进和换行有语义，只统一换行符并去掉首尾空白；
+    概念题额外忽略全部空白与标点并统一大小写；其余题型只折叠空白
+    （计算题中的 "-" 等符号有意义，不能去掉）。
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    if internal_type == "programming":
+        return text.replace("\r\n", "\n").strip()
+    if internal_type == "concept":
+        return "".join(
+            ch for ch in text
+            if not ch.isspace() and not unicodedata.category(ch).startswith("P")
+        ).casefold()
+    return normalize_text(text)
+
+
+def get_prompt_template_version(internal_type: str, batched: bool = False) -> str:
+    """
+    返回某类题目 prompt 模板内容的短哈希（来自模板注册表），模板变化后旧缓存自动失效。
+    batched 为 True 时再加上 batch 模板的哈希，用于批量批改得到的结果。
+    """
+    names = TEMPLATE_NAMES.get(internal_type, (internal_type,))
+    if batched:
+        names = names + (BATCH_TEMPLATE_NAME,)
+    versions = [get_template_version(name) or "inline-default" for name in names]
+    return "+".join(versions)
+
+
+def get_model_name() -> str:
+    return GEMINI_MODEL if MODEL_PROVIDER == "gemini" else OPENAI_MODEL
+
+
+def make_cache_key(stem: str, rubric: str, answer: str, question_type: str,
+                   template_version: str, model_name: str) -> str:
+    """计算批改结果的内容寻址键。"""
+    payload = json.dumps(
+        [normalize_text(stem), normalize_text(rubric), normalize_answer(answer, question_type),
+         question_type, template_version, model_name],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(correction: Correction) -> bool:
+    """
+    只有真正由 LLM 给出的结果才写入缓存。
+
+    解析失败时批改节点会用正则抢救字段或填入默认分数，这类结果 complete 为 False，
+    缓存后会让之后的每次重新批改都返回同一个编造的分数。
+    """
+    if not correction.complete:
+        return False
+    return not (correction.comment or "").startswith(FALLBACK_COMMENT_PREFIXES)
+
+
+class GradingCache:
+    """基于 SQLite 的持久化 LRU 缓存，值为 Correction 的 JSON。"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS corrections ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_corrections_last_access ON corrections(last_access)")
+            conn.commit()
+            self._size = conn.execute("SELECT COUNT(*) FROM corrections").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get_sync(self, *keys: str) -> Optional[Correction]:
+        """按顺序返回第一个命中的键对应的结果；几个键合计只算一次命中或未命中。"""
+        with self._lock:
+            conn = self._connect()
+            placeholders = ",".join("?" * len(keys))
+            rows = dict(conn.execute(
+                f"SELECT key, value FROM corrections WHERE key IN ({placeholders})", keys
+            ).fetchall())
+            key = next((key for key in keys if key in rows), None)
+            if key is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE corrections SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+        return Correction.model_validate_json(rows[key])
+
+    def put_sync(self, key: str, correction: Correction) -> None:
+        value = correction.model_dump_json()
+        with self._lock:
+            conn = self._connect()
+            exists = conn.execute("SELECT 1 FROM corrections WHERE key = ?", (key,)).fetchone() is not None
+            conn.execute(
+                "INSERT OR REPLACE INTO corrections (key, value, last_access) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            if not exists:
+                self._size += 1
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM corrections WHERE key IN ("
+                    " SELECT key FROM corrections ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._size -= overflow
+                self.evictions += overflow
+            conn.commit()
+
+    def clear_sync(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM corrections")
+            conn.commit()
+            self._size = 0
+
+    async def get(self, *keys: str) -> Optional[Correction]:
+        return await asyncio.to_thread(self.get_sync, *keys)
+
+    async def put(self, key: str, correction: Correction) -> None:
+        await asyncio.to_thread(self.put_sync, key, correction)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._connect()
+            size = self._size
+        lookups = self.hits + self.misses
+        return {
+            "enabled": GRADING_CACHE_ENABLED,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+grading_cache = GradingCache(GRADING_CACHE_PATH, GRADING_CACHE_MAX_ENTRIES)
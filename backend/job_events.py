@@ -0,0 +1,42 @@
+# job_events.py
+"""
+批改任务进度的进程内通知。
+
+批改任务每次写入任务存储（开始、学生结果、失败、完成）后调用 notify_job_update，
+SSE 推送端点通过 wait_for_job_update 挂起等待，被唤醒后再从任务存储读取最新状态推送给前端。
+多个 worker 进程之间没有通知通道，订阅方还会按固定间隔主动检查一次任务存储作为兜底。
+"""
+import asyncio
+import weakref
+from typing import Dict, Set
+
+# asyncio 原语需要在事件循环内创建，这里按事件循环分别保存各任务的等待者
+_waiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Set[asyncio.Event]]]" = weakref.WeakKeyDictionary()
+
+
+def _loop_waiters() -> Dict[str, Set[asyncio.Event]]:
+    return _waiters.setdefault(asyncio.get_running_loop(), {})
+
+
+def notify_job_update(job_id: str) -> None:
+    """唤醒当前事件循环上所有正在等待该任务更新的订阅方。"""
+    for event in _loop_waiters().get(job_id, ()):
+        event.set()
+
+
+async def wait_for_job_update(job_id: str, timeout: float) -> bool:
+    """等待任务的下一次更新通知；超时返回 False。"""
+    waiters = _loop_waiters()
+    event = asyncio.Event()
+    waiters.setdefault(job_id, set()).add(event)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        job_waiters = waiters.get(job_id)
+        if job_waiters is not None:
+            job_waiters.discard(event)
+            if not job_waiters:
+                waiters.pop(job_id, None)
@@ -0,0 +1,534 @@
+# job_store.py
+"""
+批改任务的持久化存储。
+
+原先任务状态保存在 ai_grading.py 的 GRADING_RESULTS / HISTORY_RESULTS / JOB_METADATA 三个
+进程内 OrderedDict 中：服务重启后已完成的批改结果全部丢失。
+这里抽象出 JobStore 接口，路由只通过它读写任务、学生结果和逐题批改结果。
+
+默认后端为 SQLite（WAL 模式）：
+  - jobs：任务元数据（类型、状态、时间戳、错误信息等）
+  - student_results：每个学生一行的批改结果
+  - corrections：每道题一行的批改详情（Correction 的 JSON）
+每个学生批改完成后立即写入一行结果并更新进度计数（done / failed / total），
+前端可以用 student_results 的自增 id 作为游标，只拉取尚未看到的结果。
+后端通过环境变量 JOB_STORE_BACKEND 选择，数据库位置由 JOB_STORE_PATH 指定。
+
+任务存储只保证结果在重启后不丢失，服务仍然只能以单个 worker 运行：题目、学生作答和正在运行的
+批改任务（problem_store、student_store、ACTIVE_JOBS）都保存在进程内存中，其他 worker 既不能
+批改也不能取消不是自己创建的任务。重启时正在运行的任务随进程一起消失，启动时由
+fail_stale_jobs 把这些长时间没有更新的 pending 任务标记为出错，前端和 SSE 推送才能结束等待。
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite").lower()
+JOB_STORE_PATH = os.getenv(
+    "JOB_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "grading_jobs.sqlite3"),
+)
+
+# 任务状态
+STATUS_PENDING = "pending"
+STATUS_COMPLETED = "completed"
+STATUS_ERROR = "error"
+
+
+def _dump_correction(correction: Any) -> str:
+    if isinstance(correction, BaseModel):
+        return correction.model_dump_json()
+    return json.dumps(correction, ensure_ascii=False)
+
+
+def _correction_q_id(correction: Any) -> str:
+    if isinstance(correction, BaseModel):
+        return getattr(correction, "q_id", "")
+    return correction.get("q_id", "")
+
+
+class JobStore(ABC):
+    """批改任务存储接口。返回的字典结构与原先内存字典中的结构保持一致。"""
+
+    @abstractmethod
+    def create_job(self, job_id: str, job_type: str, student_id: Optional[str] = None) -> None:
+        """登记一个新的待处理任务。"""
+
+    @abstractmethod
+    def update_job(self, job_id: str, status: str, message: Optional[str] = None,
+                   student_count: Optional[int] = None) -> None:
+        """更新任务状态；completed / error 状态会同时记录完成时间。"""
+
+    @abstractmethod
+    def start_job(self, job_id: str, total: int) -> None:
+        """记录任务开始处理的时间和需要批改的学生总数。"""
+
+    @abstractmethod
+    def save_results(self, job_id: str, results: List[Dict[str, Any]]) -> None:
+        """写入学生结果（每项包含 student_id、student_name、corrections）并累加 done 计数。"""
+
+    @abstractmethod
+    def record_failure(self, job_id: str, count: int = 1) -> None:
+        """累加批改失败的学生数。"""
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务元数据，不存在时返回 None。"""
+
+    @abstractmethod
+    def get_jobs(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量查询任务元数据，不存在的任务不出现在结果中。"""
+
+    @abstractmethod
+    def get_summaries(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量查询任务摘要：元数据加上学生数、作答数、总分/满分合计、平均分和逐题平均分，
+        不包含任何批改详情。不存在的任务不出现在结果中。
+        """
+
+    @abstractmethod
+    def list_jobs(self) -> Dict[str, Dict[str, Any]]:
+        """按创建时间排序的全部任务元数据。"""
+
+    @abstractmethod
+    def get_result(self, job_id: str, cursor: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        任务结果，不存在时返回 None。
+
+        不带 cursor 时保持原有行为：完成后返回全部学生结果，进行中只返回状态和进度。
+        带 cursor 时（进行中也可以）只返回游标之后新写入的学生结果，以及新的 cursor。
+        """
+
+    @abstractmethod
+    def delete_job(self, job_id: str) -> None:
+        """删除任务及其全部结果。"""
+
+    @abstractmethod
+    def clear_unfinished(self) -> int:
+        """删除所有未完成（进行中或出错）的任务，已完成的历史记录保留。返回删除数量。"""
+
+    @abstractmethod
+    def fail_stale_jobs(self, stale_after: float, message: str, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        把超过 stale_after 秒没有更新的 pending 任务标记为出错（exclude 中的任务除外），
+        返回被标记的任务 id。用于清理随进程重启而中断、再也不会完成的任务。
+        """
+
+    @abstractmethod
+    def cleanup(self, job_ttl: float, max_jobs: int) -> None:
+        """删除过期或超出数量上限的任务（连同结果）；进行中的任务不会被清理。"""
+
+
+class SQLiteJobStore(JobStore):
+    """基于 SQLite（WAL）的任务存储，支持多进程共享同一个数据库文件。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    student_id TEXT,
+                    message TEXT,
+                    student_count INTEGER,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    started_at REAL,
+                    completed_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+                CREATE INDEX IF NOT EXISTS idx_jobs_student_id ON jobs(student_id);
+
+                CREATE TABLE IF NOT EXISTS student_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    student_name TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_student_results_job ON student_results(job_id, id);
+                CREATE INDEX IF NOT EXISTS idx_student_results_student ON student_results(student_id);
+
+                CREATE TABLE IF NOT EXISTS corrections (
+                    result_id INTEGER NOT NULL,
+                    job_id TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    q_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_corrections_result ON corrections(result_id, position);
+                CREATE INDEX IF NOT EXISTS idx_corrections_job_student ON corrections(job_id, student_id);
+                CREATE INDEX IF NOT EXISTS idx_corrections_q_id ON corrections(q_id);
+                CREATE INDEX IF NOT EXISTS idx_corrections_created_at ON corrections(created_at);
+                """
+            )
+            self._migrate(conn)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """为旧版本创建的数据库补齐新增的列。"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, ddl in (
+            ("total", "INTEGER NOT NULL DEFAULT 0"),
+            ("done", "INTEGER NOT NULL DEFAULT 0"),
+            ("failed", "INTEGER NOT NULL DEFAULT 0"),
+            ("started_at", "REAL"),
+        ):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {ddl}")
+
+    @staticmethod
+    def _progress(row: sqlite3.Row) -> Dict[str, Any]:
+        """进度计数与按已完成速度估算的剩余时间（秒）。"""
+        total, done, failed = row["total"], row["done"], row["failed"]
+        processed = done + failed
+        eta = None
+        if row["status"] == STATUS_PENDING and row["started_at"] and 0 < processed < total:
+            elapsed = time.time() - row["started_at"]
+            eta = round(elapsed / processed * (total - processed), 1)
+        elif row["status"] != STATUS_PENDING:
+            eta = 0.0
+        return {"done": done, "failed": failed, "total": total, "eta_seconds": eta}
+
+    @staticmethod
+    def _job_to_metadata(row: sqlite3.Row) -> Dict[str, Any]:
+        metadata = {
+            "job_id": row["job_id"],
+            "type": row["job_type"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "timestamp": row["created_at"],
+        }
+        if row["student_id"] is not None:
+            metadata["student_id"] = row["student_id"]
+        if row["completed_at"] is not None:
+            metadata["completed_at"] = row["completed_at"]
+        if row["student_count"] is not None:
+            metadata["student_count"] = row["student_count"]
+        if row["status"] == STATUS_ERROR and row["message"]:
+            metadata["error"] = row["message"]
+        metadata["progress"] = SQLiteJobStore._progress(row)
+        return metadata
+
+    def create_job(self, job_id: str, job_type: str, student_id: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, job_type, status, student_id, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, STATUS_PENDING, student_id, now, now),
+            )
+            conn.commit()
+
+    def update_job(self, job_id: str, status: str, message: Optional[str] = None,
+                   student_count: Optional[int] = None) -> None:
+        now = time.time()
+        completed_at = now if status in (STATUS_COMPLETED, STATUS_ERROR) else None
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = COALESCE(?, message),"
+                " student_count = COALESCE(?, student_count),"
+                " completed_at = COALESCE(?, completed_at), updated_at = ? WHERE job_id = ?",
+                (status, message, student_count, completed_at, now, job_id),
+            )
+            conn.commit()
+
+    def start_job(self, job_id: str, total: int) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE jobs SET total = ?, started_at = ?, updated_at = ? WHERE job_id = ?",
+                (total, now, now, job_id),
+            )
+            conn.commit()
+
+    def save_results(self, job_id: str, results: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # 任务已被丢弃/重置时不再写入孤立结果
+            if conn.execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is None:
+                return
+            with conn:
+                for result in results:
+                    student_id = result.get("student_id", "")
+                    cursor = conn.execute(
+                        "INSERT INTO student_results (job_id, student_id, student_name, created_at)"
+                        " VALUES (?, ?, ?, ?)",
+                        (job_id, student_id, result.get("student_name"), now),
+                    )
+                    result_id = cursor.lastrowid
+                    conn.executemany(
+                        "INSERT INTO corrections (result_id, job_id, student_id, q_id, position, data, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (result_id, job_id, student_id, _correction_q_id(c), position, _dump_correction(c), now)
+                            for position, c in enumerate(result.get("corrections", []))
+                        ],
+                    )
+                conn.execute(
+                    "UPDATE jobs SET done = done + ?, updated_at = ? WHERE job_id = ?",
+                    (len(results), now, job_id),
+                )
+
+    def record_failure(self, job_id: str, count: int = 1) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE jobs SET failed = failed + ?, updated_at = ? WHERE job_id = ?",
+                (count, time.time(), job_id),
+            )
+            conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job_to_metadata(row) if row else None
+
+    def get_jobs(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not job_ids:
+            return {}
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT * FROM jobs WHERE job_id IN ({placeholders})", list(job_ids)
+            ).fetchall()
+        return {row["job_id"]: self._job_to_metadata(row) for row in rows}
+
+    def get_summaries(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        summaries = self.get_jobs(job_ids)
+        if not summaries:
+            return {}
+        placeholders = ",".join("?" * len(summaries))
+        params = list(summaries.keys())
+        with self._lock:
+            conn = self._connect()
+            # 分数在 SQLite 内用 JSON 函数聚合，不把批改详情读进 Python
+            totals = conn.execute(
+                "SELECT job_id, COUNT(DISTINCT result_id) AS students, COUNT(*) AS answers,"
+                " SUM(json_extract(data, '$.score')) AS score, SUM(json_extract(data, '$.max_score')) AS max_score"
+                f" FROM corrections WHERE job_id IN ({placeholders}) GROUP BY job_id",
+                params,
+            ).fetchall()
+            questions = conn.execute(
+                "SELECT job_id, q_id, COUNT(*) AS answers, AVG(json_extract(data, '$.score')) AS avg_score,"
+                " MAX(json_extract(data, '$.max_score')) AS max_score"
+                f" FROM corrections WHERE job_id IN ({placeholders}) GROUP BY job_id, q_id ORDER BY job_id, q_id",
+                params,
+            ).fetchall()
+            students = conn.execute(
+                "SELECT job_id, COUNT(*) AS students FROM student_results"
+                f" WHERE job_id IN ({placeholders}) GROUP BY job_id",
+                params,
+            ).fetchall()
+
+        for summary in summaries.values():
+            summary.update({
+                "student_count": 0,
+                "answer_count": 0,
+                "total_score": 0.0,
+                "total_max_score": 0.0,
+                "average_score": None,
+                "average_percentage": None,
+                "questions": {},
+            })
+        for row in students:
+            summaries[row["job_id"]]["student_count"] = row["students"]
+        for row in totals:
+            summary = summaries[row["job_id"]]
+            score, max_score = row["score"] or 0.0, row["max_score"] or 0.0
+            summary["answer_count"] = row["answers"]
+            summary["total_score"] = round(score, 2)
+            summary["total_max_score"] = round(max_score, 2)
+            if row["students"]:
+                summary["average_score"] = round(score / row["students"], 2)
+            if max_score:
+                summary["average_percentage"] = round(score / max_score * 100, 1)
+        for row in questions:
+            summaries[row["job_id"]]["questions"][row["q_id"]] = {
+                "answer_count": row["answers"],
+                "average_score": round(row["avg_score"] or 0.0, 2),
+                "max_score": row["max_score"],
+            }
+        return summaries
+
+    def list_jobs(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute("SELECT * FROM jobs ORDER BY created_at").fetchall()
+        return {row["job_id"]: self._job_to_metadata(row) for row in rows}
+
+    def _load_student_results(self, conn: sqlite3.Connection, job_id: str,
+                              after_id: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        students = conn.execute(
+            "SELECT id, student_id, student_name FROM student_results WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after_id),
+        ).fetchall()
+        corrections: Dict[int, List[Any]] = {}
+        for row in conn.execute(
+            "SELECT result_id, data FROM corrections WHERE job_id = ? AND result_id > ?"
+            " ORDER BY result_id, position",
+            (job_id, after_id),
+        ):
+            corrections.setdefault(row["result_id"], []).append(json.loads(row["data"]))
+        results = [
+            {
+                "student_id": row["student_id"],
+                "student_name": row["student_name"],
+                "corrections": corrections.get(row["id"], []),
+            }
+            for row in students
+        ]
+        next_cursor = students[-1]["id"] if students else after_id
+        return results, next_cursor
+
+    def get_result(self, job_id: str, cursor: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            timestamp = job["completed_at"] or job["created_at"]
+            progress = self._progress(job)
+            if cursor is not None:
+                student_results, next_cursor = self._load_student_results(conn, job_id, cursor)
+                result = {
+                    "status": job["status"],
+                    "results": student_results,
+                    "cursor": next_cursor,
+                    "progress": progress,
+                    "timestamp": timestamp,
+                }
+                if job["status"] == STATUS_ERROR:
+                    result["message"] = job["message"]
+                return result
+            if job["status"] == STATUS_ERROR:
+                return {"status": STATUS_ERROR, "message": job["message"], "progress": progress, "timestamp": timestamp}
+            if job["status"] != STATUS_COMPLETED:
+                return {"status": job["status"], "progress": progress, "timestamp": timestamp}
+            student_results, _ = self._load_student_results(conn, job_id)
+
+        if job["job_type"] == "student":
+            student = student_results[0] if student_results else {}
+            return {
+                "status": STATUS_COMPLETED,
+                "student_id": student.get("student_id", job["student_id"]),
+                "student_name": student.get("student_name"),
+                "corrections": student.get("corrections", []),
+                "progress": progress,
+                "timestamp": timestamp,
+            }
+        return {"status": STATUS_COMPLETED, "results": student_results, "progress": progress, "timestamp": timestamp}
+
+    def _delete_jobs(self, conn: sqlite3.Connection, job_ids: List[str]) -> None:
+        conn.executemany("DELETE FROM corrections WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+        conn.executemany("DELETE FROM student_results WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+        conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+
+    def delete_job(self, job_id: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._delete_jobs(conn, [job_id])
+
+    def clear_unfinished(self) -> int:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                job_ids = [row["job_id"] for row in conn.execute(
+                    "SELECT job_id FROM jobs WHERE status != ?", (STATUS_COMPLETED,)
+                )]
+                self._delete_jobs(conn, job_ids)
+        return len(job_ids)
+
+    def fail_stale_jobs(self, stale_after: float, message: str, exclude: Iterable[str] = ()) -> List[str]:
+        now = time.time()
+        excluded = set(exclude)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                job_ids = [row["job_id"] for row in conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = ? AND updated_at < ?",
+                    (STATUS_PENDING, now - stale_after),
+                ) if row["job_id"] not in excluded]
+                conn.executemany(
+                    "UPDATE jobs SET status = ?, message = ?, completed_at = ?, updated_at = ?"
+                    " WHERE job_id = ? AND status = ?",
+                    [(STATUS_ERROR, message, now, now, job_id, STATUS_PENDING) for job_id in job_ids],
+                )
+        if job_ids:
+            logger.warning(f"{len(job_ids)} 个批改任务长时间没有进展，已标记为出错: {job_ids}")
+        return job_ids
+
+    def cleanup(self, job_ttl: float, max_jobs: int) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                # 过期任务（连同结果）整体删除
+                expired = [row["job_id"] for row in conn.execute(
+                    "SELECT job_id FROM jobs WHERE status != ? AND created_at < ?",
+                    (STATUS_PENDING, now - job_ttl),
+                )]
+                # 超出数量上限时删除最早的已结束任务
+                overflow = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - len(expired) - max_jobs
+                if overflow > 0:
+                    expired += [row["job_id"] for row in conn.execute(
+                        "SELECT job_id FROM jobs WHERE status != ? AND created_at >= ?"
+                        " ORDER BY created_at LIMIT ?",
+                        (STATUS_PENDING, now - job_ttl, overflow),
+                    )]
+                self._delete_jobs(conn, expired)
+        if expired:
+            logger.info(f"清理批改任务: 删除 {len(expired)} 个过期任务")
+
+
+JOB_STORE_BACKENDS = {
+    "sqlite": lambda: SQLiteJobStore(JOB_STORE_PATH),
+}
+
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """返回按 JOB_STORE_BACKEND 配置的全局任务存储实例。"""
+    global _job_store
+    if _job_store is None:
+        factory = JOB_STORE_BACKENDS.get(JOB_STORE_BACKEND)
+        if factory is None:
+            raise ValueError(f"不支持的任务存储后端: {JOB_STORE_BACKEND}")
+        _job_store = factory()
+        logger.info(f"批改任务存储后端: {JOB_STORE_BACKEND}")
+    return _job_store
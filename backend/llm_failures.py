@@ -0,0 +1,159 @@
+# llm_failures.py
+"""
+LLM 输出解析失败的现场记录。
+
+解析失败时保存原始输出，便于事后排查，但不在请求路径上做磁盘 I/O：
+
+- 最近的失败记录保存在内存环形缓冲区中（LLM_FAILURE_BUFFER_SIZE 条），通过 /debug/llm_failures 查看；
+- 设置 LLM_FAILURE_SPILL_DIR 后，记录还会由后台线程写入该目录，每条一个 JSON 文件，
+  只保留最新的 LLM_FAILURE_SPILL_MAX_FILES 个；写入队列满时丢弃新记录而不是阻塞调用方。
+
+记录的 job_id / student_id / q_id / filename 等上下文来自 contextvars：在任务开始处调用
+bind_failure_context 绑定，同一任务及其创建的子任务中的失败都会带上这些键。
+去重后由多个学生共用的批改调用把 student_id 绑定为学号列表，按学生过滤时匹配列表中的任一学号。
+
+记录中包含原始 prompt 输出和学生作答，/debug/llm_failures 端点只在 LLM_FAILURE_DEBUG_API
+开启时注册（默认关闭）。
+"""
+import os
+import json
+import queue
+import logging
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 是否注册 /debug/llm_failures 查看端点（记录含学生作答，默认关闭）
+LLM_FAILURE_DEBUG_API = os.getenv("LLM_FAILURE_DEBUG_API", "false").lower() in ("1", "true", "yes")
+LLM_FAILURE_BUFFER_SIZE = int(os.getenv("LLM_FAILURE_BUFFER_SIZE", "200"))
+# 单条记录保存的原始输出最大字符数
+LLM_FAILURE_MAX_CHARS = int(os.getenv("LLM_FAILURE_MAX_CHARS", str(64 * 1024)))
+LLM_FAILURE_SPILL_DIR = os.getenv("LLM_FAILURE_SPILL_DIR", "")
+LLM_FAILURE_SPILL_MAX_FILES = int(os.getenv("LLM_FAILURE_SPILL_MAX_FILES", "500"))
+# 等待后台线程写盘的记录数上限
+_SPILL_QUEUE_SIZE = 1000
+
+_context: "contextvars.ContextVar[Dict[str, Union[str, List[str]]]]" = contextvars.ContextVar("llm_failure_context", default={})
+_buffer: deque = deque(maxlen=LLM_FAILURE_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+_sequence = 0
+_dropped = 0
+
+_spill_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=_SPILL_QUEUE_SIZE)
+_spill_thread: Optional[threading.Thread] = None
+_spill_lock = threading.Lock()
+
+
+def bind_failure_context(**keys: Any) -> None:
+    """
+    为当前任务绑定失败记录的上下文键（如 job_id、student_id、q_id）；值为 None 的键会被忽略。
+    值为列表、元组或集合时保存为字符串列表（如共用同一次批改调用的全部学号）。
+    """
+    merged = dict(_context.get())
+    for key, value in keys.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            merged[key] = sorted(str(item) for item in value)
+        else:
+            merged[key] = str(value)
+    _context.set(merged)
+
+
+def _context_matches(bound: Union[str, List[str], None], value: str) -> bool:
+    if isinstance(bound, list):
+        return value in bound
+    return bound == value
+
+
+def _spill_worker():
+    os.makedirs(LLM_FAILURE_SPILL_DIR, exist_ok=True)
+    while True:
+        record = _spill_queue.get()
+        try:
+            stamp = record["time"].replace(":", "").replace("-", "")
+            path = os.path.join(LLM_FAILURE_SPILL_DIR, f"failure-{stamp}-{record['id']:06d}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=1)
+            files = sorted(name for name in os.listdir(LLM_FAILURE_SPILL_DIR) if name.startswith("failure-"))
+            for name in files[:-LLM_FAILURE_SPILL_MAX_FILES]:
+                os.remove(os.path.join(LLM_FAILURE_SPILL_DIR, name))
+        except OSError as e:
+            logger.warning(f"写入 LLM 失败记录失败: {e}")
+
+
+def _ensure_spill_thread():
+    global _spill_thread
+    with _spill_lock:
+        if _spill_thread is None:
+            _spill_thread = threading.Thread(target=_spill_worker, name="llm-failure-spill", daemon=True)
+            _spill_thread.start()
+
+
+def record_llm_failure(raw_output: str, error: Any, source: str) -> None:
+    """
+    记录一次 LLM 输出解析失败。只做内存操作，可以在事件循环中直接调用。
+
+    Args:
+        raw_output: LLM 的原始输出。
+        error: 解析错误（异常或描述）。
+        source: 失败发生的位置，如输出模型名或批改节点名。
+    """
+    global _sequence, _dropped
+    raw_output = raw_output or ""
+    with _buffer_lock:
+        _sequence += 1
+        record = {
+            "id": _sequence,
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "source": source,
+            "error": str(error)[:2000],
+            "context": dict(_context.get()),
+            "raw_length": len(raw_output),
+            "raw_output": raw_output[:LLM_FAILURE_MAX_CHARS],
+        }
+        _buffer.append(record)
+
+    if LLM_FAILURE_SPILL_DIR:
+        _ensure_spill_thread()
+        try:
+            _spill_queue.put_nowait(record)
+        except queue.Full:
+            with _buffer_lock:
+                _dropped += 1
+
+
+def get_recent_failures(limit: int = 50, **filters: Optional[str]) -> List[Dict[str, Any]]:
+    """返回最近的失败记录（新的在前），可按上下文键过滤，如 job_id="..."；列表值的键匹配其中任一项。"""
+    filters = {key: value for key, value in filters.items() if value is not None}
+    with _buffer_lock:
+        records = list(_buffer)
+    matched = [
+        record for record in reversed(records)
+        if all(_context_matches(record["context"].get(key), value) for key, value in filters.items())
+    ]
+    return matched[:limit]
+
+
+def get_failure_stats() -> Dict[str, Any]:
+    with _buffer_lock:
+        return {
+            "buffered": len(_buffer),
+            "buffer_size": LLM_FAILURE_BUFFER_SIZE,
+            "total_recorded": _sequence,
+            "spill_dir": LLM_FAILURE_SPILL_DIR or None,
+            "spill_pending": _spill_queue.qsize(),
+            "spill_dropped": _dropped,
+        }
+
+
+def clear_failures() -> int:
+    """清空内存中的失败记录（不删除已写盘的文件），返回清除的条数。"""
+    with _buffer_lock:
+        count = len(_buffer)
+        _buffer.clear()
+    return count
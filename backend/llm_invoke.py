@@ -0,0 +1,66 @@
+# llm_invoke.py
+"""
+异步 LLM 调用层。
+
+所有批改节点（calc/concept/proof/programming）以及作业/题目上传路由都通过这里调用模型，
+使用 LangChain 的 `ainvoke` / `astream`（底层为异步 HTTP 客户端），而不是把同步的
+`llm.invoke` 丢进 Starlette 线程池。这样并发度只受 rate_limiter 中可配置的在途请求预算
+（LLM_MAX_INFLIGHT）与供应商配额限制，而不受线程池线程数（默认 40）限制。
+"""
+import os
+import logging
+from typing import Any, List, Optional
+
+from backend.dependencies import MODEL_PROVIDER
+from backend.rate_limiter import get_rate_limiter, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 是否使用流式接口接收输出（长输出时可以更早收到首包，避免空闲连接被中间代理断开）
+LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() in ("1", "true", "yes")
+
+# LangChain 客户端类名 -> 供应商名（与 dependencies.MODEL_PROVIDER 的取值一致）
+PROVIDER_BY_CLIENT = {
+    "ChatGoogleGenerativeAI": "gemini",
+    "ChatOpenAI": "zhipu",
+}
+
+
+def get_provider(llm: Any) -> str:
+    """根据客户端类型判断其所属供应商，用于选择对应的限流器。"""
+    return PROVIDER_BY_CLIENT.get(type(llm).__name__, MODEL_PROVIDER)
+
+
+async def _astream_collect(llm: Any, messages: List[Any]) -> Any:
+    """以流式方式调用模型，并把所有分块合并为一个完整的消息。"""
+    merged = None
+    async for chunk in llm.astream(messages):
+        merged = chunk if merged is None else merged + chunk
+    if merged is None:
+        raise RuntimeError("LLM 流式调用没有返回任何内容")
+    return merged
+
+
+async def ainvoke_llm(llm: Any, messages: List[Any], stream: Optional[bool] = None) -> Any:
+    """
+    异步调用 LLM。请求发出前先从供应商限流器（RPM/TPM 令牌桶 + 自适应并发）获取名额。
+
+    Args:
+        llm: LangChain 聊天模型实例（ChatGoogleGenerativeAI / ChatOpenAI 等）。
+        messages: 发送给模型的消息列表。
+        stream: 是否使用流式接口；为 None 时使用 LLM_STREAMING 配置。
+
+    Returns:
+        模型返回的消息对象（带有 `.content` 属性）。
+    """
+    if stream is None:
+        stream = LLM_STREAMING
+
+    limiter = get_rate_limiter(get_provider(llm))
+    async with limiter.slot(estimate_tokens(messages)) as ticket:
+        if stream:
+            response = await _astream_collect(llm, messages)
+        else:
+            response = await llm.ainvoke(messages)
+        ticket.record_response(response)
+        return response
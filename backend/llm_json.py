@@ -0,0 +1,268 @@
+# llm_json.py
+"""
+从 LLM 输出中提取并修复 JSON。
+
+LLM 返回的 JSON 常见的问题：前后夹杂说明文字或 ```json 代码块标记、LaTeX 公式中未转义的反斜杠
+（\\frac、\\alpha）、字符串里的原始换行、注释、多余的逗号、输出被截断。
+extract_json 先用标准库的 C 解码器从候选起点直接解码（不再用贪婪正则截取整段），
+绝大多数输出一次就能解析成功；解码失败或其中含有疑似 LaTeX 的转义时，改用容错的词法扫描器
+一次性处理上述问题并直接构造 Python 对象：
+
+- 字符串中大段普通字符、数字等由预编译正则在 C 层一次匹配，Python 只处理结构字符和转义；
+- 非法转义（\\alpha、\\(）按字面反斜杠保留；\\frac、\\times、\\beta、\\nabla 这类恰好以合法转义字母
+  开头的 LaTeX 命令也按字面保留，不会变成换页符、制表符；
+- 顶层 JSON 结束即停止扫描，后面的说明文字不参与解析；
+- 在截断处自动闭合未结束的字符串、数组和对象（未写完值的键会被丢弃）。
+"""
+import re
+import json
+from typing import Any, List, Optional, Tuple
+
+# 防止恶意或异常输出导致递归过深
+MAX_DEPTH = 200
+# 前面的候选起点解析失败时，最多再尝试的起点数
+MAX_START_ATTEMPTS = 32
+
+_STRING_RUN = re.compile(r'[^"\\]+')
+_WHITESPACE = re.compile(r'\s*')
+_NUMBER = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][+-]?\d*)?')
+_WORD = re.compile(r'[A-Za-z]+')
+_HEX4 = re.compile(r'[0-9a-fA-F]{4}')
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+# 以 \n 开头的常见 LaTeX 命令（其余 \n 后跟字母的情况按换行处理，如 "\nThe answer"）
+_LATEX_N_COMMANDS = {
+    'nabla', 'ne', 'neq', 'neg', 'not', 'notin', 'nu', 'ni', 'newline', 'nleq', 'ngeq', 'nmid',
+    'nsubseteq', 'nsupseteq', 'nexists', 'ncong', 'nsim', 'nparallel', 'nrightarrow', 'nleftarrow',
+    'nRightarrow', 'nLeftarrow', 'noindent', 'normalsize', 'newcommand', 'nolimits',
+}
+# 合法 JSON 中疑似 LaTeX 命令的转义：反斜杠后跟 b/f/r/t + 字母，或 \n + 上面的命令名
+_LATEX_ESCAPE = re.compile(
+    r'\\(?:[bfrt][A-Za-z]|n(?:'
+    + '|'.join(sorted((cmd[1:] for cmd in _LATEX_N_COMMANDS), key=len, reverse=True))
+    + r')(?![A-Za-z]))'
+)
+# strict=False：允许字符串中出现原始换行、制表符
+_decoder = json.JSONDecoder(strict=False)
+
+
+class JSONExtractError(ValueError):
+    """当前起点处不是可修复的 JSON。"""
+
+
+def _is_latex_command(text: str, pos: int) -> bool:
+    """pos 指向反斜杠后的字母（b/f/n/r/t 之一），判断这是 LaTeX 命令还是 JSON 转义。"""
+    word = _WORD.match(text, pos).group()
+    if word[0] == 'n':
+        return word in _LATEX_N_COMMANDS
+    # \b \f \r \t 后紧跟字母的，实际文本中几乎只会是 \beta、\frac、\rho、\times 等 LaTeX 命令
+    return len(word) > 1
+
+
+def _skip(text: str, pos: int) -> int:
+    """跳过空白和 // 、/* */ 注释。"""
+    n = len(text)
+    while True:
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith('//', pos):
+            end = text.find('\n', pos)
+            pos = n if end == -1 else end + 1
+        elif text.startswith('/*', pos):
+            end = text.find('*/', pos + 2)
+            pos = n if end == -1 else end + 2
+        else:
+            return pos
+
+
+def _scan_string(text: str, pos: int) -> Tuple[str, int, bool]:
+    """pos 指向起始引号之后；返回 (字符串值, 结束位置, 是否正常闭合)。"""
+    chunks: List[str] = []
+    n = len(text)
+    while pos < n:
+        run = _STRING_RUN.match(text, pos)
+        if run:
+            chunks.append(run.group())
+            pos = run.end()
+            if pos >= n:
+                break
+        if text[pos] == '"':
+            return ''.join(chunks), pos + 1, True
+        # 反斜杠
+        nxt = text[pos + 1:pos + 2]
+        if not nxt:
+            pos += 1
+            break
+        if nxt == 'u' and _HEX4.match(text, pos + 2):
+            code = int(text[pos + 2:pos + 6], 16)
+            pos += 6
+            # 代理对
+            if 0xD800 <= code < 0xDC00 and text.startswith('\\u', pos) and _HEX4.match(text, pos + 2):
+                low = int(text[pos + 2:pos + 6], 16)
+                if 0xDC00 <= low < 0xE000:
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                    pos += 6
+            chunks.append(chr(code))
+        elif nxt in 'bfnrt' and _is_latex_command(text, pos + 1):
+            chunks.append('\\')
+            pos += 1
+        elif nxt in _ESCAPES:
+            chunks.append(_ESCAPES[nxt])
+            pos += 2
+        else:
+            # 非法转义，按字面反斜杠保留（LaTeX 的 \alpha、\( 等）
+            chunks.append('\\')
+            pos += 1
+    return ''.join(chunks), n, False
+
+
+def _scan_number(text: str, pos: int) -> Tuple[Any, int, bool]:
+    match = _NUMBER.match(text, pos)
+    if not match:
+        if text[pos] == '-' and pos + 1 == len(text):
+            return None, len(text), False
+        raise JSONExtractError(f"位置 {pos} 处不是合法的值")
+    token = match.group()
+    complete = match.end() < len(text)
+    # "12." "1e" "1e-" 这类被截断的数字，去掉末尾不完整的部分
+    token = token.rstrip('.eE+-')
+    if any(c in token for c in '.eE'):
+        return float(token), match.end(), complete
+    return int(token), match.end(), complete
+
+
+def _parse_value(text: str, pos: int, depth: int) -> Tuple[Any, int, bool]:
+    """解析 pos 处的值；返回 (值, 结束位置, 是否完整)。"""
+    if depth > MAX_DEPTH:
+        raise JSONExtractError("JSON 嵌套层数过深")
+    ch = text[pos]
+    if ch == '{':
+        return _parse_object(text, pos + 1, depth)
+    if ch == '[':
+        return _parse_array(text, pos + 1, depth)
+    if ch == '"':
+        return _scan_string(text, pos + 1)
+    if ch == '-' or ch.isdigit():
+        return _scan_number(text, pos)
+    word = _WORD.match(text, pos)
+    if word:
+        token = word.group()
+        if token in _LITERALS:
+            return _LITERALS[token], word.end(), word.end() < len(text)
+        if word.end() == len(text):
+            # 截断在字面量中间，如 "tru"
+            for literal, value in _LITERALS.items():
+                if literal.startswith(token):
+                    return value, word.end(), False
+    raise JSONExtractError(f"位置 {pos} 处不是合法的值")
+
+
+def _parse_object(text: str, pos: int, depth: int) -> Tuple[dict, int, bool]:
+    obj = {}
+    n = len(text)
+    while True:
+        pos = _skip(text, pos)
+        if pos >= n:
+            return obj, pos, False
+        ch = text[pos]
+        if ch == '}':
+            return obj, pos + 1, True
+        if ch == ',':
+            # 容忍多余的逗号（包括 "}" 前的尾逗号）
+            pos += 1
+            continue
+        if ch != '"':
+            raise JSONExtractError(f"位置 {pos} 处应为键名")
+        key, pos, closed = _scan_string(text, pos + 1)
+        if not closed:
+            return obj, pos, False
+        pos = _skip(text, pos)
+        if pos >= n:
+            return obj, pos, False
+        if text[pos] != ':':
+            raise JSONExtractError(f"位置 {pos} 处应为冒号")
+        pos = _skip(text, pos + 1)
+        if pos >= n:
+            return obj, pos, False
+        value, pos, complete = _parse_value(text, pos, depth + 1)
+        obj[key] = value
+        if not complete:
+            return obj, pos, False
+
+
+def _parse_array(text: str, pos: int, depth: int) -> Tuple[list, int, bool]:
+    arr = []
+    n = len(text)
+    while True:
+        pos = _skip(text, pos)
+        if pos >= n:
+            return arr, pos, False
+        ch = text[pos]
+        if ch == ']':
+            return arr, pos + 1, True
+        if ch == ',':
+            pos += 1
+            continue
+        value, pos, complete = _parse_value(text, pos, depth + 1)
+        arr.append(value)
+        if not complete:
+            return arr, pos, False
+
+
+def _has_latex_escape(text: str, start: int, end: int) -> bool:
+    if not _LATEX_ESCAPE.search(text, start, end):
+        return False
+    # 去掉已正确转义的 "\\\\"（从左到右成对去除，与 JSON 的转义规则一致）后再判断
+    return _LATEX_ESCAPE.search(text[start:end].replace('\\\\', '')) is not None
+
+
+def _decode_at(text: str, start: int) -> Any:
+    try:
+        value, end = _decoder.raw_decode(text, start)
+    except (json.JSONDecodeError, RecursionError):
+        # 嵌套过深时标准解码器抛 RecursionError，交给限制了深度（MAX_DEPTH）的扫描器处理
+        return _parse_value(text, start, 0)[0]
+    if _has_latex_escape(text, start, end):
+        # 标准解码会把 \frac 变成换页符 + "rac"，改用扫描器按字面保留
+        return _parse_value(text, start, 0)[0]
+    return value
+
+
+def extract_json(text: str, container: Optional[type] = None) -> Any:
+    """
+    从 LLM 输出中提取第一个可解析的 JSON 对象或数组，并修复常见格式问题。
+
+    Args:
+        text: LLM 的原始输出。
+        container: dict 或 list 时只接受该类型的顶层结构；默认优先对象，其次数组。
+
+    Raises:
+        ValueError: 输出中没有可解析的 JSON 结构。
+    """
+    openers = {dict: '{', list: '['}.get(container, '{[')
+    for opener in openers:
+        attempts = 0
+        start = text.find(opener)
+        while start != -1 and attempts < MAX_START_ATTEMPTS:
+            try:
+                return _decode_at(text, start)
+            except JSONExtractError:
+                attempts += 1
+                start = text.find(opener, start + 1)
+    raise ValueError(f"在LLM输出中未找到有效的JSON结构。原始输出: '{text[:200]}...'")
+
+
+# 批改节点解析结果中的标记键：LLM 输出被完整解析且给出了数值分数
+COMPLETE_KEY = "_complete"
+
+
+def mark_complete(data: dict) -> dict:
+    """标记 data 为完整解析的批改结果（有数值型 score 时才算完整），返回 data 本身。"""
+    score = data.get("score")
+    data[COMPLETE_KEY] = isinstance(score, (int, float)) and not isinstance(score, bool)
+    return data
+
+
+def pop_complete(data: dict) -> bool:
+    """取出并移除 mark_complete 写入的标记；正则抢救或默认值得到的结果没有标记，返回 False。"""
+    return bool(data.pop(COMPLETE_KEY, False))
@@ -8,6 +8,11 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.routers import prob_preview, hw_preview, ai_grading, human_edit
+from backend.rate_limiter import get_limiter_metrics
+from backend.llm_failures import get_recent_failures, get_failure_stats, clear_failures, LLM_FAILURE_DEBUG_API
+from backend.structured_output import get_structured_output_stats, reset_structured_output_stats
+from backend.correct.prompt_utils import prompt_registry
+from typing import List, Mapping, Optional
 # from app.db import init_db
 import logging
 import random
@@ -16,6 +21,27 @@ import random
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def configured_workers(argv: List[str], environ: Mapping[str, str]) -> int:
+    """
+    启动命令请求的 worker 进程数。
+
+    uvicorn / gunicorn 的 worker 子进程继承主进程的 sys.argv，因此在 worker 内也能读到
+    --workers N、--workers=N（uvicorn、gunicorn）和 -w N（gunicorn）；两者在命令行未指定时
+    都以 WEB_CONCURRENCY 为默认值。
+    """
+    workers = environ.get("WEB_CONCURRENCY", "1")
+    for index, arg in enumerate(argv):
+        if arg in ("--workers", "-w") and index + 1 < len(argv):
+            workers = argv[index + 1]
+        elif arg.startswith("--workers="):
+            workers = arg.split("=", 1)[1]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            workers = arg[2:]
+    try:
+        return int(workers)
+    except ValueError:
+        return 1
+
 def create_app() -> FastAPI:
     app = FastAPI(title="SmarTAI")
 
@@ -40,6 +66,25 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.on_event("startup")
+    async def load_prompt_templates():
+        # 启动时一次性载入全部 prompt 模板，批改时不再读盘
+        prompt_registry.load_all()
+
+    @app.on_event("startup")
+    async def check_single_worker():
+        # 题目、学生作答和运行中的批改任务都保存在进程内存中，多个 worker 之间无法共享
+        workers = configured_workers(sys.argv, os.environ)
+        if workers > 1:
+            raise RuntimeError(
+                f"检测到 {workers} 个 worker: SmarTAI 后端只支持单个 worker 进程，请去掉 --workers / -w / WEB_CONCURRENCY"
+            )
+
+    @app.on_event("startup")
+    async def recover_interrupted_jobs():
+        # 上次运行中被中断的任务不会再完成，标记为出错，等待页和 SSE 推送才能结束
+        await ai_grading.recover_interrupted_jobs()
+
     @app.get("/")
     def read_root():
         return {"message": "SmarTAI Backend is running", "status": "success"}
@@ -61,9 +106,42 @@ def create_app() -> FastAPI:
             "status": "healthy", 
             "message": "SmarTAI backend is running",
             "memory_usage_mb": round(memory_mb, 2),
-            "cpu_percent": cpu_percent
+            "cpu_percent": cpu_percent,
+            "llm_limiters": get_limiter_metrics()
         }
 
+    if LLM_FAILURE_DEBUG_API:
+        # 失败记录中含有原始 LLM 输出和学生作答，只在显式开启时暴露
+        @app.get("/debug/llm_failures")
+        async def list_llm_failures(limit: int = 50, job_id: Optional[str] = None,
+                                    student_id: Optional[str] = None, q_id: Optional[str] = None,
+                                    filename: Optional[str] = None):
+            """最近的 LLM 输出解析失败记录（新的在前），可按任务、学生、题目或文件名过滤。"""
+            return {
+                "stats": get_failure_stats(),
+                "failures": get_recent_failures(limit, job_id=job_id, student_id=student_id,
+                                                q_id=q_id, filename=filename),
+            }
+
+        @app.delete("/debug/llm_failures")
+        async def clear_llm_failures():
+            return {"cleared": clear_failures()}
+
+    @app.get("/debug/structured_output")
+    async def structured_output_stats():
+        """结构化输出模式与文本模式的调用次数、解析失败率和平均 token 用量（按输出 schema 分组）。"""
+        return get_structured_output_stats()
+
+    @app.delete("/debug/structured_output")
+    async def reset_structured_output():
+        reset_structured_output_stats()
+        return {"status": "success"}
+
+    @app.get("/debug/prompts")
+    async def prompt_versions():
+        """已载入的 prompt 模板及其版本（内容哈希）和占位符。"""
+        return prompt_registry.versions()
+
     return app
 
 app = create_app()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 
@@ -18,4 +18,23 @@ class Correction(BaseModel):
     comment: str
     steps: List[StepScore]
     hits: Optional[List[str]] = None
-    logs: Optional[str] = None
\ No newline at end of file
+    logs: Optional[str] = None
+    # LLM 输出被完整解析且给出了分数；抢救或默认的结果为 False，不写入批改缓存（不序列化）
+    complete: bool = Field(default=False, exclude=True)
+
+class GradedStep(BaseModel):
+    step_no: Optional[int] = None
+    desc: Optional[str] = None
+    comment: Optional[str] = None
+    is_correct: Optional[bool] = None
+    score: float = 0.0
+
+
+class GradingResponse(BaseModel):
+    """Grading result returned by the single-answer grading prompts."""
+    score: float
+    max_score: Optional[float] = None
+    confidence: Optional[float] = None
+    comment: Optional[str] = None
+    steps: List[GradedStep] = []
+    hits: Optional[List[str]] = None
@@ -0,0 +1,314 @@
+# rate_limiter.py
+"""
+LLM 流量的全局限流与自适应并发控制。
+
+每个模型供应商（gemini / zhipu ...）对应一个 ProviderLimiter：
+  - 两个令牌桶，分别约束每分钟请求数（RPM）和每分钟 token 数（TPM）；
+  - 一个 AIMD 风格的自适应并发控制器：初始上限与原线程池并发（40）相当，第一次回退之前
+    每个成功请求上限 +1（慢启动，每个窗口翻倍），之后缓慢线性增长；遇到 429/5xx 或连续多次
+    延迟突增时按比例快速回退；
+  - 排队深度、在途请求数、限流次数等指标，可通过 get_limiter_metrics() 查看。
+
+所有通过 get_llm / get_llm_factory 拿到的客户端都经由 llm_invoke.ainvoke_llm 调用，
+后者在发请求前从这里获取配额，使吞吐量尽量贴近配额上限而不触发供应商限流。
+"""
+import os
+import time
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 各供应商的默认配额 (RPM, TPM)，可用环境变量 LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER> 覆盖；
+# 配额 <= 0 表示不限制。
+DEFAULT_PROVIDER_LIMITS = {
+    "gemini": (1000, 1_000_000),
+    "zhipu": (600, 600_000),
+}
+# 自适应并发的上下界与初始值
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "64"))
+LLM_MIN_INFLIGHT = int(os.getenv("LLM_MIN_INFLIGHT", "2"))
+LLM_INITIAL_INFLIGHT = int(os.getenv("LLM_INITIAL_INFLIGHT", "40"))
+# 单次延迟超过平滑延迟的多少倍视为延迟突增；连续多少次突增才回退（单个慢请求不算）
+LATENCY_SPIKE_FACTOR = float(os.getenv("LLM_LATENCY_SPIKE_FACTOR", "3.0"))
+LATENCY_SPIKE_COUNT = int(os.getenv("LLM_LATENCY_SPIKE_COUNT", "3"))
+# 乘性回退比例，以及两次回退之间的最小间隔（秒），避免同一波失败把上限连续砍到底
+BACKOFF_RATIO = 0.5
+BACKOFF_COOLDOWN = 2.0
+# 用字符数估算 prompt token 数（中英文混合时的经验值）
+CHARS_PER_TOKEN = 3
+
+THROTTLING_STATUS_CODES = {429, 500, 502, 503, 504}
+THROTTLING_MARKERS = (
+    "429",
+    "rate limit",
+    "ratelimit",
+    "resource_exhausted",
+    "resource exhausted",
+    "quota",
+    "too many requests",
+    "overloaded",
+    "503",
+    "service unavailable",
+)
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    """尽量从各家 SDK 的异常对象中取出 HTTP 状态码。"""
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(exc, attr, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int):
+            return value
+        # google.api_core 的 code 可能是 grpc.StatusCode / http.HTTPStatus 等枚举
+        if hasattr(value, "value") and isinstance(getattr(value, "value"), int):
+            return value.value
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttling_error(exc: BaseException) -> bool:
+    """判断异常是否代表供应商限流或服务端过载（429 / 5xx）。"""
+    status = get_status_code(exc)
+    if status is not None:
+        return status in THROTTLING_STATUS_CODES
+    message = str(exc).lower()
+    return any(marker in message for marker in THROTTLING_MARKERS)
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """粗略估算一组消息的 prompt token 数。"""
+    chars = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return chars // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶。等待者按 FIFO 顺序获取令牌。"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """等待直到桶中有足够的令牌，然后扣除。"""
+        if self.unlimited:
+            return
+        # 单次请求超过桶容量时按容量计，否则永远拿不到
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """请求完成后按真实用量修正估算误差（delta 为正表示补扣）。"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 自适应并发上限：慢启动后加性增长，限流/连续延迟突增时乘性回退。"""
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency_ewma: Optional[float] = None
+        # 第一次回退之前处于慢启动阶段
+        self.slow_start = True
+        self._spikes = 0
+        self._last_backoff = 0.0
+        self._cond = asyncio.Condition()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            self.waiting += 1
+            try:
+                await self._cond.wait_for(self._has_capacity)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def release(self, latency: float, throttled: bool) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            self._adjust(latency, throttled)
+            free_slots = int(self.limit) - self.in_flight
+            if free_slots > 0:
+                self._cond.notify(free_slots)
+
+    def _adjust(self, latency: float, throttled: bool) -> None:
+        spiked = (
+            not throttled
+            and self.latency_ewma is not None
+            and latency > self.latency_ewma * LATENCY_SPIKE_FACTOR
+        )
+        self._spikes = self._spikes + 1 if spiked else 0
+        if throttled or self._spikes >= LATENCY_SPIKE_COUNT:
+            self._spikes = 0
+            now = time.monotonic()
+            if now - self._last_backoff >= BACKOFF_COOLDOWN:
+                self._last_backoff = now
+                self.slow_start = False
+                self.limit = max(self.min_limit, self.limit * BACKOFF_RATIO)
+                logger.warning(
+                    f"LLM 并发上限回退至 {int(self.limit)}（原因: {'限流/服务端错误' if throttled else '连续延迟突增'}）"
+                )
+        elif not spiked:
+            if self.slow_start:
+                # 慢启动：每个成功请求 +1，即每完成一个窗口上限翻倍
+                self.limit = min(self.max_limit, self.limit + 1.0)
+            else:
+                # 每完成约一个窗口（limit 个请求）上限 +1
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        if not throttled:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency
+
+
+class LimiterTicket:
+    """一次请求的凭据，用于在请求结束后上报真实 token 用量。"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def record_response(self, response: Any) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        total = usage.get("total_tokens") if isinstance(usage, dict) else None
+        if isinstance(total, int):
+            self.actual_tokens = total
+
+
+class ProviderLimiter:
+    """单个供应商的 RPM/TPM 令牌桶 + 自适应并发控制器。"""
+
+    def __init__(self, provider: str, rpm: float, tpm: float,
+                 initial_concurrency: int = LLM_INITIAL_INFLIGHT,
+                 min_concurrency: int = LLM_MIN_INFLIGHT,
+                 max_concurrency: int = LLM_MAX_INFLIGHT):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrencyLimiter(initial_concurrency, min_concurrency, max_concurrency)
+        self.queued = 0
+        self.total_requests = 0
+        self.throttled_requests = 0
+        self.failed_requests = 0
+        self.total_queue_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int = 0):
+        """获取一个请求名额；退出时根据结果调整并发上限。"""
+        enqueued_at = time.monotonic()
+        self.queued += 1
+        try:
+            await self.concurrency.acquire()
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+            except BaseException:
+                await self.concurrency.release(0.0, False)
+                raise
+        finally:
+            self.queued -= 1
+
+        started_at = time.monotonic()
+        self.total_queue_wait += started_at - enqueued_at
+        self.total_requests += 1
+        ticket = LimiterTicket(estimated_tokens)
+        throttled = False
+        try:
+            yield ticket
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            if throttled:
+                self.throttled_requests += 1
+            else:
+                self.failed_requests += 1
+            raise
+        finally:
+            await self.concurrency.release(time.monotonic() - started_at, throttled)
+            if ticket.actual_tokens is not None:
+                self.tokens.adjust(ticket.actual_tokens - estimated_tokens)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "queue_depth": self.queued,
+            "in_flight": self.concurrency.in_flight,
+            "concurrency_limit": int(self.concurrency.limit),
+            "latency_ewma_s": round(self.concurrency.latency_ewma or 0.0, 3),
+            "total_requests": self.total_requests,
+            "throttled_requests": self.throttled_requests,
+            "failed_requests": self.failed_requests,
+            "avg_queue_wait_s": round(self.total_queue_wait / self.total_requests, 3) if self.total_requests else 0.0,
+            "rpm_available": None if self.requests.unlimited else round(self.requests.tokens, 1),
+            "tpm_available": None if self.tokens.unlimited else round(self.tokens.tokens, 1),
+        }
+
+
+def _provider_limits(provider: str):
+    default_rpm, default_tpm = DEFAULT_PROVIDER_LIMITS.get(provider, (0, 0))
+    key = provider.upper()
+    rpm = float(os.getenv(f"LLM_RPM_{key}", default_rpm))
+    tpm = float(os.getenv(f"LLM_TPM_{key}", default_tpm))
+    return rpm, tpm
+
+
+# asyncio 原语需要在事件循环内创建，这里按事件循环懒加载各供应商的限流器
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ProviderLimiter]]" = weakref.WeakKeyDictionary()
+
+
+def get_rate_limiter(provider: str) -> ProviderLimiter:
+    """返回当前事件循环上指定供应商的共享限流器。"""
+    loop = asyncio.get_running_loop()
+    limiters = _limiters.setdefault(loop, {})
+    limiter = limiters.get(provider)
+    if limiter is None:
+        rpm, tpm = _provider_limits(provider)
+        limiter = ProviderLimiter(provider, rpm, tpm)
+        limiters[provider] = limiter
+        logger.info(f"初始化 {provider} 限流器: RPM={rpm or '不限'}, TPM={tpm or '不限'}, 并发上限={LLM_MAX_INFLIGHT}")
+    return limiter
+
+
+def get_limiter_metrics() -> Dict[str, Dict[str, Any]]:
+    """返回当前事件循环上所有供应商限流器的指标。"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return {}
+    return {provider: limiter.metrics() for provider, limiter in _limiters.get(loop, {}).items()}
@@ -0,0 +1,147 @@
+# retry.py
+"""
+LLM 调用的非阻塞重试策略。
+
+- 指数退避 + 全抖动（full jitter）：第 n 次重试前等待 uniform(0, min(max_delay, base_delay * 2**n)) 秒，
+  使用 asyncio.sleep，不会阻塞事件循环；
+- 重试预算：每次首次调用向预算存入 ratio 个额度，每次重试消耗 1 个额度，
+  供应商大面积故障时重试流量最多只放大到 (1 + ratio) 倍，不会形成重试风暴；
+- 错误分类：限流/5xx/超时/连接错误可重试；鉴权失败、请求参数错误等 4xx 以及编程错误直接失败。
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from backend.rate_limiter import get_status_code, is_throttling_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 明确不可重试的异常类型（重试也不会成功）
+FATAL_EXCEPTION_TYPES = (
+    TypeError,
+    AttributeError,
+    NameError,
+    NotImplementedError,
+    PermissionError,
+)
+RETRYABLE_NAME_MARKERS = ("timeout", "connect", "network", "temporarily", "unavailable")
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """判断一次失败的 LLM 调用是否值得重试。"""
+    if isinstance(exc, asyncio.CancelledError):
+        return False
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if is_throttling_error(exc):
+        return True
+    status = get_status_code(exc)
+    if status is not None and 400 <= status < 500:
+        # 401/403/400/404 等：密钥错误或请求本身有问题，重试无意义
+        return False
+    if isinstance(exc, FATAL_EXCEPTION_TYPES):
+        return False
+    name = type(exc).__name__.lower()
+    if any(marker in name for marker in RETRYABLE_NAME_MARKERS):
+        return True
+    # 其余未知错误（例如模型输出无法解析）保持原有行为：允许重试
+    return True
+
+
+class RetryBudget:
+    """按请求量比例累积的重试额度，另有每秒最低额度保证低流量时也能重试。"""
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, capacity: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.balance = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.capacity, self.balance + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.balance >= 1.0:
+            self.balance -= 1.0
+            return True
+        return False
+
+
+@dataclass
+class RetryPolicy:
+    """重试参数。"""
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    budget: Optional[RetryBudget] = None
+
+    def backoff(self, retry_index: int) -> float:
+        """第 retry_index 次重试（从 0 开始）前的等待时间：全抖动指数退避。"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** retry_index))
+        return random.uniform(0, ceiling)
+
+
+# 所有批改节点共享同一个重试预算
+LLM_RETRY_BUDGET = RetryBudget(ratio=float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2")))
+LLM_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0")),
+    max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "30.0")),
+    budget=LLM_RETRY_BUDGET,
+)
+
+
+async def retry_async(
+    func: Callable[[], Awaitable[T]],
+    policy: RetryPolicy = LLM_RETRY_POLICY,
+    description: str = "LLM call",
+) -> T:
+    """
+    按重试策略执行异步调用。
+
+    Args:
+        func: 无参协程工厂，每次尝试都会重新调用它。
+        policy: 重试策略。
+        description: 日志中使用的调用描述。
+
+    Returns:
+        func 的返回值。
+
+    Raises:
+        最后一次失败的异常；不可重试错误或重试预算耗尽时立即抛出。
+    """
+    if policy.budget is not None:
+        policy.budget.deposit()
+
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            attempt += 1
+            if attempt >= policy.max_attempts:
+                logger.warning(f"{description} 第 {attempt} 次尝试失败，已达最大重试次数: {e}")
+                raise
+            if not is_retryable_error(e):
+                logger.warning(f"{description} 失败且不可重试: {e}")
+                raise
+            if policy.budget is not None and not policy.budget.try_withdraw():
+                logger.warning(f"{description} 失败，重试预算已耗尽: {e}")
+                raise
+            delay = policy.backoff(attempt - 1)
+            logger.warning(f"{description} 第 {attempt} 次尝试失败，{delay:.2f}s 后重试: {e}")
+            await asyncio.sleep(delay)
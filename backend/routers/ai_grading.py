@@ -1,19 +1,29 @@
 import uuid
 import asyncio
+import hashlib
+import json
 import logging
+import os
 import time
-from typing import Dict, Any
-from fastapi import APIRouter, Depends
+from typing import Dict, Any, List, Set, Tuple, Optional, Callable, Awaitable
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from functools import lru_cache
-from collections import OrderedDict
 
-from backend.dependencies import get_problem_store, get_student_store, get_llm
+from backend.dependencies import get_problem_store, get_student_store, get_llm, MODEL_PROVIDER
 from backend.models import Correction
+from backend.job_store import get_job_store, STATUS_COMPLETED, STATUS_ERROR
+from backend.job_events import notify_job_update, wait_for_job_update
+from backend.llm_failures import bind_failure_context
+from backend.grading_cache import (
+    GRADING_CACHE_ENABLED, grading_cache, make_cache_key, is_cacheable, normalize_answer,
+    get_prompt_template_version, get_model_name
+)
 from backend.correct.calc import calc_node
 from backend.correct.concept import concept_node
 from backend.correct.proof import proof_node
 from backend.correct.programming import programming_node
+from backend.correct.batch import batch_grade_node, get_batch_size
 # from backend.dependencies import OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL
 
 # Setup logger
@@ -24,41 +34,39 @@ router = APIRouter(
     tags=["ai_grading"]
 )
 
-# Store for grading results with timestamp for cleanup
-GRADING_RESULTS: Dict[str, Dict[str, Any]] = OrderedDict()
-# Store for completed grading results (history)
-HISTORY_RESULTS: Dict[str, Dict[str, Any]] = OrderedDict()
-# Maximum number of results to keep
-MAX_RESULTS = 1000
-# Time to keep results in seconds (24 hours)
-RESULT_TTL = 24 * 60 * 60
+# Persistent store for grading jobs and their results (survives restarts; single worker only,
+# problem/student stores and ACTIVE_JOBS below are still in-process memory)
+job_store = get_job_store()
+# Maximum number of jobs to keep
+MAX_JOBS = 1000
+# Time to keep jobs and their results in seconds (30 days)
+JOB_TTL = 30 * 24 * 60 * 60
+# Pending jobs with no progress for this many seconds are treated as lost (e.g. killed by a restart)
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "600"))
+INTERRUPTED_JOB_MESSAGE = "Grading was interrupted (server restarted or task lost). Please start grading again."
 
 # Add a function to get all job IDs for debugging
 def get_all_job_ids():
-    return list(GRADING_RESULTS.keys())
+    return list(job_store.list_jobs().keys())
 
 @router.delete("/discard_job/{job_id}")
-def discard_job(job_id: str):
+async def discard_job(job_id: str):
     """
     Immediately discard a job (e.g., when user navigates away before completion).
     """
     # Remove from active jobs
     ACTIVE_JOBS.discard(job_id)
     
-    # Remove from grading results
-    if job_id in GRADING_RESULTS:
-        GRADING_RESULTS.pop(job_id, None)
-    
-    # Remove from job metadata
-    if job_id in JOB_METADATA:
-        JOB_METADATA.pop(job_id, None)
+    # Remove the job and any stored results
+    await asyncio.to_thread(job_store.delete_job, job_id)
+    notify_job_update(job_id)
     
     return {"status": "success", "message": f"Job {job_id} has been discarded."}
 
 # Cache for LLM clients to avoid repeated initialization
-LLM_CLIENT_CACHE: Dict[int, Any] = {}
+LLM_CLIENT_CACHE: Dict[str, Any] = {}
 # Timestamps for LLM client cache entries
-LLM_CACHE_TIMESTAMPS: Dict[int, float] = {}
+LLM_CACHE_TIMESTAMPS: Dict[str, float] = {}
 # Time to keep LLM clients in cache (1 hour)
 LLM_CACHE_TTL = 60 * 60
 
@@ -66,42 +74,56 @@ LLM_CACHE_TTL = 60 * 60
 ACTIVE_JOBS = set()
 MAX_CONCURRENT_JOBS = 10
 
-# Store job metadata for history tracking
-JOB_METADATA = OrderedDict()
-MAX_METADATA = 1000
-METADATA_TTL = 30 * 24 * 60 * 60  # 30 days
+# Seconds between job store checks in the progress event stream (fallback for missed notifications)
+JOB_EVENTS_POLL_INTERVAL = 2.0
+# Seconds between keep-alive comments on an idle event stream
+JOB_EVENTS_KEEPALIVE = 15.0
 
-async def cleanup_old_metadata():
-    """Remove old job metadata to prevent memory leaks."""
-    current_time = time.time()
-    expired_keys = []
-    
-    # Find expired metadata
-    for job_id, metadata in JOB_METADATA.items():
-        timestamp = metadata.get('timestamp', 0)
-        time_diff = current_time - timestamp
-        logger.info(f"Checking metadata {job_id}: current_time={current_time}, timestamp={timestamp}, time_diff={time_diff}, METADATA_TTL={METADATA_TTL}")
-        if time_diff > METADATA_TTL:
-            expired_keys.append(job_id)
-    
-    # Remove expired metadata
-    for job_id in expired_keys:
-        logger.info(f"Removing expired metadata {job_id}")
-        JOB_METADATA.pop(job_id, None)
-    
-    # Remove excess metadata if we're over the limit
-    while len(JOB_METADATA) > MAX_METADATA:
-        # Remove the oldest metadata (OrderedDict maintains insertion order)
-        removed_item = JOB_METADATA.popitem(last=False)
-        logger.info(f"Removed excess metadata {removed_item[0]}")
-
-# Cache for processed rubrics to avoid redundant processing
-@lru_cache(maxsize=128)
-def get_processed_rubric(q_id: str, rubric_text: str) -> str:
-    """Cache processed rubrics to avoid redundant processing."""
-    # In a real implementation, this could do more complex processing
-    # For now, we just return the rubric as-is but cache it
-    return rubric_text
+async def update_job_store(method: Callable[..., Any], job_id: str, *args):
+    """Run a job store write off the event loop and wake the job's progress subscribers."""
+    await asyncio.to_thread(method, job_id, *args)
+    notify_job_update(job_id)
+
+async def fail_stale_jobs():
+    """Mark pending jobs that no running task in this process will ever finish as errors."""
+    try:
+        job_ids = await asyncio.to_thread(job_store.fail_stale_jobs, JOB_STALE_AFTER,
+                                          INTERRUPTED_JOB_MESSAGE, set(ACTIVE_JOBS))
+    except Exception as e:
+        logger.warning(f"Failed to mark stale grading jobs: {e}")
+        return
+    for job_id in job_ids:
+        notify_job_update(job_id)
+
+async def recover_interrupted_jobs():
+    """At startup: fail jobs left pending by the previous process, then re-check once the
+    threshold has passed for jobs that were still making progress right before the restart."""
+    await fail_stale_jobs()
+
+    async def recheck():
+        await asyncio.sleep(JOB_STALE_AFTER)
+        await fail_stale_jobs()
+
+    asyncio.create_task(recheck())
+
+async def cleanup_old_jobs():
+    """Remove expired or excess finished jobs (with their results) from the job store."""
+    await fail_stale_jobs()
+    try:
+        await asyncio.to_thread(job_store.cleanup, JOB_TTL, MAX_JOBS)
+    except Exception as e:
+        logger.warning(f"Failed to clean up old grading jobs: {e}")
+
+# Map Chinese question types to internal English types for processing
+TYPE_MAPPING = {
+    "概念题": "concept",
+    "其他": "concept",
+    "其它": "concept",
+    "计算题": "calculation", 
+    "证明题": "proof",
+    "推理题": "proof", # 推理题和证明题可以使用相同的处理节点
+    "编程题": "programming"
+}
 
 class GradingRequest(BaseModel):
     student_id: str
@@ -110,52 +132,105 @@ class BatchGradingRequest(BaseModel):
     # Empty for now, but could include options for batch grading
     pass
 
+class JobLookupRequest(BaseModel):
+    job_ids: List[str]
+
+# Maximum number of job_ids in one batch status/summary lookup
+MAX_JOB_LOOKUP = 500
+
 def get_cached_llm():
-    """Get a cached LLM client instance to avoid repeated initialization."""
-    task_id = id(asyncio.current_task())
+    """Get a shared LLM client instance to avoid repeated initialization.
+
+    Calls go through the async invocation layer (``ainvoke``), so a single client
+    can serve every concurrent grading task; the cache is keyed by provider.
+    """
+    cache_key = MODEL_PROVIDER
     current_time = time.time()
     
     # Clean up expired cache entries
     expired_keys = []
-    for tid, timestamp in LLM_CACHE_TIMESTAMPS.items():
+    for key, timestamp in LLM_CACHE_TIMESTAMPS.items():
         if current_time - timestamp > LLM_CACHE_TTL:
-            expired_keys.append(tid)
-    
-    for tid in expired_keys:
-        LLM_CLIENT_CACHE.pop(tid, None)
-        LLM_CACHE_TIMESTAMPS.pop(tid, None)
-    
-    if task_id not in LLM_CLIENT_CACHE:
-        # # Import here to avoid circular imports
-        # from langchain_openai import ChatOpenAI
-        # # API keys are now imported from dependencies.py
-        # # Use the model from dependencies
-        # model_name = OPENAI_MODEL if OPENAI_MODEL else "glm-4-plus"
-        
-        # LLM_CLIENT_CACHE[task_id] = ChatOpenAI(
-        #     model=model_name,
-        #     temperature=0.0,
-        #     api_key=OPENAI_API_KEY,
-        #     base_url=OPENAI_API_BASE,
-        # )
-        
+            expired_keys.append(key)
+    
+    for key in expired_keys:
+        LLM_CLIENT_CACHE.pop(key, None)
+        LLM_CACHE_TIMESTAMPS.pop(key, None)
+    
+    if cache_key not in LLM_CLIENT_CACHE:
         try:
-            # logger.info(f"Initializing cached LLM client for task {task_id}")
-            LLM_CLIENT_CACHE[task_id] = get_llm()
+            LLM_CLIENT_CACHE[cache_key] = get_llm()
         except Exception as e:
             logger.error(f"Failed to initialize LLM client: {e}")
             # 如果初始化失败，这里可能需要抛出异常或者返回 None，视您的错误处理逻辑而定
             raise e
     
     # Update timestamp for this entry
-    LLM_CACHE_TIMESTAMPS[task_id] = current_time
-    return LLM_CLIENT_CACHE[task_id]
+    LLM_CACHE_TIMESTAMPS[cache_key] = current_time
+    return LLM_CLIENT_CACHE[cache_key]
+
+def make_empty_answer_correction(q_id: str, answer_type: str, max_score: float = 10.0) -> Correction:
+    """Deterministic zero-score correction for a skipped (empty) answer."""
+    return Correction(
+        q_id=q_id,
+        type=answer_type or "概念题",
+        score=0.0,
+        max_score=max_score,
+        confidence=1.0,
+        comment="No answer submitted.",
+        steps=[]
+    )
+
+def answer_fingerprint(answer: Dict[str, Any]) -> Tuple[str, str]:
+    """Group key for identical answers to the same question within a batch."""
+    q_id = answer.get("q_id")
+    internal_type = TYPE_MAPPING.get(answer.get("type"), "concept")
+    normalized = normalize_answer(answer.get("content"), internal_type)
+    return q_id, hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def build_cache_key(problem: Dict[str, Any], internal_type: str, content: Optional[str],
+                    batched: bool = False) -> Optional[str]:
+    """Content-addressed grading cache key for an answer (None when caching is disabled).
+
+    ``batched`` keys results graded with the batch prompt, whose version also covers batch.txt.
+    """
+    if not GRADING_CACHE_ENABLED:
+        return None
+    return make_cache_key(
+        problem.get("stem", ""), problem.get("criterion", ""), content or "", internal_type,
+        get_prompt_template_version(internal_type, batched), get_model_name()
+    )
+
+async def lookup_cached_correction(cache_keys: List[Optional[str]], q_id: str, answer_type: str) -> Optional[Correction]:
+    """Return a cached correction for this answer (first key that hits), re-labelled for the given question."""
+    cache_keys = [cache_key for cache_key in cache_keys if cache_key]
+    if not cache_keys:
+        return None
+    try:
+        cached = await grading_cache.get(*cache_keys)
+    except Exception as e:
+        logger.warning(f"Grading cache lookup failed for {q_id}: {e}")
+        return None
+    if cached is None:
+        return None
+    logger.info(f"Grading cache hit for question {q_id}")
+    return cached.model_copy(update={"q_id": q_id, "type": answer_type})
+
+async def store_cached_correction(cache_key: Optional[str], correction: Correction):
+    """Store a real LLM grading result in the cache (fallback results are skipped)."""
+    if not cache_key or not is_cacheable(correction):
+        return
+    try:
+        await grading_cache.put(cache_key, correction)
+    except Exception as e:
+        logger.warning(f"Failed to store grading cache entry for {correction.q_id}: {e}")
 
 async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str, Any]) -> Correction:
     """Process a single student answer and return the correction result."""
     q_id = answer.get("q_id")
     answer_type = answer.get("type")
     content = answer.get("content")
+    bind_failure_context(q_id=q_id)
     
     # Get the problem rubric
     problem = problem_store.get(q_id)
@@ -172,9 +247,7 @@ async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str
             steps=[]
         )
         
-    # Use cached rubric processing
-    rubric_raw = problem.get("criterion", "")
-    rubric = get_processed_rubric(q_id, rubric_raw)
+    rubric = problem.get("criterion", "")
     max_score = 10.0  # Default max score
     
     # Prepare answer unit based on type
@@ -185,19 +258,20 @@ async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str
         "correct_ans": "No answers provided. Please think deeply and derive correct answers based on the problem!"
     }
     
-    # Map Chinese question types to internal English types for processing
-    type_mapping = {
-        "概念题": "concept",
-        "其他": "concept",
-        "其它": "concept",
-        "计算题": "calculation", 
-        "证明题": "proof",
-        "推理题": "proof", # 推理题和证明题可以使用相同的处理节点
-        "编程题": "programming"
-    }
-    
     # Get internal type for processing
-    internal_type = type_mapping.get(answer_type, "concept")
+    internal_type = TYPE_MAPPING.get(answer_type, "concept")
+    
+    # Skipped questions score zero without an LLM call
+    if not (content or "").strip():
+        return make_empty_answer_correction(q_id, answer_type, max_score)
+    
+    # Content-addressed cache: unchanged (stem, rubric, answer) triples skip the LLM entirely
+    # A result graded in a batch is as good as one graded alone, so both keys are tried
+    cache_key = build_cache_key(problem, internal_type, content)
+    cached = await lookup_cached_correction(
+        [cache_key, build_cache_key(problem, internal_type, content, batched=True)], q_id, answer_type)
+    if cached is not None:
+        return cached
     
     # Get cached LLM client
     llm = get_cached_llm()
@@ -221,8 +295,8 @@ async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str
         elif internal_type == "programming":
             answer_unit["code"] = content
             answer_unit["language"] = "python"  # Default language
-            answer_unit["test_cases"] = []  # Empty test cases for now
-            correction = await programming_node(answer_unit, rubric, max_score, llm)
+            answer_unit["test_cases"] = []  # Filled from the problem's shared test suite
+            correction = await programming_node(answer_unit, rubric, max_score, llm, problem=problem)
         
         else:
             # For other types, create a default correction
@@ -239,6 +313,7 @@ async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str
         # Ensure the type in the correction is the original Chinese type
         if correction:
             correction.type = answer_type
+            await store_cached_correction(cache_key, correction)
         return correction
 
     except Exception as e:
@@ -254,12 +329,83 @@ async def process_student_answer(answer: Dict[str, Any], problem_store: Dict[str
             steps=[]
         )
 
-async def process_student_submission(student: Dict[str, Any], problem_store: Dict[str, Any]) -> Dict[str, Any]:
-    """Process all answers for a single student and return the results."""
+async def grade_answer_batch(answers: List[Dict[str, Any]], problem_store: Dict[str, Any]) -> List[Correction]:
+    """Grade several answers to the same question, packing cache misses into one LLM call.
+
+    Empty and cached answers are resolved locally; answers the batch call could not
+    grade (missing or invalid results) are retried one by one with the regular node.
+    """
+    if len(answers) == 1:
+        return [await process_student_answer(answers[0], problem_store)]
+    
+    q_id = answers[0].get("q_id")
+    bind_failure_context(q_id=q_id)
+    problem = problem_store.get(q_id)
+    results: List[Optional[Correction]] = [None] * len(answers)
+    
+    if problem:
+        max_score = 10.0  # Default max score
+        pending = []
+        for i, answer in enumerate(answers):
+            content = answer.get("content")
+            answer_type = answer.get("type")
+            internal_type = TYPE_MAPPING.get(answer_type, "concept")
+            if not (content or "").strip():
+                results[i] = make_empty_answer_correction(q_id, answer_type, max_score)
+                continue
+            # Batch results are stored under their own key, whose version includes batch.txt
+            cache_key = build_cache_key(problem, internal_type, content, batched=True)
+            cached = await lookup_cached_correction(
+                [build_cache_key(problem, internal_type, content), cache_key], q_id, answer_type)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append((i, answer, cache_key))
+        
+        if len(pending) > 1:
+            answer_type = pending[0][1].get("type")
+            try:
+                batch_corrections = await batch_grade_node(
+                    TYPE_MAPPING.get(answer_type, "concept"),
+                    q_id,
+                    answer_type,
+                    problem.get("stem", ""),
+                    problem.get("criterion", ""),
+                    [answer.get("content") for _, answer, _ in pending],
+                    max_score,
+                    get_cached_llm()
+                )
+            except Exception as e:
+                logger.error(f"Batch grading failed for question {q_id}: {e}")
+                batch_corrections = [None] * len(pending)
+            for (i, answer, cache_key), correction in zip(pending, batch_corrections):
+                if correction is not None:
+                    correction.type = answer.get("type")
+                    results[i] = correction
+                    await store_cached_correction(cache_key, correction)
+    
+    # Singleton retry for everything the batch could not resolve
+    missing = [i for i, correction in enumerate(results) if correction is None]
+    if missing:
+        singles = await asyncio.gather(*(process_student_answer(answers[i], problem_store) for i in missing))
+        for i, correction in zip(missing, singles):
+            results[i] = correction
+    return results
+
+async def process_student_submission(student: Dict[str, Any], problem_store: Dict[str, Any],
+                                     grade_answer: Optional[Callable[[Dict[str, Any]], Awaitable[Correction]]] = None) -> Dict[str, Any]:
+    """Process all answers for a single student and return the results.
+
+    ``grade_answer`` overrides how a single answer is graded; batch jobs use it to
+    share one grading call between identical answers from different students.
+    """
+    if grade_answer is None:
+        grade_answer = lambda answer: process_student_answer(answer, problem_store)
     student_id = student.get("stu_id")
     student_name = student.get("stu_name", f"Student {student_id}")
     if not student_id:
         return None
+    bind_failure_context(student_id=student_id)
         
     logger.info(f"Processing submission for student {student_id}")
     
@@ -268,7 +414,7 @@ async def process_student_submission(student: Dict[str, Any], problem_store: Dic
     
     # Process answers concurrently for each student
     tasks = [
-        process_student_answer(answer, problem_store) 
+        grade_answer(answer)
         for answer in student_answers
     ]
     
@@ -319,6 +465,7 @@ async def process_student_submission(student: Dict[str, Any], problem_store: Dic
 async def run_grading_task(job_id: str, student_id: str, problem_store: Dict, student_store: Dict[str, Any]):
     """Run the grading task for a specific student."""
     logger.info(f"Grading task {job_id} started for student {student_id}")
+    bind_failure_context(job_id=job_id, student_id=student_id)
     
     try:
         # MODIFICATION: Changed from list iteration to direct dictionary lookup for O(1) efficiency.
@@ -326,37 +473,23 @@ async def run_grading_task(job_id: str, student_id: str, problem_store: Dict, st
         
         if not student_data:
             logger.error(f"Student {student_id} not found in student store")
-            GRADING_RESULTS[job_id] = {
-                "status": "error",
-                "message": f"Student {student_id} not found"
-            }
+            await update_job_store(job_store.update_job, job_id, STATUS_ERROR, f"Student {student_id} not found")
             return
+        
+        await update_job_store(job_store.start_job, job_id, 1)
             
         # Process the student's submission using the existing parallel function
         result = await process_student_submission(student_data, problem_store)
 
-        # Store the results with timestamp
-        GRADING_RESULTS[job_id] = {
-            "status": "completed",
+        # Store the results and mark the job as completed
+        await update_job_store(job_store.save_results, job_id, [{
             "student_id": student_id,
             "student_name": student_data.get("stu_name", f"Student {student_id}"),
-            "corrections": result.get("corrections", []),
-            "timestamp": time.time()
-        }
-        
-        # Update job metadata
-        if job_id in JOB_METADATA:
-            JOB_METADATA[job_id].update({
-                "status": "completed",
-                "completed_at": time.time(),
-                "student_id": student_id
-            })
-        
-        # Move completed results to history storage
-        if job_id in GRADING_RESULTS:
-            HISTORY_RESULTS[job_id] = GRADING_RESULTS[job_id].copy()
+            "corrections": result.get("corrections", [])
+        }])
+        await update_job_store(job_store.update_job, job_id, STATUS_COMPLETED)
         
-        # Only clean up old results after a delay to ensure pending jobs are not removed
+        # Only clean up old jobs after a delay to ensure pending jobs are not removed
         # Clean up will happen in a separate task to avoid blocking the current task
         asyncio.create_task(cleanup_after_delay())
         
@@ -365,174 +498,110 @@ async def run_grading_task(job_id: str, student_id: str, problem_store: Dict, st
     except Exception as e:
         logger.error(f"Error in grading task {job_id}: {e}")
         
-        # Store error results with timestamp
-        GRADING_RESULTS[job_id] = {
-            "status": "error",
-            "message": str(e),
-            "timestamp": time.time()
-        }
+        # Store the error on the job
+        await update_job_store(job_store.update_job, job_id, STATUS_ERROR, str(e))
         
-        # Update job metadata
-        if job_id in JOB_METADATA:
-            JOB_METADATA[job_id].update({
-                "status": "error",
-                "completed_at": time.time(),
-                "error": str(e)
-            })
-        
-        # Only clean up old results after a delay to ensure pending jobs are not removed
+        # Only clean up old jobs after a delay to ensure pending jobs are not removed
         # Clean up will happen in a separate task to avoid blocking the current task
         asyncio.create_task(cleanup_after_delay())
     finally:
         # Remove job from active jobs
         ACTIVE_JOBS.discard(job_id)
 
-async def cleanup_old_results():
-    """Remove old grading results to prevent memory leaks."""
-    current_time = time.time()
-    expired_keys = []
-    
-    # Find expired results
-    for job_id, result in GRADING_RESULTS.items():
-        # Don't clean up pending jobs
-        if result.get('status') == 'pending':
-            continue
-            
-        timestamp = result.get('timestamp', 0)
-        time_diff = current_time - timestamp
-        logger.info(f"Checking job {job_id}: current_time={current_time}, timestamp={timestamp}, time_diff={time_diff}, RESULT_TTL={RESULT_TTL}")
-        if time_diff > RESULT_TTL:
-            expired_keys.append(job_id)
-    
-    # Remove expired results
-    for job_id in expired_keys:
-        logger.info(f"Removing expired job {job_id}")
-        GRADING_RESULTS.pop(job_id, None)
-    
-    # Remove excess results if we're over the limit
-    while len(GRADING_RESULTS) > MAX_RESULTS:
-        # Remove the oldest result (OrderedDict maintains insertion order)
-        # But don't remove pending jobs
-        oldest_key = None
-        for key in list(GRADING_RESULTS.keys()):
-            if GRADING_RESULTS[key].get('status') != 'pending':
-                oldest_key = key
-                break
-        
-        if oldest_key is None:
-            # All jobs are pending, don't remove any
-            break
-            
-        removed_item = GRADING_RESULTS.popitem(last=False)
-        logger.info(f"Removed excess job {removed_item[0]}")
-
 async def cleanup_after_delay():
-    """Clean up old results after a delay to ensure pending jobs are not removed immediately."""
+    """Clean up old jobs after a delay to ensure pending jobs are not removed immediately."""
     # Wait for 10 seconds before cleaning up to ensure pending jobs are not removed
     await asyncio.sleep(10)
-    await cleanup_old_results()
-    await cleanup_old_metadata()
-    await cleanup_old_history()
-
-async def cleanup_old_history():
-    """Remove old history results to prevent memory leaks."""
-    current_time = time.time()
-    expired_keys = []
-    
-    # Find expired history results
-    for job_id, result in HISTORY_RESULTS.items():
-        timestamp = result.get('timestamp', 0)
-        time_diff = current_time - timestamp
-        logger.info(f"Checking history {job_id}: current_time={current_time}, timestamp={timestamp}, time_diff={time_diff}, RESULT_TTL={RESULT_TTL}")
-        if time_diff > RESULT_TTL:
-            expired_keys.append(job_id)
-    
-    # Remove expired history results
-    for job_id in expired_keys:
-        logger.info(f"Removing expired history {job_id}")
-        HISTORY_RESULTS.pop(job_id, None)
-    
-    # Remove excess history results if we're over the limit
-    while len(HISTORY_RESULTS) > MAX_RESULTS:
-        # Remove the oldest history result (OrderedDict maintains insertion order)
-        removed_item = HISTORY_RESULTS.popitem(last=False)
-        logger.info(f"Removed excess history {removed_item[0]}")
+    await cleanup_old_jobs()
 
 async def run_batch_grading_task(job_id: str, problem_store: Dict, student_store: Dict[str, Any]):
     """Run the grading task for all students using parallel processing."""
     logger.info(f"Batch grading task {job_id} started for all students")
+    bind_failure_context(job_id=job_id)
     
     try:
         student_count = len(student_store)
         logger.info(f"Found {student_count} students to process")
         
-        all_results = []
+        students = [student for student in student_store.values() if student.get("stu_id")]
+        await update_job_store(job_store.start_job, job_id, len(students))
         
-        # Create tasks for all students
-        tasks = [
-            process_student_submission(student, problem_store)
-            for student in student_store.values() 
-            if student.get("stu_id")
-        ]
+        # Pre-pass: grade each distinct (q_id, normalized answer) once and fan the
+        # correction out to every student who submitted it
+        representatives: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        submitters: Dict[Tuple[str, str], List[str]] = {}
+        answer_count = 0
+        for student in students:
+            for answer in student.get("stu_ans", []):
+                answer_count += 1
+                key = answer_fingerprint(answer)
+                representatives.setdefault(key, answer)
+                submitters.setdefault(key, []).append(student.get("stu_id"))
         
-        # Gather all results
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        async def grade_chunk(answers: List[Dict[str, Any]], student_ids: Set[str]) -> List[Correction]:
+            # Each chunk runs in its own task: tag its failure records with every student who shares these answers
+            bind_failure_context(student_id=student_ids)
+            return await grade_answer_batch(answers, problem_store)
         
-        # Handle results and exceptions
-        for result in results:
+        # Pack the representatives of each question into multi-answer grading calls
+        by_question: Dict[str, List[Tuple[Tuple[str, str], Dict[str, Any]]]] = {}
+        for key, answer in representatives.items():
+            by_question.setdefault(key[0], []).append((key, answer))
+        
+        group_tasks: Dict[Tuple[str, str], Tuple[asyncio.Task, int]] = {}
+        for q_id, items in by_question.items():
+            batch_size = get_batch_size(TYPE_MAPPING.get(items[0][1].get("type"), "concept"))
+            for start in range(0, len(items), batch_size):
+                chunk = items[start:start + batch_size]
+                student_ids = {student_id for key, _ in chunk for student_id in submitters[key]}
+                chunk_task = asyncio.ensure_future(grade_chunk([answer for _, answer in chunk], student_ids))
+                for index, (key, _) in enumerate(chunk):
+                    group_tasks[key] = (chunk_task, index)
+        logger.info(f"Deduplicated {answer_count} answers into {len(representatives)} grading groups")
+        
+        async def grade_shared_answer(answer: Dict[str, Any]) -> Correction:
+            chunk_task, index = group_tasks[answer_fingerprint(answer)]
+            correction = (await chunk_task)[index]
+            # Deep copy: students with the same answer must not share the steps list
+            return correction.model_copy(deep=True, update={"q_id": answer.get("q_id"),
+                                                            "type": answer.get("type") or correction.type})
+        
+        async def grade_and_record(student: Dict[str, Any]) -> bool:
+            # Store each student's corrections as soon as they are ready, so one slow
+            # student does not hold back everyone else's results
             try:
-                if isinstance(result, Exception):
-                    logger.error(f"Error processing student: {result}")
-                elif result:
-                    all_results.append(result)
-                    logger.info(f"Processed student result: {result.get('student_id', 'unknown')}")
+                result = await process_student_submission(student, problem_store, grade_answer=grade_shared_answer)
             except Exception as e:
-                logger.error(f"Error handling student result: {e}")
-    
-        # Store the results with timestamp
-        GRADING_RESULTS[job_id] = {
-            "status": "completed",
-            "results": all_results,
-            "timestamp": time.time()
-        }
-        
-        # Update job metadata
-        if job_id in JOB_METADATA:
-            JOB_METADATA[job_id].update({
-                "status": "completed",
-                "completed_at": time.time(),
-                "student_count": len(all_results)
-            })
+                logger.error(f"Error processing student {student.get('stu_id', 'unknown')}: {e}")
+                await update_job_store(job_store.record_failure, job_id)
+                return False
+            if not result:
+                await update_job_store(job_store.record_failure, job_id)
+                return False
+            await update_job_store(job_store.save_results, job_id, [result])
+            logger.info(f"Processed student result: {result.get('student_id', 'unknown')}")
+            return True
         
-        # Move completed results to history storage
-        if job_id in GRADING_RESULTS:
-            HISTORY_RESULTS[job_id] = GRADING_RESULTS[job_id].copy()
+        # Grade all students concurrently
+        recorded = await asyncio.gather(*(grade_and_record(student) for student in students))
+        processed_count = sum(recorded)
+    
+        # Mark the job as completed
+        await update_job_store(job_store.update_job, job_id, STATUS_COMPLETED, None, processed_count)
         
-        # Only clean up old results after a delay to ensure pending jobs are not removed
+        # Only clean up old jobs after a delay to ensure pending jobs are not removed
         # Clean up will happen in a separate task to avoid blocking the current task
         asyncio.create_task(cleanup_after_delay())
         
-        logger.info(f"Batch grading task {job_id} completed for all students. Processed {len(all_results)} students.")
+        logger.info(f"Batch grading task {job_id} completed for all students. Processed {processed_count} students.")
         
     except Exception as e:
         logger.error(f"Error in batch grading task {job_id}: {e}")
         
-        # Store error results with timestamp
-        GRADING_RESULTS[job_id] = {
-            "status": "error",
-            "message": str(e),
-            "timestamp": time.time()
-        }
-        
-        # Update job metadata
-        if job_id in JOB_METADATA:
-            JOB_METADATA[job_id].update({
-                "status": "error",
-                "completed_at": time.time(),
-                "error": str(e)
-            })
+        # Store the error on the job
+        await update_job_store(job_store.update_job, job_id, STATUS_ERROR, str(e))
         
-        # Only clean up old results after a delay to ensure pending jobs are not removed
+        # Only clean up old jobs after a delay to ensure pending jobs are not removed
         # Clean up will happen in a separate task to avoid blocking the current task
         asyncio.create_task(cleanup_after_delay())
     finally:
@@ -554,25 +623,10 @@ async def start_grading(request: GradingRequest,
         }
     
     job_id = str(uuid.uuid4())
-    GRADING_RESULTS[job_id] = {
-        "status": "pending",
-        "timestamp": time.time()
-    }
+    # Register the pending job (with its metadata for history tracking)
+    await asyncio.to_thread(job_store.create_job, job_id, "student", request.student_id)
     ACTIVE_JOBS.add(job_id)
     
-    # Store job metadata
-    JOB_METADATA[job_id] = {
-        "job_id": job_id,
-        "type": "student",
-        "student_id": request.student_id,
-        "status": "pending",
-        "created_at": time.time(),
-        "timestamp": time.time()
-    }
-    
-    # Clean up old metadata
-    cleanup_old_metadata()
-    
     # Start grading in a background task
     asyncio.create_task(run_grading_task(job_id, request.student_id, problem_store, student_store))
     
@@ -593,35 +647,26 @@ async def start_batch_grading(request: BatchGradingRequest,
         }
     
     job_id = str(uuid.uuid4())
-    GRADING_RESULTS[job_id] = {
-        "status": "pending",
-        "timestamp": time.time()
-    }
+    # Register the pending job (with its metadata for history tracking)
+    await asyncio.to_thread(job_store.create_job, job_id, "batch")
     ACTIVE_JOBS.add(job_id)
     
     logger.info(f"Created new batch grading job: {job_id}")
     
-    # Store job metadata
-    JOB_METADATA[job_id] = {
-        "job_id": job_id,
-        "type": "batch",
-        "status": "pending",
-        "created_at": time.time(),
-        "timestamp": time.time()
-    }
-    
-    # Clean up old metadata
-    cleanup_old_metadata()
-    
     # Start grading in a background task
     asyncio.create_task(run_batch_grading_task(job_id, problem_store, student_store))
     
     return {"job_id": job_id}
 
 @router.get("/grade_result/{job_id}")
-def get_grading_result(job_id: str):
+def get_grading_result(job_id: str, cursor: Optional[int] = None):
     """
     Get the grading result for a job.
+    
+    Every response carries progress counters (done / failed / total / eta_seconds).
+    With ``cursor`` (start from 0) only the student results recorded after that cursor
+    are returned, even while the job is still pending; pass the returned ``cursor``
+    back on the next poll to fetch only new results.
     """
     # Handle mock jobs specially
     if job_id.startswith("MOCK_JOB_"):
@@ -632,20 +677,129 @@ def get_grading_result(job_id: str):
             "results": []  # Empty results since mock data is handled in frontend
         }
     
-    # First check current results
-    result = GRADING_RESULTS.get(job_id)
+    result = job_store.get_result(job_id, cursor)
     if result is None:
-        # If not found in current results, check history
-        result = HISTORY_RESULTS.get(job_id, {"status": "not_found", "message": "Job ID not found in results or history."})
+        result = {"status": "not_found", "message": "Job ID not found in results or history."}
     return result
 
+def make_job_event(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Small progress payload pushed to subscribers (never includes corrections)."""
+    event = {"job_id": metadata["job_id"], "status": metadata["status"]}
+    event.update(metadata.get("progress", {}))
+    if metadata.get("error"):
+        event["message"] = metadata["error"]
+    return event
+
+@router.get("/events/{job_id}")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of a job's progress.
+    
+    Emits a ``progress`` event whenever the counters change and ends with a single
+    ``completed``, ``error`` or ``not_found`` event. Events only carry status and
+    counters; fetch the results from ``/grade_result/{job_id}`` once completed.
+    """
+    async def event_stream():
+        # Ask EventSource to wait a few seconds before reconnecting
+        yield "retry: 3000\n\n"
+        last_counters = None
+        last_sent = time.monotonic()
+        while True:
+            if await request.is_disconnected():
+                break
+            metadata = await asyncio.to_thread(job_store.get_job, job_id)
+            if metadata is None:
+                yield f"event: not_found\ndata: {json.dumps({'job_id': job_id, 'status': 'not_found'})}\n\n"
+                break
+            event = make_job_event(metadata)
+            status = event["status"]
+            if status in (STATUS_COMPLETED, STATUS_ERROR):
+                yield f"event: {status}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                break
+            # The ETA drifts on its own, so only a change in the counters triggers an event
+            counters = (status, event.get("done"), event.get("failed"), event.get("total"))
+            if counters != last_counters:
+                yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                last_counters = counters
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await wait_for_job_update(job_id, JOB_EVENTS_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def make_mock_job_status(job_id: str) -> Dict[str, Any]:
+    return {"job_id": job_id, "status": "completed", "done": 0, "failed": 0, "total": 0, "eta_seconds": 0.0}
+
+def make_not_found_status(job_id: str) -> Dict[str, Any]:
+    return {"job_id": job_id, "status": "not_found"}
+
+def check_job_lookup(request: JobLookupRequest) -> List[str]:
+    if len(request.job_ids) > MAX_JOB_LOOKUP:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_JOB_LOOKUP} job_ids per request.")
+    return [job_id for job_id in dict.fromkeys(request.job_ids) if not job_id.startswith("MOCK_JOB_")]
+
+@router.get("/job_status/{job_id}")
+def get_job_status(job_id: str):
+    """
+    Get only the status and progress counters of a job (no corrections).
+    """
+    if job_id.startswith("MOCK_JOB_"):
+        return make_mock_job_status(job_id)
+    metadata = job_store.get_job(job_id)
+    return make_job_event(metadata) if metadata else make_not_found_status(job_id)
+
+@router.post("/job_status")
+def get_job_statuses(request: JobLookupRequest):
+    """
+    Get the status and progress counters of many jobs in one request.
+    """
+    found = job_store.get_jobs(check_job_lookup(request))
+    statuses = {}
+    for job_id in request.job_ids:
+        if job_id.startswith("MOCK_JOB_"):
+            statuses[job_id] = make_mock_job_status(job_id)
+        elif job_id in found:
+            statuses[job_id] = make_job_event(found[job_id])
+        else:
+            statuses[job_id] = make_not_found_status(job_id)
+    return {"jobs": statuses}
+
+@router.get("/job_summary/{job_id}")
+def get_job_summary(job_id: str):
+    """
+    Get a job's metadata with counts and aggregate scores (no corrections).
+    """
+    summary = job_store.get_summaries([job_id]).get(job_id)
+    if summary is None:
+        return {"job_id": job_id, "status": "not_found", "message": "Job ID not found."}
+    return summary
+
+@router.post("/job_summaries")
+def get_job_summaries(request: JobLookupRequest):
+    """
+    Get summaries (counts and aggregate scores) of many jobs in one request.
+    """
+    found = job_store.get_summaries(check_job_lookup(request))
+    return {
+        "jobs": {
+            job_id: found.get(job_id, {"job_id": job_id, "status": "not_found", "message": "Job ID not found."})
+            for job_id in request.job_ids
+        }
+    }
+
 @router.delete("/reset_all_grading")
 def reset_all_grading_results():
     """
     Reset all grading results (except for history records).
     """
-    global GRADING_RESULTS, ACTIVE_JOBS
-    GRADING_RESULTS = OrderedDict()
+    # Completed jobs stay in the store as history
+    job_store.clear_unfinished()
     ACTIVE_JOBS.clear()
     return {"status": "success", "message": "All grading results have been reset (history preserved)."}
 
@@ -666,7 +820,9 @@ def get_job_metadata(job_id: str):
             "message": "Mock job completed successfully"
         }
     
-    metadata = JOB_METADATA.get(job_id, {"status": "not_found", "message": "Job ID not found in metadata."})
+    metadata = job_store.get_job(job_id)
+    if metadata is None:
+        metadata = {"status": "not_found", "message": "Job ID not found in metadata."}
     return metadata
 
 @router.get("/all_job_metadata")
@@ -675,7 +831,7 @@ def get_all_job_metadata():
     Get all job metadata (for history tracking).
     """
     # Get all real job metadata
-    all_metadata = dict(JOB_METADATA)
+    all_metadata = job_store.list_jobs()
     
     # Check if there are any mock jobs in the session (this would need to be passed from frontend)
     # For now, we'll just return the real metadata
@@ -688,7 +844,7 @@ def get_all_jobs():
     """
     Get all job IDs and their statuses for debugging.
     """
-    return {job_id: result.get("status", "unknown") for job_id, result in GRADING_RESULTS.items()}
+    return {job_id: metadata.get("status", "unknown") for job_id, metadata in job_store.list_jobs().items()}
 
 @router.get("/history/{job_id}")
 def get_history_result(job_id: str):
@@ -704,7 +860,9 @@ def get_history_result(job_id: str):
             "results": []  # Empty results since mock data is handled in frontend
         }
     
-    result = HISTORY_RESULTS.get(job_id, {"status": "not_found", "message": "Job ID not found in history."})
+    result = job_store.get_result(job_id)
+    if result is None or result.get("status") != STATUS_COMPLETED:
+        result = {"status": "not_found", "message": "Job ID not found in history."}
     return result
 
 @router.get("/all_history")
@@ -713,10 +871,29 @@ def get_all_history():
     Get all history results.
     """
     # Get all real history results
-    all_history = dict(HISTORY_RESULTS)
+    all_history = {
+        job_id: job_store.get_result(job_id)
+        for job_id, metadata in job_store.list_jobs().items()
+        if metadata.get("status") == STATUS_COMPLETED
+    }
     
     # Check if there are any mock jobs that should be included
     # For now, we'll just return the real history
     # In a real implementation, we might want to check if mock data should be included
     
-    return all_history
\ No newline at end of file
+    return all_history
+
+@router.get("/cache_stats")
+def get_cache_stats():
+    """
+    Get hit/miss counters and size of the grading result cache.
+    """
+    return grading_cache.stats()
+
+@router.delete("/cache")
+def clear_grading_cache():
+    """
+    Drop every cached grading result (e.g. after changing grading prompts by hand).
+    """
+    grading_cache.clear_sync()
+    return {"status": "success", "message": "Grading cache has been cleared."}
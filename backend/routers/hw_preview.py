@@ -1,11 +1,16 @@
 import logging
+import os
 import json
 import asyncio
-from typing import List, Dict, Any, Callable
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from typing import List, Dict, Any, Callable, AsyncIterable, Optional, Union
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Response
 from langchain_core.messages import SystemMessage, HumanMessage
-from fastapi.concurrency import run_in_threadpool
 from ..dependencies import *
+from ..structured_output import ainvoke_structured
+from ..retry import retry_async
+from ..segmenter import SEGMENT_CONFIDENCE_THRESHOLD, segment_submission
+from ..filename_parser import parse_student_filename, list_template_sets
+from ..llm_failures import bind_failure_context
 from ..utils import *
 
 # --- 日志和应用基础设置 ---
@@ -17,6 +22,16 @@ router = APIRouter(
     tags=["hw_preview"]
 )
 
+# --- 上传流水线参数 ---
+# 解压与 AI 分割之间的有界队列长度：解压领先分割太多时暂停解压，控制内存占用
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "32"))
+# 并发分割作答的 worker 数（实际 LLM 并发仍由 llm_invoke 中的全局限流器控制）
+UPLOAD_SEGMENT_WORKERS = int(os.getenv("UPLOAD_SEGMENT_WORKERS", "32"))
+# 响应头中最多列出的被跳过文件数（完整数量见 X-Skipped-Count）
+MAX_SKIPPED_IN_HEADER = 100
+# 分析结果中的标记键：学号取自文件名（LLM 未给出学号），合并结果时用于处理重名
+FALLBACK_ID_KEY = "_fallback_id"
+
 # --- 1. 设计 Prompt ---
 
 SYSTEM_PROMPT = """
@@ -103,6 +118,32 @@ For example, for a student submission with 5 questions, your output should have
 **[Crucial Note]**: When generating JSON, ensure all backslashes "\\" in string values are correctly escaped as "\\". This is especially important for fields containing LaTeX formulas.
 """
 
+# 学号、姓名已从文件名解析出来时使用的精简提示词：只做答案分割，不做身份识别
+SEGMENT_SYSTEM_PROMPT = """
+You are a professional AI teaching assistant with graduate-level expertise in relevant fields. You specialize in analyzing assignment submissions in plain text format and are skilled in processing and structuring student homework.
+
+Your task is to split a single student's plain text submission into answers, one per question in [Question Data].
+
+1. **Answer Segmentation**: Segment primarily by the question numbers ("number") in [Question Data]. If the submission has no question numbers, infer the segmentation from spacing and from whether the answer logic matches each question stem (an answer may span several pages, and pages may be out of order).
+    **Crucial**: Students may skip questions. The output must contain exactly one entry per "q_id" in [Question Data], with "content" set to an empty string for skipped questions.
+    **Important Instruction: Ensure the integrity of the extracted "content" field. You are prohibited from deleting content or translating it. Your job is solely to divide the text into separate questions.**
+
+2. **Identify Reliability**: For each question, list any low-confidence or unprocessable situations in `flag` (e.g. chaotic page order, incomplete answer). Use an empty list if there are no issues.
+
+3. **Formatted Output**: Return a single dictionary with the key "stu_ans", whose value is a list of JSON dictionaries with the fields "q_id", "number", "type" (copied from [Question Data]), "content", and "flag". For example:
+{
+    "stu_ans":
+    [
+        {"q_id": "q1", "number": "1.1", "type": "概念题", "content": "ans1", "flag": []},
+        {"q_id": "q2", "number": "1.2", "type": "计算题", "content": "ans2", "flag": ["Page confusion, answer extraction may be incorrect"]}
+    ]
+}
+
+**[Important Instruction]: Your response must be a single, complete, and correctly formatted JSON object. It should start directly with { and end with `}`. Do not include any explanatory text, comments, or Markdown code block markers (like ```json).**
+
+**[Crucial Note]**: When generating JSON, ensure all backslashes "\\" in string values are correctly escaped as "\\". This is especially important for fields containing LaTeX formulas.
+"""
+
 """
 **[Notes]**:
 - You must strictly build the answer list based on the provided [Question Data] (a JSON object). The `q_id`, `number`, and `type` fields in each item of 'stu_ans' must perfectly match the information in [Question Data]. **(Note: The `type` value must remain in Chinese as provided in the source data)**.
@@ -145,33 +186,69 @@ example = '''
 }
 '''
 
+async def _iter_files(files_data: Union[List[Dict[str, str]], AsyncIterable[Dict[str, str]]]):
+    if isinstance(files_data, list):
+        for file_info in files_data:
+            yield file_info
+    else:
+        async for file_info in files_data:
+            yield file_info
+
+def merge_student_results(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    按学号合并分析结果，并移除 FALLBACK_ID_KEY 标记。
+
+    以文件名兜底的学号可能重复（不同目录下的 "作业1.txt"），重复时依次追加 "_2"、"_3"，
+    避免不同学生的结果互相覆盖。
+    """
+    stu_dict: Dict[str, Dict[str, Any]] = {}
+    for stu in results:
+        fallback = stu.pop(FALLBACK_ID_KEY, False)
+        stu_id = stu.get('stu_id')
+        if not stu_id:
+            continue
+        if fallback and stu_id in stu_dict:
+            suffix = 2
+            while f"{stu_id}_{suffix}" in stu_dict:
+                suffix += 1
+            logger.warning(f"以文件名兜底的学号 {stu_id} 重复，改为 {stu_id}_{suffix}")
+            stu_id = stu['stu_id'] = f"{stu_id}_{suffix}"
+        stu_dict[stu_id] = stu
+    return stu_dict
+
 async def analyze_submissions(
-    files_data: List[Dict[str, str]],
+    files_data: Union[List[Dict[str, str]], AsyncIterable[Dict[str, str]]],
     problems_data: Dict[str, Dict[str,str]],
     student_store: Dict[str, Dict[str, Any]], # 接收学生存储字典的引用
     # llm: Any, # 传入一个LangChain LLM实例
     llm_factory: Callable[[], Any], # 修改点：接收工厂函数，而不是实例
+    template_set: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     使用 LangChain 分析学生提交的文件，提取学生信息并分割答案。
 
+    学号和姓名先按文件名模板在本地解析（见 filename_parser.py）。每份提交先尝试按题号做规则分割
+    （见 segmenter.py）；文件名中能取到学号且分割置信度不低于 SEGMENT_CONFIDENCE_THRESHOLD 时直接采用，
+    其余提交才调用 LLM：已知学号时只让 LLM 分割答案（SEGMENT_SYSTEM_PROMPT），否则连同身份一起识别。
+    LLM 也没有给出学号时，以文件名（不含目录和扩展名）作为学号，重复时追加序号，保证不丢学生。
+
+    解压（生产者）和 AI 分割（消费者）通过有界队列组成流水线：
+    第一个文件解压出来后立即开始调用 LLM，不必等待整个压缩包解压完成。
+
     Args:
-        files_data: 解压后读取的文件数据列表。
+        files_data: 解压后读取的文件数据列表，或逐个产出文件的异步迭代器（见 stream_files_from_archive）。
                     格式: [{"filename": "20240101_张三.txt", "content": "这是第一题的答案..."}, ...]
         problems_data: 包含所有题目信息的JSON对象（或Python字典）。
                         格式: {"q1": {"q_id": "q1", "number": "1.1", ...}, ...]}
         llm: 已经初始化的 LangChain 聊天模型实例 (e.g., ChatZhipuAI).
+        template_set: 文件名模板集名称，默认取 FILENAME_TEMPLATE_SET。
 
     Returns:
         一个包含所有学生分析结果的字典，格式符合用户要求。
     """
-    # 优化：使用工厂模式在线程池中创建独立实例，避免死锁并提高并发效率。
-    if not files_data:
+    if isinstance(files_data, list) and not files_data:
         raise HTTPException(status_code=400, detail="输入的学生作答不能为空#1。")
 
-    # 将 Pydantic 模型与 LLM 绑定，使其能够输出我们想要的结构
-    # structured_llm = llm.with_structured_output(StudentSubmission)
-
     prob_main_data = []
     for prob in problems_data.values():
         prob_main = {}
@@ -185,85 +262,126 @@ async def analyze_submissions(
     # 为了方便LLM处理，将题目数据字典转换为JSON字符串
     problems_json_str = json.dumps(prob_main_data, ensure_ascii=False, indent=1)
 
-    all_students_results = []
+    print("开始处理学生提交...")
+    # 分割方式计数：规则分割 / LLM 分割
+    segment_counts = {"rule": 0, "llm": 0}
 
-    print(f"开始处理 {len(files_data)}份学生提交...")
-    
-    # Define a helper function for processing a single file
+    # 异步客户端可以被并发复用，整个批次只创建一个实例；
+    # 并发度由 llm_invoke 中的全局在途请求预算（LLM_MAX_INFLIGHT）控制。
+    llm = llm_factory()
 
-    # 修改点：创建信号量限制同时进行的AI请求数量，防止 API 429
-    semaphore = asyncio.Semaphore(20) 
-    
     async def process_single_file(file_info):
-        # 异步等待信号量
-        async with semaphore:
-            filename = file_info.get("filename", "")
-            content = file_info.get("content", "")
-
-            if not filename or not content:
-                logger.warning(f"文件 {filename} 内容为空，跳过。")
-                return None
-
-            print(f"正在分析文件: {filename}")
-
-            # 修改点：将 HumanMessage 改为英文
-            human_message_content = f"""
-            Please process this student submission based on the following information:
-
-            **[Filename]**:
-            {filename}
-
-            **[Question Data (JSON)]**:
-            {problems_json_str}
-
-            **[Student Submission Content]**:
-            ---
-            {content}
-            ---"""
-            
-            messages = [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=human_message_content)
-            ]
-
-            # 修改点：定义一个同步函数，用于在线程池中运行
-            def _sync_analyze():
-                try:
-                    # 关键修改：在线程内部创建全新的 LLM 实例（独立连接池，无竞争）
-                    local_llm = llm_factory()
-                    # 同步调用，只会阻塞当前线程
-                    raw_output = local_llm.invoke(messages)
-                    # 解析 JSON
-                    return parse_llm_json_output(raw_output.content, StudentSubmission).model_dump()
-                except Exception as e:
-                    logger.error(f"AI分析文件 {filename} 失败: {str(e)}")
-                    return None
-
-            # 将同步函数放入线程池执行
-            # 这样既利用了多线程并发，又规避了 asyncio+grpc 的死锁风险
-            result = await run_in_threadpool(_sync_analyze)
-            
-            if result:
-                logger.info(f"完成分析: {filename}, 提取到: {result.get('stu_name')}")
-            return result
+        filename = file_info.get("filename", "")
+        content = file_info.get("content", "")
+
+        if not filename or not content:
+            logger.warning(f"文件 {filename} 内容为空，跳过。")
+            return None
+        # 消费者任务依次处理多个文件，每个文件覆盖一次上下文
+        bind_failure_context(filename=filename)
+
+        stu_id, stu_name = parse_student_filename(filename, template_set)
+        if stu_id:
+            stu_ans, confidence = segment_submission(content, prob_main_data)
+            if confidence >= SEGMENT_CONFIDENCE_THRESHOLD:
+                logger.debug(f"规则分割: {filename}（置信度 {confidence}）")
+                segment_counts["rule"] += 1
+                return {"stu_id": stu_id, "stu_name": stu_name, "stu_ans": stu_ans}
+            logger.info(f"规则分割置信度不足: {filename}（{confidence}），交由 AI 分析")
+
+        segment_counts["llm"] += 1
+        print(f"正在分析文件: {filename}")
+
+        # 修改点：将 HumanMessage 改为英文；学号已知时不再把文件名交给 LLM
+        filename_section = "" if stu_id else f"""
+        **[Filename]**:
+        {filename}
+"""
+        human_message_content = f"""
+        Please process this student submission based on the following information:
+{filename_section}
+        **[Question Data (JSON)]**:
+        {problems_json_str}
+
+        **[Student Submission Content]**:
+        ---
+        {content}
+        ---"""
+        
+        messages = [
+            SystemMessage(content=SEGMENT_SYSTEM_PROMPT if stu_id else SYSTEM_PROMPT),
+            HumanMessage(content=human_message_content)
+        ]
+
+        # 开启 LLM_STRUCTURED_OUTPUT 时输出模型作为响应 schema 交给供应商（见 structured_output.py）
+        async def _call_llm():
+            if stu_id:
+                answers = await ainvoke_structured(llm, messages, StudentAnswers)
+                return {"stu_id": stu_id, "stu_name": stu_name, "stu_ans": answers.model_dump()["stu_ans"]}
+            return (await ainvoke_structured(llm, messages, StudentSubmission)).model_dump()
 
-    # 创建任务列表
-    tasks = [process_single_file(file_info) for file_info in files_data]
-    
-    # 并发执行 (I/O wait 时会切换任务)
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    # 处理结果
-    for result in results:
         try:
-            if isinstance(result, Exception):
-                logger.error(f"Error processing file: {result}")
-            elif result:
-                all_students_results.append(result)
+            result = await retry_async(_call_llm, description=f"AI分析文件 {filename}")
         except Exception as e:
-            logger.error(f"Error handling file result: {e}")
+            logger.error(f"AI分析文件 {filename} 失败: {str(e)}")
+            return None
+
+        if result:
+            if not result.get("stu_id"):
+                result["stu_id"] = os.path.splitext(os.path.basename(filename))[0]
+                result[FALLBACK_ID_KEY] = True
+                logger.warning(f"未能识别 {filename} 的学号，以文件名作为学号")
+            logger.info(f"完成分析: {filename}, 提取到: {result.get('stu_name')}")
+        return result
+
+    # (文件序号, 分析结果)，最后按文件顺序排列
+    indexed_results = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+
+    async def produce() -> int:
+        # 队列满时 put 会挂起，解压随之暂停
+        file_count = 0
+        async for file_info in _iter_files(files_data):
+            await queue.put((file_count, file_info))
+            file_count += 1
+        for _ in range(UPLOAD_SEGMENT_WORKERS):
+            await queue.put(None)
+        return file_count
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, file_info = item
+            try:
+                result = await process_single_file(file_info)
+            except Exception as e:
+                logger.error(f"Error processing file: {e}")
+                continue
+            if result:
+                indexed_results.append((index, result))
 
-    stu_dict = {stu['stu_id']: stu for stu in all_students_results if stu.get('stu_id')}
+    producer = asyncio.create_task(produce())
+    consumers = [asyncio.create_task(consume()) for _ in range(UPLOAD_SEGMENT_WORKERS)]
+    try:
+        file_count = await producer
+        await asyncio.gather(*consumers)
+    except BaseException:
+        # 解压失败（或请求被取消）时停止所有分割任务，把原始错误抛给调用方
+        producer.cancel()
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(producer, *consumers, return_exceptions=True)
+        raise
+
+    if file_count == 0:
+        raise HTTPException(status_code=400, detail="未在上传文件中找到有效的文本文件。")
+    logger.info(f"共分析 {file_count} 个文件，规则分割 {segment_counts['rule']} 份，AI 分割 {segment_counts['llm']} 份。")
+
+    all_students_results = [result for _, result in sorted(indexed_results, key=lambda item: item[0])]
+
+    stu_dict = merge_student_results(all_students_results)
     student_store.clear()
     student_store.update(stu_dict)
 
@@ -271,38 +389,48 @@ async def analyze_submissions(
 
 @router.post("/")
 async def handle_answer_upload(
+    response: Response,
     file: UploadFile = File(...),
     problem_store: Dict = Depends(get_problem_store),
     student_store: Dict = Depends(get_student_store),
     # 修改点：注入工厂依赖
-    llm_factory: Callable = Depends(get_llm_factory)
+    llm_factory: Callable = Depends(get_llm_factory),
+    # 文件名模板集（见 filename_parser.py），不传时使用 FILENAME_TEMPLATE_SET
+    template_set: Optional[str] = None,
     ):
     """
     接收上传的作业文件（压缩包或单个txt），提取内容，并交由AI分析。
+
+    过大或无法识别编码的单个文件会被跳过，其余文件照常处理；被跳过的文件通过响应头
+    X-Skipped-Files（JSON 列表，[{"filename": ..., "reason": ...}]）和 X-Skipped-Count 返回。
     """
     logger.info(f"接收到文件: {file.filename}, 类型: {file.content_type}")
     
+    upload_path = None
+    skipped_files: List[Dict[str, str]] = []
     try:
-        file_bytes = await file.read()
-        
-        files_data = await extract_files_from_archive(file_bytes, file.filename)
-        
-        if not files_data:
-            raise HTTPException(status_code=400, detail="未在上传文件中找到有效的文本文件。")
-
-        logger.info(f"成功从 '{file.filename}' 中提取了 {len(files_data)} 个文件。")
+        # 上传文件按块落盘，再逐个成员流式解压，避免整包和全部解压结果同时驻留内存
+        upload_path = await spool_upload(file)
 
-        # 调用修改后的分析函数，传入工厂
+        # 解压出的文件直接流入 AI 分割，两个阶段并行进行；传入工厂
         recognized_ans = await analyze_submissions(
-            files_data=files_data,
+            files_data=stream_files_from_archive(upload_path, file.filename, skipped=skipped_files),
             problems_data=problem_store,
             student_store=student_store,
             llm_factory=llm_factory, # 传入工厂
+            template_set=template_set,
         )
         logger.info(f"成功分割作答内容，共处理 {len(recognized_ans)} 份。")
+        if skipped_files:
+            logger.warning(f"上传文件中有 {len(skipped_files)} 个文件被跳过。")
+            # ensure_ascii 保证中文文件名可以放进响应头
+            response.headers["X-Skipped-Files"] = json.dumps(skipped_files[:MAX_SKIPPED_IN_HEADER])
+            response.headers["X-Skipped-Count"] = str(len(skipped_files))
 
         return recognized_ans
 
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"处理失败: {e}")
         raise HTTPException(status_code=501, detail=str(e))
@@ -311,4 +439,12 @@ async def handle_answer_upload(
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.exception(f"处理文件 '{file.filename}' 时发生未知错误。")
-        raise HTTPException(status_code=500, detail=f"处理文件时发生内部错误: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"处理文件时发生内部错误: {e}")
+    finally:
+        if upload_path:
+            os.remove(upload_path)
+
+@router.get("/filename_templates")
+async def get_filename_templates():
+    """列出可用的文件名模板集名称。"""
+    return {"template_sets": list_template_sets()}
@@ -27,8 +27,8 @@ from typing import Dict, Any
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from langchain_core.messages import SystemMessage, HumanMessage
-from fastapi.concurrency import run_in_threadpool
 from ..dependencies import *
+from ..structured_output import ainvoke_structured
 from ..utils import *
 
 # --- 日志和应用基础设置 ---
@@ -81,6 +81,7 @@ You are a professional AI teaching assistant with graduate-level expertise in re
 2. **Content Extraction**: Extract three key pieces of information for each problem:
     - `number`: The question number.
     - `stem`: The complete question stem content, including all text, formulas, and code blocks.
+    - `reference_solution`: The reference answer or reference program given for the problem, copied verbatim (do not write one yourself); an empty string if none is given.
 
 3. **Problem Classification**: Determine the most appropriate classification (`type`) for each problem based on the definitions below. **Note: You must use the specific Chinese terms provided below for the `type` field**:
     - **概念题** (Concept Problem): The answer is basically determined or close in meaning to judge correctness or percentage correct.
@@ -94,7 +95,7 @@ You are a professional AI teaching assistant with graduate-level expertise in re
 
 4. **Design Grading Criteria (`criterion`)**: If the problem explicitly provides grading criteria, or the teacher submitted separate criteria (e.g., "Full score 10 points...", "Deduct 2 points for each error..."), retain them. If not, you must design this field yourself based on the problem type and strictness of grading; if the criteria submitted by the teacher or problem are not detailed enough to support rigorous scoring for each problem, you also need to design and supplement them.
 
-5. **Formatted Output**: Integrate all processed problems into a single dictionary. The key is "problems", and the value is a JSON array. Each element in the array is a JSON object dictionary containing the fields "q_id", "number", "type", "stem", and "criterion".
+5. **Formatted Output**: Integrate all processed problems into a single dictionary. The key is "problems", and the value is a JSON array. Each element in the array is a JSON object dictionary containing the fields "q_id", "number", "type", "stem", "criterion", and "reference_solution".
 
 For example, for an image containing 5 questions, your output should have the following structure:
 {"problems":
@@ -127,7 +128,6 @@ async def process_and_store_problems(
         raise HTTPException(status_code=400, detail="输入的文本为空或只包含空白字符。")
 
     try:
-        # structured_llm = llm.with_structured_output(ProblemSet)
         messages = [
             SystemMessage(content=SYSTEM_PROMPT),
             HumanMessage(content=text)
@@ -135,16 +135,10 @@ async def process_and_store_problems(
         
         logger.info("准备异步调用AI分析题目...")
         
-        # 使用异步调用 await llm.ainvoke()
-        # 注意：这里假设你的llm对象是异步兼容的，对于langchain_openai的ChatOpenAI通常是这样
-        # response = await llm.ainvoke(messages)
-        response = await run_in_threadpool(llm.invoke, messages)
-        raw_llm_output = response.content
-
-        # raw_llm_output = llm.invoke(messages).content
-        logger.info(f"AI返回的原始输出: {raw_llm_output}")
-
-        json_output = parse_llm_json_output(raw_llm_output, ProblemSet)
+        # 使用异步调用（受全局在途请求预算约束）；开启 LLM_STRUCTURED_OUTPUT 时
+        # ProblemSet 作为响应 schema 交给供应商，否则解析文本输出（见 structured_output.py）
+        json_output = await ainvoke_structured(llm, messages, ProblemSet)
+        logger.debug(f"AI返回的题目: {json_output}")
         
         # 增加日志，确认AI调用已返回
         logger.info("AI分析异步调用完成。")
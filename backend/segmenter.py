@@ -0,0 +1,166 @@
+# segmenter.py
+"""
+基于规则的学生作答预分割。
+
+大多数提交中题号（"1.1"、"2."、"第三题"、"(4)"）清晰可见，按题目数据中的 number 生成题号正则，
+在本地把作答文本切分到各题，并给出置信度。只有置信度不足的提交才交给 LLM 分割。
+
+置信度 = 找到题号的题目占比；只要有一题存在歧义，再乘以 AMBIGUITY_PENALTY（与题目数量无关，
+保证规则结果落到阈值以下、交给 LLM 分割）。"歧义"指某题的题号在其自身作答片段中再次出现
+（例如上一题作答里的编号列表被误当成这一题的开头），此时该题与上一题都可能被切错，
+两题的 flag 中都会记录 AMBIGUOUS_FLAG。
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 规则分割的置信度不低于该阈值时直接采用，否则交给 LLM
+SEGMENT_CONFIDENCE_THRESHOLD = float(os.getenv("SEGMENT_CONFIDENCE_THRESHOLD", "0.9"))
+# 检测到任何歧义时置信度乘以该系数
+AMBIGUITY_PENALTY = 0.5
+AMBIGUOUS_FLAG = "题号在作答中重复出现，分割位置可能有误"
+
+_CN_DIGITS = "零一二三四五六七八九"
+_CN_NUMERAL_RE = re.compile(r"^[零一二三四五六七八九十两]+$")
+_ARABIC_NUMBER_RE = re.compile(r"^\d+(?:[.．\-]\d+)*$")
+
+# 题号前允许出现的前缀：缩进、Markdown 标题/加粗/引用、左括号
+_LINE_PREFIX = r"(?m)^[ \t>#*【\[(（]*"
+# 题号后不能紧跟数字或子题号，避免 "1" 匹配到 "10" 或 "1.1"
+_NO_SUBNUMBER = r"(?![.．\-_]?\d)"
+# 单独的数字题号后必须是标点、右括号或行尾（"2 + 3 = 5" 这类作答行不能被当成题号）
+_STRICT_END = r"\s*[*】\])）]*\s*(?:[.．、:：)）]|$|(?<=[)）】\]]))"
+# 带关键词或多级题号（"题目2"、"1.1"）时也允许空白结尾
+_LOOSE_END = r"\s*[*】\])）]*\s*(?:[.．、:：)）]|\s|$|(?<=[)）】\]]))"
+# "第三题" 这类写法后的可选标点
+_TI_END = r"\s*(?:小题|题|问)\s*[.．、:：]?"
+# 题号前可能带有的题目关键词
+_KEYWORD_PREFIX = r"(?:题目?|习题|问题|Question|Problem|Exercise|Ex|Q)\s*[.．]?\s*"
+
+
+def _chinese_to_int(text: str) -> Optional[int]:
+    """把 "三"、"十二"、"二十一" 这类中文数字转成整数（仅支持 1~99）。"""
+    text = text.replace("两", "二")
+    if not _CN_NUMERAL_RE.match(text):
+        return None
+    if "十" not in text:
+        return _CN_DIGITS.index(text) if len(text) == 1 else None
+    tens, _, ones = text.partition("十")
+    value = (_CN_DIGITS.index(tens) if tens else 1) * 10
+    if ones:
+        if len(ones) != 1:
+            return None
+        value += _CN_DIGITS.index(ones)
+    return value
+
+
+def _int_to_chinese(value: int) -> str:
+    if value < 10:
+        return _CN_DIGITS[value]
+    tens, ones = divmod(value, 10)
+    return (_CN_DIGITS[tens] if tens > 1 else "") + "十" + (_CN_DIGITS[ones] if ones else "")
+
+
+def normalize_number(number: str) -> str:
+    """
+    统一题号写法："第三题" -> "3"，"2." -> "2"，"1．1" -> "1.1"；无法识别的写法（如 "III."）原样去除首尾空白返回。
+    """
+    text = number.strip()
+    text = re.sub(r"^第\s*", "", text)
+    text = re.sub(r"\s*(?:小题|题|问)?\s*[.．、:：]?$", "", text)
+    text = text.replace("．", ".").replace("-", ".")
+    if _ARABIC_NUMBER_RE.match(text):
+        return ".".join(str(int(part)) for part in text.split("."))
+    value = _chinese_to_int(text)
+    if value is not None:
+        return str(value)
+    return number.strip()
+
+
+def build_header_pattern(number: str) -> "re.Pattern":
+    """根据题目的 number 生成匹配作答中该题题号行的正则。"""
+    canonical = normalize_number(number)
+    if _ARABIC_NUMBER_RE.match(canonical):
+        core = r"[.．\-_]".join(canonical.split(".")) + _NO_SUBNUMBER
+        alternatives = [
+            core + (_LOOSE_END if "." in canonical else _STRICT_END),
+            rf"第\s*{core}{_TI_END}",
+            rf"{_KEYWORD_PREFIX}{core}{_LOOSE_END}",
+        ]
+        if "." not in canonical and 0 < int(canonical) < 100:
+            chinese = _int_to_chinese(int(canonical))
+            alternatives.append(rf"第\s*{chinese}{_TI_END}")
+            alternatives.append(rf"{chinese}\s*[、.．:：]")
+    else:
+        literal = re.escape(canonical.rstrip(".．、"))
+        alternatives = [literal + _STRICT_END, rf"{_KEYWORD_PREFIX}{literal}{_LOOSE_END}"]
+    return re.compile(rf"{_LINE_PREFIX}(?:{'|'.join(alternatives)})", re.IGNORECASE)
+
+
+def segment_submission(content: str, problems: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    按题号把学生作答切分到各题。
+
+    Args:
+        content: 学生作答全文。
+        problems: 按题目顺序排列的题目数据，每项至少包含 "q_id"、"number"、"type"。
+
+    Returns:
+        (stu_ans 列表, 置信度)。stu_ans 的格式与 LLM 分割结果一致：
+        [{"q_id": ..., "number": ..., "type": ..., "content": ..., "flag": []}, ...]；
+        未找到题号的题目 content 为空字符串。
+    """
+    if not problems or not content.strip():
+        return [], 0.0
+
+    matches = [list(build_header_pattern(prob["number"]).finditer(content)) for prob in problems]
+
+    # 按题目顺序贪心选取题号：每题取位于上一题题号之后的第一个匹配
+    chosen: List[Optional["re.Match"]] = []
+    last_start = -1
+    for prob_matches in matches:
+        match = next((m for m in prob_matches if m.start() > last_start), None)
+        chosen.append(match)
+        if match is not None:
+            last_start = match.start()
+
+    # 每题作答的结束位置：下一个找到的题号处，或全文末尾
+    ends = [len(content)] * len(chosen)
+    next_start = len(content)
+    for index in range(len(chosen) - 1, -1, -1):
+        ends[index] = next_start
+        if chosen[index] is not None:
+            next_start = chosen[index].start()
+
+    found = sum(1 for m in chosen if m is not None)
+    stu_ans = []
+    ambiguous = set()
+    previous = None
+    for index, prob in enumerate(problems):
+        match = chosen[index]
+        answer = ""
+        if match is not None:
+            end = ends[index]
+            answer = content[match.end():end].strip()
+            if any(match.start() < m.start() < end for m in matches[index]):
+                # 这一题的开头可能取自上一题作答中的编号，两题的边界都不可信
+                ambiguous.add(index)
+                if previous is not None:
+                    ambiguous.add(previous)
+            previous = index
+        stu_ans.append({
+            "q_id": prob["q_id"],
+            "number": prob["number"],
+            "type": prob["type"],
+            "content": answer,
+            "flag": [],
+        })
+
+    for index in ambiguous:
+        stu_ans[index]["flag"].append(AMBIGUOUS_FLAG)
+
+    confidence = found / len(problems)
+    if ambiguous:
+        confidence *= AMBIGUITY_PENALTY
+    return stu_ans, round(confidence, 3)
+
@@ -0,0 +1,289 @@
+# structured_output.py
+"""
+结构化输出模式：把 Pydantic 模型作为响应 schema 交给供应商，由模型直接生成符合结构的 JSON。
+
+LLM_STRUCTURED_OUTPUT=true 时，对 LLM_STRUCTURED_OUTPUT_PROVIDERS 中的供应商使用
+`llm.with_structured_output(schema)`：
+  - gemini 使用 response_schema（langchain 中的 "json_mode"，响应 MIME 类型为 application/json）；
+  - zhipu 使用 function calling（OpenAI 兼容接口）；
+  可以用 LLM_STRUCTURED_OUTPUT_METHOD_<PROVIDER> 覆盖。
+其余情况（未开启、供应商不支持、schema 被供应商拒绝）回退到文本模式：普通调用 + parse_llm_json_output。
+只有 NotImplementedError 和供应商明确表示不支持 response_format / json_schema / 工具调用的错误才算拒绝；
+同一 (供应商, schema) 连续被拒绝 STRUCTURED_OUTPUT_REJECTION_LIMIT 次后暂停结构化模式
+STRUCTURED_OUTPUT_DISABLE_TTL 秒，到期后重新尝试。上下文超长、内容过滤等普通错误照常抛出。
+
+两种模式按 schema 分别统计调用次数、解析失败次数和 token 用量，通过 get_structured_output_stats()
+（/debug/structured_output）对比解析失败率和 token 节省情况。
+"""
+import os
+import json
+import logging
+import re
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from backend.dependencies import parse_llm_json_output
+from backend.llm_failures import record_llm_failure
+from backend.llm_invoke import ainvoke_llm, get_provider
+from backend.rate_limiter import get_rate_limiter, estimate_tokens, get_status_code, is_throttling_error
+
+logger = logging.getLogger(__name__)
+
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+LLM_STRUCTURED_OUTPUT_PROVIDERS = {
+    name.strip() for name in os.getenv("LLM_STRUCTURED_OUTPUT_PROVIDERS", "gemini,zhipu").split(",") if name.strip()
+}
+# 各供应商使用的 with_structured_output 方法
+DEFAULT_STRUCTURED_OUTPUT_METHODS = {
+    "gemini": "json_mode",
+    "zhipu": "function_calling",
+}
+# 连续被拒绝多少次后暂停结构化模式，以及暂停的秒数
+STRUCTURED_OUTPUT_REJECTION_LIMIT = int(os.getenv("STRUCTURED_OUTPUT_REJECTION_LIMIT", "3"))
+STRUCTURED_OUTPUT_DISABLE_TTL = float(os.getenv("STRUCTURED_OUTPUT_DISABLE_TTL", "600"))
+# 供应商明确表示不支持结构化输出参数时的错误信息（OpenAI 兼容接口 / 智谱 / Gemini）
+SCHEMA_REJECTION_PATTERNS = (
+    re.compile(r"(response_format|json_schema|json_object|response_schema|response_mime_type)"
+               r".{0,80}(not supported|unsupported|not support|is not allowed|not available)"),
+    re.compile(r"(not supported|unsupported|does not support|doesn't support)"
+               r".{0,80}(response_format|json_schema|json_object|response_schema|response_mime_type)"),
+    re.compile(r"(tool_choice|tools|function calling|function_call)"
+               r".{0,80}(not supported|unsupported|not support|is not allowed)"),
+    re.compile(r"(not supported|unsupported|does not support|doesn't support)"
+               r".{0,80}(tool_choice|tools|function calling|function_call)"),
+    re.compile(r"invalid json schema|invalid schema for (response_format|function)"),
+)
+
+_stats: Dict[Tuple[str, str], Dict[str, int]] = {}
+# (供应商, schema 名) -> {"count": 连续拒绝次数, "reason": 最近一次拒绝原因, "disabled_until": 暂停截止时间}
+_rejections: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_stats_lock = threading.Lock()
+
+
+def _method_for(provider: str) -> str:
+    default = DEFAULT_STRUCTURED_OUTPUT_METHODS.get(provider, "function_calling")
+    return os.getenv(f"LLM_STRUCTURED_OUTPUT_METHOD_{provider.upper()}", default)
+
+
+def _is_disabled(provider: str, schema: str) -> bool:
+    with _stats_lock:
+        entry = _rejections.get((provider, schema))
+        if entry is None or entry["disabled_until"] is None:
+            return False
+        if entry["disabled_until"] > time.time():
+            return True
+        # 暂停到期，重新尝试结构化模式
+        del _rejections[(provider, schema)]
+        return False
+
+
+def structured_output_enabled(llm: Any, output_model: Type[BaseModel]) -> bool:
+    """该客户端调用 output_model 时是否会使用结构化输出模式。"""
+    provider = get_provider(llm)
+    return (
+        LLM_STRUCTURED_OUTPUT
+        and provider in LLM_STRUCTURED_OUTPUT_PROVIDERS
+        and not _is_disabled(provider, output_model.__name__)
+    )
+
+
+def _record_rejection(provider: str, schema: str, rejection: BaseException) -> None:
+    """累计连续拒绝次数，达到上限后暂停该组合的结构化模式。"""
+    with _stats_lock:
+        entry = _rejections.setdefault((provider, schema), {"count": 0, "reason": "", "disabled_until": None})
+        entry["count"] += 1
+        entry["reason"] = str(rejection)[:500]
+        if entry["count"] >= STRUCTURED_OUTPUT_REJECTION_LIMIT:
+            entry["disabled_until"] = time.time() + STRUCTURED_OUTPUT_DISABLE_TTL
+        count, disabled = entry["count"], entry["disabled_until"] is not None
+    if disabled:
+        logger.warning(f"{provider} 连续 {count} 次拒绝 {schema} 的结构化输出，"
+                       f"{STRUCTURED_OUTPUT_DISABLE_TTL:.0f} 秒内改用文本模式: {rejection}")
+    else:
+        logger.warning(f"{provider} 拒绝 {schema} 的结构化输出（连续第 {count} 次），本次改用文本模式: {rejection}")
+
+
+def _record_acceptance(provider: str, schema: str) -> None:
+    with _stats_lock:
+        _rejections.pop((provider, schema), None)
+
+
+def _bump(schema: str, mode: str, **counts: int) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault((schema, mode), {
+            "calls": 0, "parse_failures": 0, "repaired": 0,
+            "input_tokens": 0, "output_tokens": 0, "token_samples": 0,
+        })
+        for key, value in counts.items():
+            entry[key] += value
+
+
+def record_usage(output_model: Type[BaseModel], mode: str, response: Any) -> None:
+    """记录一次调用及其 token 用量（usage_metadata 缺失时只计调用次数）。"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") if isinstance(usage, dict) else None
+    output_tokens = usage.get("output_tokens") if isinstance(usage, dict) else None
+    if isinstance(input_tokens, int) and isinstance(output_tokens, int):
+        _bump(output_model.__name__, mode, calls=1, input_tokens=input_tokens,
+              output_tokens=output_tokens, token_samples=1)
+    else:
+        _bump(output_model.__name__, mode, calls=1)
+
+
+def record_parse_failure(output_model: Type[BaseModel], mode: str, repaired: bool = False) -> None:
+    _bump(output_model.__name__, mode, parse_failures=1, repaired=int(repaired))
+
+
+def _raw_text(message: Any) -> str:
+    """结构化调用的原始输出：JSON 文本，或 function calling 的参数。"""
+    content = getattr(message, "content", "")
+    if isinstance(content, str) and content.strip():
+        return content
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args", {}), ensure_ascii=False)
+    return content if isinstance(content, str) else str(content)
+
+
+def _is_schema_rejection(exc: BaseException) -> bool:
+    """
+    供应商是否因为不支持结构化输出参数而拒绝了请求。
+
+    只看 NotImplementedError 和明确的"不支持"错误信息；上下文超长、内容过滤等普通 400 错误
+    以及我们自己代码中的 TypeError 都不算，否则一次偶发错误就会关闭结构化模式。
+    """
+    if isinstance(exc, NotImplementedError):
+        return True
+    if is_throttling_error(exc):
+        return False
+    status = get_status_code(exc)
+    if status is not None and status not in (400, 422):
+        return False
+    message = str(exc).lower()
+    return any(pattern.search(message) for pattern in SCHEMA_REJECTION_PATTERNS)
+
+
+async def _ainvoke_structured_once(structured_llm: Any, messages: List[Any], output_model: Type[BaseModel],
+                                   provider: str, source: str) -> BaseModel:
+    limiter = get_rate_limiter(provider)
+    async with limiter.slot(estimate_tokens(messages)) as ticket:
+        result = await structured_llm.ainvoke(messages)
+        ticket.record_response(result["raw"])
+
+    record_usage(output_model, "structured", result["raw"])
+    if result.get("parsed") is not None:
+        return result["parsed"]
+
+    # 供应商没有按 schema 返回（例如输出被截断），用文本解析兜底
+    raw_output = _raw_text(result["raw"])
+    try:
+        parsed = parse_llm_json_output(raw_output, output_model)
+    except ValueError:
+        record_parse_failure(output_model, "structured")
+        raise
+    record_parse_failure(output_model, "structured", repaired=True)
+    record_llm_failure(raw_output, result.get("parsing_error") or "结构化输出解析失败", source)
+    return parsed
+
+
+async def ainvoke_structured(llm: Any, messages: List[Any], output_model: Type[BaseModel],
+                             source: Optional[str] = None) -> BaseModel:
+    """
+    调用 LLM 并返回 output_model 实例；支持时使用结构化输出模式，否则回退到文本解析。
+
+    Args:
+        llm: LangChain 聊天模型实例。
+        messages: 发送给模型的消息列表。
+        output_model: 期望的输出结构。
+        source: 解析失败记录中的来源名，默认取 output_model 的类名。
+
+    Raises:
+        ValueError: 输出无法解析为 output_model（由调用方的 retry_async 决定是否重试）。
+    """
+    schema = output_model.__name__
+    source = source or schema
+    if structured_output_enabled(llm, output_model):
+        provider = get_provider(llm)
+        rejection: Optional[BaseException] = None
+        try:
+            structured_llm = llm.with_structured_output(output_model, method=_method_for(provider), include_raw=True)
+        except (NotImplementedError, ValueError) as e:
+            # 客户端不支持该方法或无法转换 schema
+            rejection = e
+        else:
+            try:
+                parsed = await _ainvoke_structured_once(structured_llm, messages, output_model, provider, source)
+            except ValueError:
+                raise
+            except Exception as e:
+                if not _is_schema_rejection(e):
+                    raise
+                rejection = e
+            else:
+                _record_acceptance(provider, schema)
+                return parsed
+        _record_rejection(provider, schema, rejection)
+
+    response = await ainvoke_llm(llm, messages)
+    record_usage(output_model, "text", response)
+    try:
+        return parse_llm_json_output(response.content, output_model)
+    except ValueError:
+        record_parse_failure(output_model, "text")
+        raise
+
+
+def _summarize(entry: Dict[str, int]) -> Dict[str, Any]:
+    calls = entry["calls"]
+    samples = entry["token_samples"]
+    return {
+        "calls": calls,
+        "parse_failures": entry["parse_failures"],
+        "repaired": entry["repaired"],
+        "parse_failure_rate": round(entry["parse_failures"] / calls, 4) if calls else None,
+        "avg_input_tokens": round(entry["input_tokens"] / samples, 1) if samples else None,
+        "avg_output_tokens": round(entry["output_tokens"] / samples, 1) if samples else None,
+    }
+
+
+def get_structured_output_stats() -> Dict[str, Any]:
+    """按 schema 对比两种模式的解析失败率与平均 token 用量。"""
+    with _stats_lock:
+        entries = {key: dict(value) for key, value in _stats.items()}
+        rejections = {key: dict(value) for key, value in _rejections.items()}
+    schemas: Dict[str, Dict[str, Any]] = {}
+    for (schema, mode), entry in sorted(entries.items()):
+        schemas.setdefault(schema, {})[mode] = _summarize(entry)
+    for modes in schemas.values():
+        structured, text = modes.get("structured"), modes.get("text")
+        if structured and text and structured["avg_output_tokens"] and text["avg_output_tokens"]:
+            # 正数表示结构化模式每次调用节省的 token 比例
+            modes["output_token_saving"] = round(1 - structured["avg_output_tokens"] / text["avg_output_tokens"], 4)
+            modes["input_token_saving"] = round(1 - structured["avg_input_tokens"] / text["avg_input_tokens"], 4)
+    return {
+        "enabled": LLM_STRUCTURED_OUTPUT,
+        "providers": sorted(LLM_STRUCTURED_OUTPUT_PROVIDERS),
+        "methods": {provider: _method_for(provider) for provider in sorted(LLM_STRUCTURED_OUTPUT_PROVIDERS)},
+        "rejected": {
+            f"{provider}:{schema}": {
+                "consecutive": entry["count"],
+                "reason": entry["reason"],
+                "disabled_for_seconds": (
+                    max(0.0, round(entry["disabled_until"] - time.time(), 1))
+                    if entry["disabled_until"] is not None else None
+                ),
+            }
+            for (provider, schema), entry in rejections.items()
+        },
+        "schemas": schemas,
+    }
+
+
+def reset_structured_output_stats() -> None:
+    """清空统计（以及被拒绝的 schema 记录，使其重新尝试结构化模式）。"""
+    with _stats_lock:
+        _stats.clear()
+        _rejections.clear()
@@ -1,164 +1,406 @@
+import os
+import codecs
+import shutil
 import asyncio
+import logging
+import tempfile
+import multiprocessing
 import concurrent.futures
-from fastapi import HTTPException
-from typing import List, Dict
-import io
+from collections import deque
+from fastapi import HTTPException, UploadFile
+from typing import AsyncIterator, BinaryIO, List, Dict, Optional, Tuple
 import zipfile
 import rarfile
 import py7zr
 import tarfile
+from charset_normalizer import from_bytes
+
+logger = logging.getLogger(__name__)
+
+# --- 流式解包的内存预算 ---
+# 上传文件按块写入临时文件，不整体读入内存
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 单个成员文件解压后的最大字节数，超过则跳过该文件（作业文本不应如此之大）
+ARCHIVE_MAX_MEMBER_BYTES = int(os.getenv("ARCHIVE_MAX_MEMBER_BYTES", str(16 * 1024 * 1024)))
+# 整个压缩包解压出的文本总字节数上限，同时防御压缩炸弹
+ARCHIVE_MAX_TOTAL_BYTES = int(os.getenv("ARCHIVE_MAX_TOTAL_BYTES", str(256 * 1024 * 1024)))
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2')
+
+# --- 解压/解码进程池 ---
+# 解压和字符集解码是 CPU 密集的同步操作，放到独立进程中分块并行处理，不阻塞事件循环
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 每个任务块包含的成员文件数
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "16"))
+# 同时在途的任务块数（限制解码结果在内存中的堆积）
+ARCHIVE_MAX_PENDING_CHUNKS = ARCHIVE_WORKERS * 2
+
+# --- 字符集检测 ---
+# 统计检测只取文件开头的一段样本，避免对大文件整体分析
+ENCODING_SAMPLE_BYTES = int(os.getenv("ENCODING_SAMPLE_BYTES", str(64 * 1024)))
+# 带 BOM 的文件直接按 BOM 确定编码（UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断）
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_archive_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+class ArchiveTooLargeError(Exception):
+    """压缩包解压后的内容超过 ARCHIVE_MAX_TOTAL_BYTES（工作进程中抛出，需可序列化）。"""
 
 async def hw_file2text(file): #TODO: file to text with OCR, or process with AI directly
     pass #这个感觉需要lang graph就是需要一个ai对直接读取+OCR和AI直接识别的综合
 
+def _try_decode(text_bytes: bytes, encoding: str) -> Optional[str]:
+    try:
+        return text_bytes.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+def _is_wide_encoding(encoding: str) -> bool:
+    return encoding.lower().replace('-', '_').startswith(('utf_16', 'utf_32'))
+
+def _trim_sample(sample: bytes, candidates: Optional[List[str]]) -> bytes:
+    """
+    修整截断后的样本，避免截断处落在多字节字符中间导致所有编码都检测失败。
+
+    单字节编码和 UTF-8 / GBK 这类兼容 ASCII 的编码退回到最后一个换行处；
+    UTF-16 / UTF-32（无 BOM，按候选编码或样本中出现 NUL 字节判断）中 b'\n' 只是半个码元，
+    按换行截断会错开码元边界，改为按 4 字节对齐截断。
+    """
+    if candidates:
+        wide = all(_is_wide_encoding(encoding) for encoding in candidates)
+    else:
+        wide = b'\x00' in sample
+    if wide:
+        return sample[:len(sample) - len(sample) % 4]
+    return sample[:sample.rfind(b'\n') + 1] or sample
+
+def _sniff_encoding(text_bytes: bytes, candidates: Optional[List[str]] = None) -> Optional[str]:
+    """
+    对开头的样本做统计检测，返回最可能的编码。
+
+    candidates 非空时只检验这些编码（比全量检测快一个数量级），都不符合时返回 None。
+    """
+    sample = text_bytes
+    if len(sample) > ENCODING_SAMPLE_BYTES:
+        sample = _trim_sample(sample[:ENCODING_SAMPLE_BYTES], candidates)
+    best = from_bytes(sample, cp_isolation=candidates).best()
+    return best.encoding if best is not None else None
+
+def detect_and_decode(text_bytes: bytes, encoding_hint: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    检测编码并解码字节。
+
+    依次尝试：BOM -> UTF-8 -> encoding_hint（同一压缩包中此前检测出的编码）-> 统计检测 -> GB18030。
+    GB18030、Big5 这类编码几乎能"成功"解码任意字节，所以 encoding_hint 也要经过统计检验，
+    只是检测范围限定为这一种编码。
+
+    Returns:
+        (解码后的文本, 检测出的编码)；BOM 和 UTF-8 不需要缓存，编码返回 None。
+        无法解码时文本为 None。
+    """
+    for bom, encoding in _BOM_ENCODINGS:
+        if text_bytes.startswith(bom):
+            return _try_decode(text_bytes, encoding), None
+
+    text = _try_decode(text_bytes, 'utf-8')
+    if text is not None:
+        return text, None
+
+    if encoding_hint and _sniff_encoding(text_bytes, [encoding_hint]):
+        text = _try_decode(text_bytes, encoding_hint)
+        if text is not None:
+            return text, encoding_hint
+
+    # GB18030 兼容 GBK，作为中文环境下的兜底
+    for encoding in (_sniff_encoding(text_bytes), 'gb18030'):
+        if encoding:
+            text = _try_decode(text_bytes, encoding)
+            if text is not None:
+                return text, encoding
+    return None, None
+
+def decode_bytes(text_bytes: bytes) -> str:
+    """检测编码并解码字节，失败则抛出HTTPException。"""
+    text, _ = detect_and_decode(text_bytes)
+    if text is None:
+        raise HTTPException(status_code=400, detail="无法识别文件编码，请将文件另存为 UTF-8 编码后重试。")
+    return text
+
 async def decode_text_bytes(text_bytes: bytes) -> str:
     """尝试以多种编码解码字节，失败则抛出HTTPException。"""
+    return decode_bytes(text_bytes)
+
+# 过滤掉常见的系统生成垃圾文件
+def is_valid_file(name: str) -> bool:
+    return not (name.startswith('__MACOSX') or '.DS_Store' in name)
+
+def upload_suffix(filename: str) -> str:
+    """返回上传文件的扩展名（保留 .tar.gz 这类双扩展名），用于临时文件命名。"""
+    lower = filename.lower()
+    for suffix in TAR_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return os.path.splitext(lower)[1]
+
+async def spool_upload(file: UploadFile) -> str:
+    """
+    将上传文件按块写入磁盘临时文件，返回临时文件路径（调用方负责删除）。
+    峰值内存只有一个块的大小，而不是整个上传文件。
+    """
+    fd, path = tempfile.mkstemp(prefix="smartai_upload_", suffix=upload_suffix(file.filename or ""))
     try:
-        return text_bytes.decode('utf-8')
-    except UnicodeDecodeError:
-        try:
-            return text_bytes.decode('gbk')
-        except UnicodeDecodeError:
-            raise HTTPException(status_code=400, detail="无法解码文件，请确保文件是 UTF-8 或 GBK 编码。")
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def _read_member(fileobj: BinaryIO) -> Optional[bytes]:
+    """读取单个成员文件，超过 ARCHIVE_MAX_MEMBER_BYTES 时跳过（不信任压缩包头中记录的大小）。"""
+    data = fileobj.read(ARCHIVE_MAX_MEMBER_BYTES + 1)
+    if len(data) > ARCHIVE_MAX_MEMBER_BYTES:
+        return None
+    return data
+
+def get_archive_executor() -> concurrent.futures.ProcessPoolExecutor:
+    """返回共享的解压进程池（首次使用时创建）。"""
+    global _archive_executor
+    if _archive_executor is None:
+        # 服务进程中有多个线程，用 spawn 启动子进程以避免 fork 继承锁状态
+        _archive_executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=ARCHIVE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"初始化解压进程池: {ARCHIVE_WORKERS} 个进程, 每块 {ARCHIVE_CHUNK_SIZE} 个文件")
+    return _archive_executor
+
+def _archive_kind(filename: str) -> str:
+    lower = filename.lower()
+    if lower.endswith('.zip'):
+        return "zip"
+    if lower.endswith('.rar'):
+        return "rar"
+    if lower.endswith('.7z'):
+        return "7z"
+    if lower.endswith(TAR_SUFFIXES):
+        return "tar"
+    if lower.endswith('.txt'): # TODO: 很重要的代码类文件，.doc, .docx, .pdf, .md
+        return "txt"
+    return "unsupported"
+
+def list_archive_members(path: str, kind: str) -> List[str]:
+    """列出 zip / rar 中的有效成员名（只读目录，不解压）。"""
+    if kind == "zip":
+        with zipfile.ZipFile(path, 'r') as zf:
+            return [info.filename for info in zf.infolist()
+                    if not info.is_dir() and is_valid_file(info.filename)]
+    if not rarfile:
+        raise ValueError("处理 .rar 文件需要 'rarfile' 库，请运行 'pip install rarfile'")
+    try:
+        with rarfile.RarFile(path, 'r') as rf:
+            return [info.filename for info in rf.infolist()
+                    if not info.is_dir() and is_valid_file(info.filename)]
+    except rarfile.UNRARError as e:
+        # 这是一个常见的服务器配置问题，提供明确的错误信息
+        raise RuntimeError(f"处理RAR文件失败: {e}. 请确保服务器上已安装 'unrar' 命令行工具。")
+
+def _safe_tar_members(tf: tarfile.TarFile) -> List[tarfile.TarInfo]:
+    """过滤掉非普通文件以及绝对路径、包含 .. 的成员，防止解压到目标目录之外。"""
+    members = []
+    for member in tf.getmembers():
+        if not member.isfile() or not is_valid_file(member.name):
+            continue
+        parts = member.name.replace('\\', '/').split('/')
+        if member.name.startswith('/') or '..' in parts:
+            continue
+        members.append(member)
+    return members
+
+def extract_archive_to_dir(path: str, kind: str) -> Tuple[str, List[str]]:
+    """
+    将 7z / tar 整体解压到临时目录（在工作进程中执行），返回 (目录, 有效成员相对路径列表)。
+    7z 通常是固实压缩、压缩的 tar 只能顺序解压，先落盘再分块读取比按成员随机读取快得多。
+    """
+    extract_dir = tempfile.mkdtemp(prefix="smartai_extract_")
+    try:
+        if kind == "7z":
+            if not py7zr:
+                raise ValueError("处理 .7z 文件需要 'py7zr' 库，请运行 'pip install py7zr'")
+            with py7zr.SevenZipFile(path, 'r') as szf:
+                entries = [entry for entry in szf.list() if not entry.is_directory and is_valid_file(entry.filename)]
+                if sum(entry.uncompressed or 0 for entry in entries) > ARCHIVE_MAX_TOTAL_BYTES:
+                    raise ArchiveTooLargeError(path)
+                szf.extractall(path=extract_dir)
+            names = [entry.filename for entry in entries]
+        else:
+            # 'r:*' 模式可以自动检测 tar 的压缩类型 (gz, bz2, etc.)
+            with tarfile.open(path, mode='r:*') as tf:
+                members = _safe_tar_members(tf)
+                if sum(member.size for member in members) > ARCHIVE_MAX_TOTAL_BYTES:
+                    raise ArchiveTooLargeError(path)
+                if hasattr(tarfile, "data_filter"):
+                    tf.extractall(extract_dir, members=members, filter="data")
+                else:
+                    tf.extractall(extract_dir, members=members)
+            names = [member.name for member in members]
+        return extract_dir, names
+    except BaseException:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        raise
+
+def read_archive_chunk(source: str, kind: str, names: List[str],
+                       encoding_hint: Optional[str] = None) -> List[Tuple[str, Optional[str], int, Optional[str], Optional[str]]]:
+    """
+    在工作进程中读取并解码一块成员文件。
+
+    Args:
+        source: zip / rar 为压缩包路径；7z / tar 为解压目录；txt 为文件路径。
+        kind: 压缩包类型（见 _archive_kind）。
+        names: 本块要处理的成员名。
+        encoding_hint: 同一压缩包中此前检测出的编码，优先尝试以跳过统计检测。
+
+    Returns:
+        [(文件名, 解码后的内容或 None, 原始字节数, 跳过原因或 None, 检测出的编码或 None), ...]
+    """
+    results = []
+
+    def add(name: str, member: BinaryIO):
+        nonlocal encoding_hint
+        data = _read_member(member)
+        if data is None:
+            results.append((name, None, 0, "too_large", None))
+            return
+        text, encoding = detect_and_decode(data, encoding_hint)
+        if text is None:
+            results.append((name, None, len(data), "decode_error", None))
+            return
+        if encoding:
+            encoding_hint = encoding
+        results.append((name, text, len(data), None, encoding))
+
+    if kind == "zip":
+        with zipfile.ZipFile(source, 'r') as zf:
+            for name in names:
+                with zf.open(name) as member:
+                    add(name, member)
+    elif kind == "rar":
+        with rarfile.RarFile(source, 'r') as rf:
+            for name in names:
+                with rf.open(name) as member:
+                    add(name, member)
+    else:
+        for name in names:
+            member_path = source if kind == "txt" else os.path.join(source, name)
+            if not os.path.isfile(member_path):
+                continue
+            with open(member_path, 'rb') as member:
+                add(name, member)
+    return results
+
+async def stream_files_from_archive(path: str, filename: str,
+                                    skipped: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[Dict[str, str]]:
+    """
+    逐个产出解码后的文件：{"filename": "学号_姓名.txt", "content": "文件内容..."}。
+
+    成员文件按 ARCHIVE_CHUNK_SIZE 分块提交到解压进程池并行读取和解码，同时在途的块数有上限，
+    结果按压缩包中的顺序产出；事件循环只负责调度，不做任何解压或解码。
+    检测出的编码会随后续任务块下发，同一压缩包内的文件通常只需统计检测一次。
+
+    过大或无法解码的单个文件会被跳过而不是让整个上传失败；传入 skipped 列表时，
+    被跳过的文件以 {"filename": ..., "reason": "too_large" | "decode_error"} 追加到其中。
+    """
+    kind = _archive_kind(filename)
+    if kind == "unsupported":
+        # 对于非txt的单个文件，可以返回空或抛出异常，这里选择忽略
+        logger.warning(f"忽略不支持的单个文件类型: {filename}")
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = get_archive_executor()
+    extract_dir = None
+    pending: deque = deque()
+    encoding_hint: Optional[str] = None
+    try:
+        if kind in ("zip", "rar"):
+            source = path
+            names = await asyncio.to_thread(list_archive_members, path, kind)
+        elif kind in ("7z", "tar"):
+            try:
+                extract_dir, names = await loop.run_in_executor(executor, extract_archive_to_dir, path, kind)
+            except ArchiveTooLargeError:
+                raise HTTPException(status_code=413, detail="压缩包解压后的内容过大。")
+            source = extract_dir
+        else:
+            source, names = path, [filename]
+
+        chunks = iter([names[i:i + ARCHIVE_CHUNK_SIZE] for i in range(0, len(names), ARCHIVE_CHUNK_SIZE)])
+
+        def submit_next_chunk() -> bool:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            pending.append(loop.run_in_executor(executor, read_archive_chunk, source, kind, chunk, encoding_hint))
+            return True
+
+        for _ in range(ARCHIVE_MAX_PENDING_CHUNKS):
+            if not submit_next_chunk():
+                break
+
+        total_bytes = 0
+        while pending:
+            results = await pending.popleft()
+            # 先记下本块检测出的编码，再提交下一块，让后续文件直接复用
+            for name, _, _, _, encoding in results:
+                if encoding and encoding != encoding_hint:
+                    logger.info(f"检测到文件编码 {encoding}: {name}")
+                    encoding_hint = encoding
+            submit_next_chunk()
+            for name, content, size, skip_reason, _ in results:
+                total_bytes += size
+                if total_bytes > ARCHIVE_MAX_TOTAL_BYTES:
+                    raise HTTPException(status_code=413, detail="压缩包解压后的内容过大。")
+                if skip_reason:
+                    if skip_reason == "too_large":
+                        logger.warning(f"跳过过大的文件: {name}（超过 {ARCHIVE_MAX_MEMBER_BYTES} 字节）")
+                    else:
+                        logger.warning(f"跳过无法识别编码的文件: {name}")
+                    if skipped is not None:
+                        skipped.append({"filename": name.split('/')[-1], "reason": skip_reason})
+                    continue
+                yield {"filename": name.split('/')[-1], "content": content}
+    finally:
+        for future in pending:
+            future.cancel()
+        if extract_dir:
+            shutil.rmtree(extract_dir, ignore_errors=True)
 
 # --- 主函数：处理上传的文件 ---
-async def extract_files_from_archive(file_bytes: bytes, filename: str) -> List[Dict[str, str]]:
+async def extract_files_from_archive(path: str, filename: str) -> List[Dict[str, str]]:
     """
-    处理一个以字节形式存在的上传文件（可能是压缩包或单个文本文件），
+    处理一个已写入磁盘的上传文件（可能是压缩包或单个文本文件），
     提取其中所有文本文件的文件名和内容。
 
     Args:
-        file_bytes: 文件内容的原始字节流。
+        path: 上传文件的临时文件路径（见 spool_upload）。
         filename: 上传文件的原始名称，用于判断文件类型。
 
     Returns:
         一个字典列表，每个字典代表一个文件，格式为:
         [{"filename": "学号_姓名.txt", "content": "文件内容..."}, ...]
-    
+
     Raises:
         ValueError: 如果 rarfile 或 py7zr 库未安装但尝试处理相应文件类型。
         Exception: 传递来自底层库的其他异常。
     """
-    files_data: List[Dict[str, str]] = []
-    file_in_memory = io.BytesIO(file_bytes)
-    
-    # 过滤掉常见的系统生成垃圾文件
-    def is_valid_file(name: str) -> bool:
-        return not (name.startswith('__MACOSX') or '.DS_Store' in name)
-
-    # 1. 处理 .zip 文件
-    if filename.lower().endswith('.zip'):
-        with zipfile.ZipFile(file_in_memory, 'r') as zf:
-            # Get all valid file info first
-            valid_files = [info for info in zf.infolist() 
-                          if not info.is_dir() and is_valid_file(info.filename)]
-            
-            # Function to process a single file
-            async def process_zip_file(info):
-                clean_filename = info.filename.split('/')[-1]
-                content_bytes = zf.read(info.filename)
-                content = await decode_text_bytes(content_bytes)
-                return {
-                    "filename": clean_filename,
-                    "content": content
-                }
-            
-            # Process files in parallel using asyncio
-            tasks = [process_zip_file(info) for info in valid_files]
-            results = await asyncio.gather(*tasks)
-            files_data.extend(results)
-
-    # 2. 处理 .rar 文件
-    elif filename.lower().endswith('.rar'):
-        if not rarfile:
-            raise ValueError("处理 .rar 文件需要 'rarfile' 库，请运行 'pip install rarfile'")
-        # rarfile 可能会因缺少 unrar 工具而抛出异常
-        try:
-            with rarfile.RarFile(file_in_memory, 'r') as rf:
-                # Get all valid file info first
-                valid_files = [info for info in rf.infolist() 
-                              if not info.is_dir() and is_valid_file(info.filename)]
-                
-                # Function to process a single file
-                async def process_rar_file(info):
-                    clean_filename = info.filename.split('/')[-1]
-                    content_bytes = rf.read(info.filename)
-                    content = await decode_text_bytes(content_bytes)
-                    return {
-                        "filename": clean_filename,
-                        "content": content
-                    }
-                
-                # Process files in parallel using asyncio
-                tasks = [process_rar_file(info) for info in valid_files]
-                results = await asyncio.gather(*tasks)
-                files_data.extend(results)
-        except rarfile.UNRARError as e:
-            # 这是一个常见的服务器配置问题，提供明确的错误信息
-            raise RuntimeError(f"处理RAR文件失败: {e}. 请确保服务器上已安装 'unrar' 命令行工具。")
-
-    # 3. 处理 .7z 文件
-    elif filename.lower().endswith('.7z'):
-        if not py7zr:
-            raise ValueError("处理 .7z 文件需要 'py7zr' 库，请运行 'pip install py7zr'")
-        with py7zr.SevenZipFile(file_in_memory, 'r') as szf:
-            # readall() 返回一个 {filename: BytesIO_object} 的字典
-            all_files = szf.readall()
-            valid_files = {name: bio for name, bio in all_files.items() if is_valid_file(name)}
-            
-            # Function to process a single file
-            async def process_7z_file(name_and_bio):
-                name, bio = name_and_bio
-                clean_filename = name.split('/')[-1]
-                content_bytes = bio.read()
-                content = await decode_text_bytes(content_bytes)
-                return {
-                    "filename": clean_filename,
-                    "content": content
-                }
-            
-            # Process files in parallel using asyncio
-            tasks = [process_7z_file(item) for item in valid_files.items()]
-            results = await asyncio.gather(*tasks)
-            files_data.extend(results)
-
-    # 4. 处理 .tar.* 系列文件
-    elif filename.lower().endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2')):
-        # 'r:*' 模式可以自动检测 tar 的压缩类型 (gz, bz2, etc.)
-        with tarfile.open(fileobj=file_in_memory, mode='r:*') as tf:
-            # Get all valid members first
-            valid_members = [member for member in tf.getmembers() 
-                           if member.isfile() and is_valid_file(member.name)]
-            
-            # Function to process a single file
-            async def process_tar_file(member):
-                clean_filename = member.name.split('/')[-1]
-                # 提取文件对象并读取内容
-                file_obj = tf.extractfile(member)
-                if file_obj:
-                    content_bytes = file_obj.read()
-                    content = await decode_text_bytes(content_bytes)
-                    return {
-                        "filename": clean_filename,
-                        "content": content
-                    }
-                return None
-            
-            # Process files in parallel using asyncio
-            tasks = [process_tar_file(member) for member in valid_members]
-            results = await asyncio.gather(*tasks)
-            files_data.extend([result for result in results if result is not None])
-
-    # 5. 如果不是已知的压缩包，则作为单个文件处理
-    else:
-        # 假设上传的单个文件也是 txt 文件
-        if filename.lower().endswith('.txt'): # TODO: 很重要的代码类文件，.doc, .docx, .pdf, .md
-             files_data.append({
-                "filename": filename,
-                "content": await decode_text_bytes(file_bytes)
-            })
-        else:
-            # 对于非txt的单个文件，可以返回空或抛出异常，这里选择忽略
-            print(f"忽略不支持的单个文件类型: {filename}")
-
-    return files_data
\ No newline at end of file
+    return [file_info async for file_info in stream_files_from_archive(path, filename)]
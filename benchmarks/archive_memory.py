@@ -0,0 +1,195 @@
+"""
+Peak memory of submission-archive ingestion: the old in-memory path versus the streaming path.
+
+Generates a large class archive (--files text submissions of --member-kb each, mixed Chinese
+and ASCII like real answers) as .zip and .7z, then ingests each one in a fresh interpreter:
+
+- "legacy": the pre-streaming path, kept here as the reference. It does `await file.read()`
+  of the whole upload, opens the bytes in memory, and keeps every decoded member in one list
+  (`zf.read` per member; for .7z every member is decompressed into memory at once, which
+  `szf.readall()` did before py7zr 1.0 removed it). Decoding uses the same decode_bytes as
+  the streaming path, so only the memory behaviour differs.
+- "streaming": backend.utils.spool_upload plus stream_files_from_archive, consuming each
+  file as the upload endpoint does and dropping it.
+
+Reported per run: the tracemalloc peak of Python allocations in the serving process, its peak
+RSS, and the peak RSS of the extraction pool workers. The streaming path must stay within the
+in-flight budget the module's limits imply. That budget is UPLOAD_CHUNK_SIZE plus
+ARCHIVE_MAX_PENDING_CHUNKS x ARCHIVE_CHUNK_SIZE decoded members, each up to BYTES_PER_CHAR
+bytes per source byte while it is pickled and unpickled. It does not grow with the archive.
+The exit status is 1 if any streaming run exceeds it. Run from the repository root:
+
+    python -m benchmarks.archive_memory --files 2000 --member-kb 100
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import zipfile
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from typing import Dict, Iterator, List, Tuple
+
+import py7zr
+import py7zr.io
+from starlette.datastructures import UploadFile
+
+from backend import utils
+
+# Python str plus its pickled copy: up to 2 bytes per char for CJK text, twice over
+BYTES_PER_CHAR = 4
+ANSWER_LINES = [
+    "解：由题意得 x^2 - 5x + 6 = 0，因式分解得 (x-2)(x-3) = 0。",
+    "所以 x = 2 或 x = 3，经检验均满足原方程。",
+    "def quick_sort(a):\n    return a if len(a) < 2 else quick_sort([x for x in a[1:] if x < a[0]]) + [a[0]]",
+    "证明：设三角形 ABC，过 A 作 BC 的平行线，由内错角相等可得三内角之和为 180 度。",
+    "The answer follows from the chain rule: d/dx f(g(x)) = f'(g(x)) g'(x).",
+]
+
+
+def submission(rng: random.Random, size: int) -> bytes:
+    """One student's answer file of roughly `size` bytes (UTF-8)."""
+    lines, length, number = [], 0, 1
+    while length < size:
+        line = f"{number}. {rng.choice(ANSWER_LINES)} #{rng.randrange(10 ** 6)}\n".encode("utf-8")
+        lines.append(line)
+        length += len(line)
+        number += 1
+    # Cut at the size without splitting a UTF-8 sequence
+    return b"".join(lines)[:size].decode("utf-8", errors="ignore").encode("utf-8")
+
+
+def members(files: int, member_kb: int, seed: int = 20261016) -> Iterator[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    for index in range(files):
+        yield f"hw1/PB{20110000 + index}_学生{index}.txt", submission(rng, member_kb * 1024)
+
+
+def build_archives(directory: str, files: int, member_kb: int) -> Dict[str, str]:
+    paths = {"zip": os.path.join(directory, "class.zip"), "7z": os.path.join(directory, "class.7z")}
+    with zipfile.ZipFile(paths["zip"], "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members(files, member_kb):
+            zf.writestr(name, data)
+    with py7zr.SevenZipFile(paths["7z"], "w") as szf:
+        for name, data in members(files, member_kb):
+            szf.writestr(data, name)
+    return paths
+
+
+async def legacy_ingest(upload: UploadFile) -> int:
+    file_bytes = await upload.read()
+    file_in_memory = io.BytesIO(file_bytes)
+    files_data: List[Dict[str, str]] = []
+    if upload.filename.endswith(".zip"):
+        with zipfile.ZipFile(file_in_memory, "r") as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and utils.is_valid_file(info.filename):
+                    files_data.append({"filename": info.filename.split("/")[-1],
+                                       "content": utils.decode_bytes(zf.read(info.filename))})
+    else:
+        with py7zr.SevenZipFile(file_in_memory, "r") as szf:
+            factory = py7zr.io.BytesIOFactory(utils.ARCHIVE_MAX_TOTAL_BYTES)
+            szf.extractall(factory=factory)
+            for name, bio in factory.products.items():
+                if utils.is_valid_file(name):
+                    bio.seek(0)
+                    files_data.append({"filename": name.split("/")[-1], "content": utils.decode_bytes(bio.read())})
+    return len(files_data)
+
+
+async def streaming_ingest(upload: UploadFile) -> int:
+    path = await utils.spool_upload(upload)
+    try:
+        count = 0
+        async for _ in utils.stream_files_from_archive(path, upload.filename):
+            count += 1
+        return count
+    finally:
+        os.remove(path)
+
+
+def measure(mode: str, archive: str) -> dict:
+    """Ingest one archive in this (fresh) process and report its memory peaks."""
+    ingest = legacy_ingest if mode == "legacy" else streaming_ingest
+    with open(archive, "rb") as f:
+        upload = UploadFile(file=f, filename=os.path.basename(archive))
+        tracemalloc.start()
+        started = time.perf_counter()
+        count = asyncio.run(ingest(upload))
+        elapsed = time.perf_counter() - started
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if utils._archive_executor is not None:
+        # Reap the pool so its workers show up in RUSAGE_CHILDREN
+        utils._archive_executor.shutdown()
+    return {
+        "files": count,
+        "seconds": round(elapsed, 2),
+        "traced_peak": traced_peak,
+        "rss_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "worker_rss_peak": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+def run_isolated(*args: str) -> dict:
+    """Run one step in a fresh interpreter: Linux carries ru_maxrss across fork and exec, so the
+    measuring process must not descend from one that held the generated archives."""
+    output = subprocess.run([sys.executable, "-m", "benchmarks.archive_memory", *args],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def mib(value: float) -> str:
+    return f"{value / 2 ** 20:8.1f}"
+
+
+def main(files: int, member_kb: int, modes: List[str]) -> int:
+    member_bytes = member_kb * 1024
+    budget = utils.UPLOAD_CHUNK_SIZE + (utils.ARCHIVE_MAX_PENDING_CHUNKS * utils.ARCHIVE_CHUNK_SIZE
+                                        * member_bytes * BYTES_PER_CHAR)
+    with tempfile.TemporaryDirectory(prefix="archive_memory_") as directory:
+        started = time.perf_counter()
+        archives = run_isolated("--build", directory, str(files), str(member_kb))
+        print(f"{files} files x {member_kb} KB = {files * member_bytes / 2 ** 20:.0f} MiB of text, "
+              f"generated in {time.perf_counter() - started:.0f}s; "
+              + ", ".join(f"{kind} {os.path.getsize(path) / 2 ** 20:.1f} MiB" for kind, path in archives.items()))
+        print(f"workers {utils.ARCHIVE_WORKERS}, chunk {utils.ARCHIVE_CHUNK_SIZE} files, "
+              f"{utils.ARCHIVE_MAX_PENDING_CHUNKS} chunks in flight -> streaming budget {mib(budget).strip()} MiB")
+        print(f"{'archive':<8}{'mode':<11}{'files':>7}{'seconds':>9}{'traced MiB':>12}{'RSS MiB':>10}"
+              f"{'worker MiB':>12}  budget")
+        over_budget = False
+        for kind, path in archives.items():
+            for mode in modes:
+                result = run_isolated("--measure", mode, path)
+                verdict = ""
+                if mode == "streaming":
+                    within = result["traced_peak"] <= budget
+                    over_budget |= not within
+                    verdict = "ok" if within else "EXCEEDED"
+                print(f"{kind:<8}{mode:<11}{result['files']:>7}{result['seconds']:>9.2f}"
+                      f"{mib(result['traced_peak']):>12}{mib(result['rss_peak']):>10}"
+                      f"{mib(result['worker_rss_peak']):>12}  {verdict}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of archive ingestion: in-memory vs streaming")
+    parser.add_argument("--files", type=int, default=2000, help="Submissions in the generated archives")
+    parser.add_argument("--member-kb", type=int, default=100, help="Size of each submission, in KiB")
+    parser.add_argument("--mode", choices=["legacy", "streaming", "both"], default="both")
+    parser.add_argument("--build", nargs=3, metavar=("DIR", "FILES", "MEMBER_KB"), help=argparse.SUPPRESS)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "ARCHIVE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.build:
+        print(json.dumps(build_archives(args.build[0], int(args.build[1]), int(args.build[2]))))
+        sys.exit()
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        sys.exit()
+    sys.exit(main(args.files, args.member_kb, ["legacy", "streaming"] if args.mode == "both" else [args.mode]))
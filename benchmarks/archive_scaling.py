@@ -0,0 +1,155 @@
+"""
+Archive extraction throughput against ARCHIVE_WORKERS, and event-loop lag while it runs.
+
+Generates a class archive (--files submissions of --member-kb each) as .zip and .7z. Every
+other submission is saved as GBK, as Windows students' files often are, so charset detection
+does real work. Each archive is ingested by:
+
+- "inline": the pre-pool path, kept here as the reference. It decompresses and decodes on the
+  event loop, the way the old process_zip_file / process_7z_file did: `zf.read` per member,
+  and for .7z the whole archive in one call (`szf.readall()` before py7zr 1.0 removed it).
+  The decoding (detect_and_decode with the per-archive encoding hint) matches the pool's, so
+  only where the work runs differs.
+- "pool": backend.utils.stream_files_from_archive with ARCHIVE_WORKERS set to each of
+  --workers.
+
+Each run uses a fresh interpreter, because ARCHIVE_WORKERS is read at import. A probe task
+sleeps PROBE_INTERVAL seconds in a loop and records how late it wakes up. That is the lag
+any other request on the same event loop (another upload, /health) sees during extraction.
+Throughput only scales up to the host's core count, which is printed first. Run from the
+repository root:
+
+    python -m benchmarks.archive_scaling --files 1000 --member-kb 100 --workers 1 2 4
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import zipfile
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Tuple
+
+import py7zr
+import py7zr.io
+
+from benchmarks.archive_memory import members
+
+PROBE_INTERVAL = 0.01
+
+
+def build_archives(directory: str, files: int, member_kb: int) -> Tuple[Dict[str, str], int]:
+    """Write the class archive in both formats; returns their paths and the uncompressed size."""
+    contents = [(name, data.decode("utf-8").encode("gbk") if index % 2 else data)
+                for index, (name, data) in enumerate(members(files, member_kb))]
+    paths = {"zip": os.path.join(directory, "class.zip"), "7z": os.path.join(directory, "class.7z")}
+    with zipfile.ZipFile(paths["zip"], "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in contents:
+            zf.writestr(name, data)
+    with py7zr.SevenZipFile(paths["7z"], "w") as szf:
+        for name, data in contents:
+            szf.writestr(data, name)
+    return paths, sum(len(data) for _, data in contents)
+
+
+async def inline_ingest(path: str) -> int:
+    from backend import utils
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, "r") as zf:
+            raw = [(info.filename, zf.read(info.filename)) for info in zf.infolist() if not info.is_dir()]
+    else:
+        with py7zr.SevenZipFile(path, "r") as szf:
+            factory = py7zr.io.BytesIOFactory(utils.ARCHIVE_MAX_TOTAL_BYTES)
+            szf.extractall(factory=factory)
+            raw = []
+            for name, bio in factory.products.items():
+                bio.seek(0)
+                raw.append((name, bio.read()))
+    count, encoding_hint = 0, None
+    for name, data in raw:
+        if not utils.is_valid_file(name):
+            continue
+        text, encoding = utils.detect_and_decode(data, encoding_hint)
+        encoding_hint = encoding or encoding_hint
+        count += text is not None
+        # The old gather() over members yielded to the loop once per member
+        await asyncio.sleep(0)
+    return count
+
+
+async def pool_ingest(path: str) -> int:
+    from backend import utils
+    count = 0
+    async for _ in utils.stream_files_from_archive(path, os.path.basename(path)):
+        count += 1
+    return count
+
+
+async def probe(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def measure(mode: str, path: str) -> dict:
+    """Ingest the archive in this (fresh) process while probing the event loop."""
+    from backend import utils
+    if mode == "pool":
+        # Start the workers before timing, as the long-running server would have
+        await asyncio.get_running_loop().run_in_executor(utils.get_archive_executor(), utils.is_valid_file, "warm")
+    lags: List[float] = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    # Let the probe start its first sleep before any extraction work
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    count = await (inline_ingest(path) if mode == "inline" else pool_ingest(path))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    lags.sort()
+    if utils._archive_executor is not None:
+        utils._archive_executor.shutdown()
+    return {"files": count, "seconds": elapsed, "samples": len(lags),
+            "p99": lags[int(len(lags) * 0.99)] if lags else 0.0, "max": lags[-1] if lags else 0.0}
+
+
+def run_isolated(mode: str, workers: int, path: str) -> dict:
+    env = dict(os.environ, ARCHIVE_WORKERS=str(workers))
+    output = subprocess.run([sys.executable, "-m", "benchmarks.archive_scaling", "--measure", mode, path],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(files: int, member_kb: int, workers: List[int]) -> None:
+    with tempfile.TemporaryDirectory(prefix="archive_scaling_") as directory:
+        paths, total = build_archives(directory, files, member_kb)
+        print(f"{os.cpu_count()} CPU(s); {files} files x {member_kb} KB ({total / 2 ** 20:.0f} MiB, half GBK); "
+              + ", ".join(f"{kind} {os.path.getsize(path) / 2 ** 20:.1f} MiB" for kind, path in paths.items())
+              + f"; probe every {PROBE_INTERVAL * 1000:.0f} ms")
+        print(f"{'archive':<8}{'mode':<8}{'workers':>8}{'files':>7}{'seconds':>9}{'MiB/s':>8}{'files/s':>9}"
+              f"{'lag p99 ms':>12}{'lag max ms':>12}")
+        runs = [("inline", 1)] + [("pool", count) for count in workers]
+        for kind, path in paths.items():
+            for mode, count in runs:
+                result = run_isolated(mode, count, path)
+                seconds = result["seconds"]
+                print(f"{kind:<8}{mode:<8}{count if mode == 'pool' else '-':>8}{result['files']:>7}{seconds:>9.2f}"
+                      f"{total / 2 ** 20 / seconds:>8.1f}{result['files'] / seconds:>9.0f}"
+                      f"{result['p99'] * 1000:>12.1f}{result['max'] * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive extraction throughput vs ARCHIVE_WORKERS, with event-loop lag")
+    parser.add_argument("--files", type=int, default=1000, help="Submissions in the generated archives")
+    parser.add_argument("--member-kb", type=int, default=100, help="Size of each submission, in KiB")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="ARCHIVE_WORKERS values to run")
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "ARCHIVE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(asyncio.run(measure(*args.measure))))
+        sys.exit()
+    main(args.files, args.member_kb, args.workers)
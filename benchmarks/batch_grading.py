@@ -0,0 +1,151 @@
+"""
+Token cost and wall clock of grading one question for a whole class: one LLM call per answer
+versus batched grading.
+
+A fake chat model counts the prompt and completion tokens of every call (estimated the way
+the rate limiter does, CHARS_PER_TOKEN characters per token) and answers after --latency
+seconds plus --per-result seconds for each graded answer in its reply, so a batch of K costs
+roughly what a real model spends decoding K results. Every question type in --types is graded
+for --students answers with a long stem and rubric, two ways:
+
+- "single": the per-type node (concept_node / calc_node / proof_node) once per answer,
+  which is how process_student_answer grades when batching is off.
+- "batched": batch_grade_node over chunks of get_batch_size(type) answers
+  (GRADING_BATCH_SIZE_<TYPE>), which is how grade_answer_batch grades cache misses.
+
+Both go through ainvoke_llm and its adaptive concurrency limit. The provider quotas
+(LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>) are disabled unless set, so only the call count and
+prompt size differ. Run from the repository root:
+
+    python -m benchmarks.batch_grading --students 300 --latency 1.0 --per-result 0.3
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import logging
+from typing import Dict, List
+
+# Measure the calls themselves, not the provider's RPM/TPM quota (the fake model counts as MODEL_PROVIDER)
+for provider in ("GEMINI", "ZHIPU"):
+    os.environ.setdefault(f"LLM_RPM_{provider}", "0")
+    os.environ.setdefault(f"LLM_TPM_{provider}", "0")
+
+import structlog
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.correct.batch import batch_grade_node, get_batch_size
+from backend.correct.calc import calc_node
+from backend.correct.concept import concept_node
+from backend.correct.proof import proof_node
+from backend.rate_limiter import CHARS_PER_TOKEN, estimate_tokens
+
+NODES = {"concept": concept_node, "calculation": calc_node, "proof": proof_node}
+QUESTION_TYPES = {"concept": "概念题", "calculation": "计算题", "proof": "证明题"}
+STEM = ("设函数 f(x) 在闭区间 [a, b] 上连续，在开区间 (a, b) 内可导，且 f(a) = f(b)。"
+        "请说明罗尔定理的条件与结论，给出其几何意义，并举例说明当任一条件不满足时结论可能不成立。") * 8
+RUBRIC = ("满分 10 分。条件完整 3 分（连续、可导、端点值相等各 1 分）；结论正确 2 分；几何意义 2 分；"
+          "反例 3 分，每个条件的反例 1 分，反例需说明哪一条件不满足。表述不严谨酌情扣分。") * 4
+ANSWER = ("罗尔定理：若 f 在 [a,b] 上连续、在 (a,b) 内可导且 f(a)=f(b)，则存在 ξ∈(a,b) 使 f'(ξ)=0。"
+          "几何意义是曲线上存在水平切线。反例：f(x)=|x| 在 [-1,1] 上不可导，结论不成立。")
+ANSWER_ID = re.compile(r"=== Answer (A\d+) ===")
+
+
+def graded(answer_id: str = "") -> Dict:
+    result = {"score": 8, "max_score": 10, "confidence": 0.9, "comment": "条件与结论正确，反例不完整。",
+              "hits": ["罗尔定理"], "steps": [{"step_no": 1, "desc": "条件与结论", "is_correct": True, "score": 5},
+                                             {"step_no": 2, "desc": "反例", "is_correct": False, "score": 3}]}
+    return dict(answer_id=answer_id, **result) if answer_id else result
+
+
+class CountingChatModel(BaseChatModel):
+    """Grades every answer in the prompt with a fixed result and counts calls and tokens."""
+    latency: float = 1.0
+    per_result: float = 0.3
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("the grading nodes only use the async interface")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        answer_ids = ANSWER_ID.findall(messages[-1].content)
+        if answer_ids:
+            content = json.dumps({"results": [graded(answer_id) for answer_id in answer_ids]}, ensure_ascii=False)
+        else:
+            content = json.dumps(graded(), ensure_ascii=False)
+        await asyncio.sleep(self.latency + self.per_result * max(1, len(answer_ids)))
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(messages)
+        self.completion_tokens += len(content) // CHARS_PER_TOKEN + 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+def answer_unit(internal_type: str, text: str) -> Dict:
+    """The answer unit process_student_answer builds for each node."""
+    unit = {"q_id": "q1", "stem": STEM, "text": text,
+            "correct_ans": "No answers provided. Please think deeply and derive correct answers based on the problem!"}
+    if internal_type == "calculation":
+        unit["steps"] = [{"step_no": 1, "content": text, "formula": ""}]
+    elif internal_type == "proof":
+        unit["steps"] = [{"step_no": 1, "content": text}]
+    return unit
+
+
+async def grade_single(internal_type: str, answers: List[str], llm: BaseChatModel) -> int:
+    node = NODES[internal_type]
+    corrections = await asyncio.gather(*(node(answer_unit(internal_type, text), RUBRIC, 10.0, llm) for text in answers))
+    return sum(correction.complete for correction in corrections)
+
+
+async def grade_batched(internal_type: str, answers: List[str], llm: BaseChatModel) -> int:
+    size = get_batch_size(internal_type)
+    chunks = [answers[i:i + size] for i in range(0, len(answers), size)]
+    results = await asyncio.gather(*(
+        batch_grade_node(internal_type, "q1", QUESTION_TYPES[internal_type], STEM, RUBRIC, chunk, 10.0, llm)
+        for chunk in chunks))
+    return sum(correction is not None for batch in results for correction in batch)
+
+
+async def run_mode(mode: str, internal_type: str, answers: List[str], latency: float, per_result: float) -> None:
+    llm = CountingChatModel(latency=latency, per_result=per_result)
+    grade = grade_single if mode == "single" else grade_batched
+    started = time.perf_counter()
+    graded_count = await grade(internal_type, answers, llm)
+    elapsed = time.perf_counter() - started
+    size = 1 if mode == "single" else get_batch_size(internal_type)
+    print(f"{internal_type:<13}{mode:<9}{size:>6}{graded_count:>8}{llm.calls:>7}{llm.prompt_tokens:>12}"
+          f"{llm.completion_tokens:>12}{elapsed:>9.2f}")
+
+
+def main(students: int, latency: float, per_result: float, types: List[str]) -> None:
+    answers = [f"{ANSWER}（学生 {index}）" for index in range(students)]
+    print(f"{students} answers per question, stem {len(STEM)} chars, rubric {len(RUBRIC)} chars, "
+          f"answer ~{len(answers[0])} chars; fake LLM {latency * 1000:.0f} ms + {per_result * 1000:.0f} ms per result")
+    print(f"{'type':<13}{'mode':<9}{'batch':>6}{'graded':>8}{'calls':>7}{'prompt tok':>12}{'output tok':>12}{'seconds':>9}")
+    for internal_type in types:
+        for mode in ("single", "batched"):
+            # A new event loop gets new limiters, so every run starts from LLM_INITIAL_INFLIGHT
+            asyncio.run(run_mode(mode, internal_type, answers, latency, per_result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grading token cost and wall clock: one call per answer vs batched")
+    parser.add_argument("--students", type=int, default=300, help="Answers graded per question type")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM latency per call, in seconds")
+    parser.add_argument("--per-result", type=float, default=0.3, help="Extra fake latency per graded answer in a reply")
+    parser.add_argument("--types", nargs="+", choices=sorted(NODES), default=["concept", "calculation", "proof"])
+    args = parser.parse_args()
+    # Keep the report readable: the nodes log every prompt and response
+    logging.disable(logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+    main(args.students, args.latency, args.per_result, args.types)
@@ -0,0 +1,148 @@
+"""
+Parse-throughput benchmark: backend.llm_json.extract_json versus the pre-llm_json parsing path.
+
+Inputs are the fuzz corpus in tests/data/llm_json (small real-world output shapes) plus three
+large grading outputs generated deterministically here: a valid one with escaped LaTeX, the
+same with raw LaTeX backslashes as models usually emit them, and a truncated one. The legacy
+path is the old per-node parse (greedy regex, json.loads, comma/comment cleanup) followed by the
+old parse_llm_json_output repairs (backslash doubling, fix_incomplete_json), kept here verbatim
+as the reference. Run from the repository root:
+
+    python -m benchmarks.json_parse --repeat 20
+"""
+import os
+import re
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+
+from backend.llm_json import extract_json
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "data", "llm_json")
+FAILED = object()
+
+
+def fix_incomplete_json(json_str: str) -> str:
+    """The removed dependencies.fix_incomplete_json, unchanged."""
+    open_braces = json_str.count('{')
+    close_braces = json_str.count('}')
+    open_brackets = json_str.count('[')
+    close_brackets = json_str.count(']')
+    json_str_fixed = json_str
+    while close_braces < open_braces:
+        json_str_fixed += '}'
+        close_braces += 1
+    while close_brackets < open_brackets:
+        json_str_fixed += ']'
+        close_brackets += 1
+    quote_count = json_str_fixed.count('"')
+    if quote_count % 2 != 0:
+        json_str_fixed += '"'
+    last_quote_pos = json_str_fixed.rfind('"')
+    if last_quote_pos != -1:
+        text_after_last_quote = json_str_fixed[last_quote_pos + 1:]
+        if text_after_last_quote.count('{') > text_after_last_quote.count('}'):
+            json_str_fixed += '}'
+        elif text_after_last_quote.count('[') > text_after_last_quote.count(']'):
+            json_str_fixed += ']'
+    json_str_fixed = json_str_fixed.strip()
+    if json_str_fixed.startswith('{') and not json_str_fixed.endswith('}'):
+        json_str_fixed += '}'
+    elif json_str_fixed.startswith('[') and not json_str_fixed.endswith(']'):
+        json_str_fixed += ']'
+    return json_str_fixed
+
+
+def legacy_parse(text: str) -> Any:
+    """Old node parse plus the old parse_llm_json_output repairs; FAILED where both gave up."""
+    match = re.search(r'\{.*\}', text, re.DOTALL) or re.search(r'\[.*\]', text, re.DOTALL)
+    if not match:
+        return FAILED
+    json_str = match.group(0)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError as e:
+        error = str(e)
+    try:
+        cleaned = re.sub(r',(\s*[}\]])', r'\1', json_str)
+        cleaned = re.sub(r'//.*?(?=\n|$)', '', cleaned)
+        cleaned = re.sub(r'/\*.*?\*/', '', cleaned, flags=re.DOTALL)
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    try:
+        if "invalid \\escape" in error.lower():
+            return json.loads(json_str.replace('\\', '\\\\'))
+        return json.loads(fix_incomplete_json(json_str))
+    except json.JSONDecodeError:
+        return FAILED
+
+
+def large_output(steps: int, raw_latex: bool) -> str:
+    """A grading response with many steps whose comments carry LaTeX, wrapped in prose."""
+    latex = r"\frac{a}{b} \times \beta + \nabla f \neq \alpha_{i}"
+    result = {
+        "score": 7.5, "max_score": 10, "confidence": 0.8, "comment": "Mostly correct.",
+        "steps": [{"step_no": index + 1, "desc": f"Step {index + 1}: uses ${latex}$ and expands the sum over i",
+                   "is_correct": index % 3 != 0, "score": 0.5} for index in range(steps)],
+    }
+    body = json.dumps(result, ensure_ascii=False, indent=2)
+    if raw_latex:
+        # Models usually emit single backslashes inside JSON strings
+        body = body.replace("\\\\", "\\")
+    return "Here is the result:\n```json\n" + body + "\n```\nLet me know if you need more detail."
+
+
+def inputs(steps: int) -> List[Tuple[str, str]]:
+    items = []
+    for file_name in sorted(os.listdir(CORPUS_DIR)):
+        if file_name.endswith(".txt"):
+            with open(os.path.join(CORPUS_DIR, file_name), encoding="utf-8") as f:
+                items.append((file_name[:-4], f.read()))
+    valid = large_output(steps, raw_latex=False)
+    items.append(("large_valid", valid))
+    items.append(("large_raw_latex", large_output(steps, raw_latex=True)))
+    items.append(("large_truncated", valid[:int(len(valid) * 0.9)]))
+    return items
+
+
+def time_parse(parse: Callable[[str], Any], text: str, repeat: int) -> Tuple[float, Any]:
+    result = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            result = parse(text)
+        except ValueError:
+            result = FAILED
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main(repeat: int, steps: int) -> None:
+    print(f"{'input':<28}{'KB':>8}{'extract_json':>16}{'legacy':>16}  legacy result")
+    totals: Dict[str, float] = {"new": 0.0, "old": 0.0}
+    size = 0
+    for name, text in inputs(steps):
+        new_seconds, new_result = time_parse(extract_json, text, repeat)
+        old_seconds, old_result = time_parse(legacy_parse, text, repeat)
+        if old_result is FAILED:
+            verdict = "failed"
+        elif old_result == new_result:
+            verdict = "same"
+        else:
+            verdict = "different"
+        totals["new"] += new_seconds
+        totals["old"] += old_seconds
+        size += len(text.encode("utf-8"))
+        print(f"{name:<28}{len(text.encode('utf-8')) / 1024:>8.1f}{new_seconds * 1000:>13.3f} ms"
+              f"{old_seconds * 1000:>13.3f} ms  {verdict}")
+    print(f"{'total':<28}{size / 1024:>8.1f}{totals['new'] * 1000:>13.3f} ms{totals['old'] * 1000:>13.3f} ms")
+    print(f"extract_json throughput: {size / totals['new'] / 2 ** 20:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="extract_json vs legacy LLM JSON parsing throughput")
+    parser.add_argument("--repeat", type=int, default=20, help="Parses per input (the mean is reported)")
+    parser.add_argument("--steps", type=int, default=2500, help="Steps in the generated large outputs")
+    args = parser.parse_args()
+    main(args.repeat, args.steps)
@@ -0,0 +1,159 @@
+"""
+Benchmark: threadpool `llm.invoke` versus native `ainvoke_llm` against a local fake LLM server.
+
+Starts an OpenAI-compatible /chat/completions endpoint on localhost (in its own process, so it
+does not compete with the client for the GIL) that answers every request with a fixed grading
+JSON after a fixed delay, points a real ChatOpenAI client at it, and
+issues the same number of concurrent calls two ways:
+
+- "threadpool": `run_in_threadpool(llm.invoke, ...)`, the path the grading nodes used before;
+  concurrency is capped by Starlette's thread pool (40 threads by default).
+- "async": `backend.llm_invoke.ainvoke_llm`, the path the nodes use now; concurrency is capped
+  by the adaptive in-flight budget (LLM_INITIAL_INFLIGHT .. LLM_MAX_INFLIGHT).
+
+The provider quota (LLM_RPM_ZHIPU / LLM_TPM_ZHIPU) is disabled unless set, so only concurrency
+is measured. Run from the repository root:
+
+    python -m benchmarks.llm_async --calls 1000 --latency 2
+"""
+import os
+import json
+import time
+import sys
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from typing import List
+
+# Measure concurrency, not the provider's RPM/TPM quota
+os.environ.setdefault("LLM_RPM_ZHIPU", "0")
+os.environ.setdefault("LLM_TPM_ZHIPU", "0")
+
+import uvicorn
+from fastapi import FastAPI, Request
+from langchain.schema import HumanMessage
+from langchain_openai import ChatOpenAI
+from starlette.concurrency import run_in_threadpool
+
+from backend.llm_invoke import ainvoke_llm
+from backend.rate_limiter import get_limiter_metrics
+
+GRADING_JSON = json.dumps({
+    "score": 8, "max_score": 10, "confidence": 0.9, "comment": "Correct method, arithmetic slip in step 2.",
+    "steps": [{"step_no": 1, "desc": "Set up the equation", "is_correct": True, "score": 4},
+              {"step_no": 2, "desc": "Solve", "is_correct": False, "score": 4}],
+})
+PROMPT = "Grade the following answer to a calculation problem.\n" + "x = 42\n" * 50
+
+
+def fake_llm_app(latency: float) -> FastAPI:
+    app = FastAPI()
+    app.state.in_flight = 0
+    app.state.peak = 0
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        app.state.peak = 0
+        return {}
+
+    @app.get("/stats")
+    async def stats():
+        return {"peak": app.state.peak}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.in_flight += 1
+        app.state.peak = max(app.state.peak, app.state.in_flight)
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            app.state.in_flight -= 1
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": GRADING_JSON}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 60, "total_tokens": 180},
+        }
+
+    return app
+
+
+def serve(port: int, latency: float) -> None:
+    uvicorn.run(fake_llm_app(latency), host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def start_server(latency: float) -> "tuple[subprocess.Popen, str]":
+    """Start the fake LLM server in a child process; returns it and its base URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.llm_async", "--serve", str(port),
+                             "--latency", str(latency)])
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("fake LLM server did not start")
+
+
+def server_stats(url: str, reset: bool = False) -> dict:
+    request = urllib.request.Request(f"{url}/stats/reset" if reset else f"{url}/stats", method="POST" if reset else "GET")
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+async def run_mode(mode: str, llm: ChatOpenAI, calls: int) -> float:
+    messages = [HumanMessage(content=PROMPT)]
+
+    async def one_call():
+        if mode == "threadpool":
+            return await run_in_threadpool(llm.invoke, messages)
+        return await ainvoke_llm(llm, messages, stream=False)
+
+    started = time.monotonic()
+    responses = await asyncio.gather(*(one_call() for _ in range(calls)))
+    elapsed = time.monotonic() - started
+    assert all(json.loads(response.content)["score"] == 8 for response in responses)
+    return elapsed
+
+
+async def main(calls: int, latency: float, modes: List[str]) -> None:
+    proc, url = start_server(latency)
+    try:
+        llm = ChatOpenAI(model="fake-grader", api_key="sk-fake", base_url=f"{url}/v1",
+                         temperature=0.0, max_retries=0, timeout=600)
+        # Warm up the connection pool and the limiter
+        await ainvoke_llm(llm, [HumanMessage(content="ping")], stream=False)
+
+        print(f"{calls} calls, {latency * 1000:.0f} ms server latency, {os.cpu_count()} CPUs")
+        for mode in modes:
+            server_stats(url, reset=True)
+            elapsed = await run_mode(mode, llm, calls)
+            print(f"{mode:>10}: {elapsed:6.2f}s  {calls / elapsed:7.1f} calls/s  "
+                  f"peak in flight {server_stats(url)['peak']}")
+        metrics = get_limiter_metrics().get("zhipu")
+        if metrics:
+            print(f"async limiter: concurrency limit {metrics['concurrency_limit']}, "
+                  f"avg queue wait {metrics['avg_queue_wait_s']}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Threadpool vs native async LLM invocation against a fake server")
+    parser.add_argument("--calls", type=int, default=1000, help="Concurrent calls per mode")
+    parser.add_argument("--latency", type=float, default=2.0, help="Fake server latency per call, in seconds")
+    parser.add_argument("--mode", choices=["threadpool", "async", "both"], default="both")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.latency)
+        sys.exit()
+    asyncio.run(main(args.calls, args.latency, ["threadpool", "async"] if args.mode == "both" else [args.mode]))
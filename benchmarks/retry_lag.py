@@ -0,0 +1,131 @@
+"""
+Event-loop lag while LLM calls are being retried: the old blocking retry loop versus retry_async.
+
+A fake chat model answers every prompt with a fixed grading JSON after a fixed latency, but
+fails the first --failures attempts of each prompt with a 503. --calls gradings run
+concurrently while a probe task sleeps PROBE_INTERVAL seconds in a loop and records how late
+it wakes up: the lag any other request on the same event loop (another student's grading,
+/health) would see. Two modes:
+
+- "legacy": the retry loop the grading nodes had before backend/retry.py, kept here as the
+  reference: up to 3 attempts with time.sleep(2) between them.
+- "calc_node": the real backend.correct.calc.calc_node, which retries through retry_async
+  (exponential backoff with full jitter on asyncio.sleep, shared retry budget).
+
+Run from the repository root:
+
+    python -m benchmarks.retry_lag --calls 10 --failures 2
+"""
+import time
+import asyncio
+import argparse
+import logging
+import statistics
+from typing import Any, Dict, List, Optional
+
+import structlog
+from langchain.schema import HumanMessage
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.correct.calc import calc_node
+from backend.llm_invoke import ainvoke_llm
+
+GRADING_JSON = ('{"score": 8, "max_score": 10, "confidence": 0.9, "comment": "Correct method.",'
+                ' "steps": [{"step_no": 1, "desc": "Solve", "is_correct": true, "score": 8}]}')
+PROBE_INTERVAL = 0.01
+
+
+class ServiceUnavailable(Exception):
+    """What the provider SDKs raise for an HTTP 503."""
+    status_code = 503
+
+
+class FlakyChatModel(BaseChatModel):
+    """Fails the first `failures` attempts of every distinct prompt, then answers."""
+    latency: float = 0.2
+    failures: int = 2
+    attempts: Dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "flaky-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("the grading nodes only use the async interface")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        prompt = messages[-1].content
+        self.attempts[prompt] = self.attempts.get(prompt, 0) + 1
+        if self.attempts[prompt] <= self.failures:
+            raise ServiceUnavailable("503 Service Unavailable")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=GRADING_JSON))])
+
+
+async def legacy_grade(llm: BaseChatModel, prompt: str) -> Any:
+    """The pre-retry.py loop from calc/concept/proof_node, without its logging and JSON parse."""
+    max_retries = 3
+    retry_count = 0
+    while retry_count < max_retries:
+        try:
+            return await ainvoke_llm(llm, [HumanMessage(content=prompt)])
+        except Exception:
+            retry_count += 1
+            if retry_count >= max_retries:
+                raise
+            time.sleep(2)
+
+
+async def node_grade(llm: BaseChatModel, prompt: str) -> Any:
+    answer_unit = {"q_id": "q1", "stem": prompt, "text": "x = 42", "correct_ans": "42", "steps": []}
+    correction = await calc_node(answer_unit, "Full marks for the right value.", 10.0, llm)
+    assert correction.complete, correction.comment
+    return correction
+
+
+async def probe(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_mode(mode: str, calls: int, failures: int, latency: float) -> None:
+    llm = FlakyChatModel(latency=latency, failures=failures, attempts={})
+    grade = legacy_grade if mode == "legacy" else node_grade
+    lags: List[float] = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(grade(llm, f"Problem {index}: solve x = 6 * 7.") for index in range(calls)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    lags.sort()
+    p99: Optional[float] = lags[int(len(lags) * 0.99)] if lags else None
+    print(f"{mode:>10}: {elapsed:6.2f}s total  {sum(llm.attempts.values())} attempts  "
+          f"probe lag p50 {statistics.median(lags) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  "
+          f"max {lags[-1] * 1000:7.1f} ms  ({len(lags)} samples)")
+
+
+async def main(calls: int, failures: int, latency: float, modes: List[str]) -> None:
+    print(f"{calls} concurrent gradings, first {failures} attempts of each fail with 503, "
+          f"{latency * 1000:.0f} ms fake LLM latency, probe every {PROBE_INTERVAL * 1000:.0f} ms")
+    for mode in modes:
+        await run_mode(mode, calls, failures, latency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop lag during LLM retries: blocking loop vs retry_async")
+    parser.add_argument("--calls", type=int, default=10, help="Concurrent gradings")
+    parser.add_argument("--failures", type=int, default=2, help="Failed attempts per grading before it succeeds (max 2)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM latency per attempt, in seconds")
+    parser.add_argument("--mode", choices=["legacy", "calc_node", "both"], default="both")
+    args = parser.parse_args()
+    # Keep the report readable: every failed attempt is logged by both retry paths
+    logging.disable(logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.ERROR))
+    asyncio.run(main(args.calls, args.failures, args.latency,
+                     ["legacy", "calc_node"] if args.mode == "both" else [args.mode]))
@@ -0,0 +1,151 @@
+"""
+Time to first result and total latency of an answer upload: extract-then-analyze versus the pipeline.
+
+Generates a class archive (--files submissions of --member-kb each, as .zip and .7z) whose
+filenames carry no student id, so every submission goes to LLM segmentation. A fake chat model answers each
+segmentation after --latency seconds with a fixed split and the student id taken from the
+filename. Two modes, each in a fresh interpreter so the adaptive LLM limiter starts from its
+defaults:
+
+- "sequential": the pre-pipeline handle_answer_upload, kept here as the reference. It
+  extracts every file with extract_files_from_archive, then calls analyze_submissions on
+  the list.
+- "pipelined": the current handle_answer_upload path, analyze_submissions fed by
+  stream_files_from_archive through the UPLOAD_QUEUE_SIZE queue.
+
+Reported: when the first LLM call starts, when the first result comes back, and the total
+time until every student is segmented, all counted from the start of the upload. The provider
+quotas (LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>) are disabled unless set, so only the pipeline
+is measured. Run from the repository root:
+
+    python -m benchmarks.upload_pipeline --files 1000 --member-kb 100 --latency 0.3
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import zipfile
+import tempfile
+import subprocess
+from typing import Dict, Optional
+
+# Measure the pipeline, not the provider's RPM/TPM quota (the fake model counts as MODEL_PROVIDER)
+for provider in ("GEMINI", "ZHIPU"):
+    os.environ.setdefault(f"LLM_RPM_{provider}", "0")
+    os.environ.setdefault(f"LLM_TPM_{provider}", "0")
+
+import py7zr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.routers.hw_preview import analyze_submissions
+from backend.utils import extract_files_from_archive, get_archive_executor, is_valid_file, stream_files_from_archive
+from benchmarks.archive_memory import submission
+
+PROBLEMS = {
+    f"q{index}": {"q_id": f"q{index}", "number": str(index), "type": "计算题", "stem": f"第 {index} 题题干"}
+    for index in range(1, 4)
+}
+FILENAME_NUMBER = re.compile(r"第(\d+)份作业")
+
+
+class SegmentingChatModel(BaseChatModel):
+    """Answers every segmentation after `latency` seconds and records when the first one started and ended."""
+    latency: float = 0.3
+    started: float = 0.0
+    first_call: Optional[float] = None
+    first_result: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "segmenting-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("analyze_submissions only uses the async interface")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.first_call is None:
+            self.first_call = time.perf_counter() - self.started
+        await asyncio.sleep(self.latency)
+        number = FILENAME_NUMBER.search(messages[-1].content).group(1)
+        answer = {
+            "stu_id": f"PB{20110000 + int(number)}", "stu_name": "张三",
+            "stu_ans": [{"q_id": q_id, "number": problem["number"], "type": problem["type"],
+                         "content": f"第 {problem['number']} 题作答", "flag": []}
+                        for q_id, problem in PROBLEMS.items()],
+        }
+        if self.first_result is None:
+            self.first_result = time.perf_counter() - self.started
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(answer, ensure_ascii=False)))])
+
+
+def build_archives(directory: str, files: int, member_kb: int) -> Dict[str, str]:
+    rng = random.Random(20261016)
+    contents = [(f"hw1/第{index}份作业_学生.txt", submission(rng, member_kb * 1024)) for index in range(files)]
+    paths = {"zip": os.path.join(directory, "class.zip"), "7z": os.path.join(directory, "class.7z")}
+    with zipfile.ZipFile(paths["zip"], "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in contents:
+            zf.writestr(name, data)
+    with py7zr.SevenZipFile(paths["7z"], "w") as szf:
+        for name, data in contents:
+            szf.writestr(data, name)
+    return paths
+
+
+async def measure(mode: str, path: str, latency: float) -> Dict[str, float]:
+    """Upload the archive once in this (fresh) process."""
+    # Start the extraction workers before timing, as the long-running server would have
+    await asyncio.get_running_loop().run_in_executor(get_archive_executor(), is_valid_file, "warm")
+    llm = SegmentingChatModel(latency=latency, started=time.perf_counter())
+    filename = os.path.basename(path)
+    if mode == "sequential":
+        files_data = await extract_files_from_archive(path, filename)
+    else:
+        files_data = stream_files_from_archive(path, filename)
+    students = await analyze_submissions(files_data=files_data, problems_data=PROBLEMS,
+                                         student_store={}, llm_factory=lambda: llm)
+    total = time.perf_counter() - llm.started
+    get_archive_executor().shutdown()
+    return {"students": len(students), "first_call": llm.first_call, "first_result": llm.first_result, "total": total}
+
+
+def run_isolated(mode: str, path: str, latency: float) -> Dict[str, float]:
+    output = subprocess.run([sys.executable, "-m", "benchmarks.upload_pipeline", "--latency", str(latency),
+                             "--measure", mode, path], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(files: int, member_kb: int, latency: float) -> None:
+    with tempfile.TemporaryDirectory(prefix="upload_pipeline_") as directory:
+        paths = build_archives(directory, files, member_kb)
+        print(f"{files} submissions x {member_kb} KB ("
+              + ", ".join(f"{kind} {os.path.getsize(path) / 2 ** 20:.1f} MiB" for kind, path in paths.items())
+              + f"), all segmented by a fake LLM with {latency * 1000:.0f} ms latency")
+        print(f"{'archive':<8}{'mode':<12}{'students':>9}{'first call s':>14}{'first result s':>16}{'total s':>9}")
+        for kind, path in paths.items():
+            for mode in ("sequential", "pipelined"):
+                result = run_isolated(mode, path, latency)
+                print(f"{kind:<8}{mode:<12}{result['students']:>9}{result['first_call']:>14.2f}"
+                      f"{result['first_result']:>16.2f}{result['total']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer upload latency: extract-then-analyze vs pipelined")
+    parser.add_argument("--files", type=int, default=1000, help="Submissions in the generated archives")
+    parser.add_argument("--member-kb", type=int, default=100, help="Size of each submission, in KiB")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM latency per segmentation, in seconds")
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "ARCHIVE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        # Keep stdout to the one JSON line: analyze_submissions prints every file it sends to the LLM
+        sys.stdout = sys.stderr
+        result = asyncio.run(measure(*args.measure, args.latency))
+        sys.stdout = sys.__stdout__
+        print(json.dumps(result))
+        sys.exit()
+    main(args.files, args.member_kb, args.latency)
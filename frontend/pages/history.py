@@ -7,6 +7,7 @@ Provides complete management of grading history, including:
 3. Record management: delete, edit draft records
 """
 
+import time
 import streamlit as st
 import requests
 # import json
@@ -100,6 +101,40 @@ def sync_completed_records():
 
 
 
+def fetch_job_statuses(job_ids, timeout=5):
+    """Fetch the compact status of many jobs with a single backend request.
+    
+    Returns a dict of job_id -> status dict ({"status", "done", "total", ...}).
+    Jobs are missing from the result if the backend could not be reached.
+    """
+    if not job_ids:
+        return {}
+    try:
+        response = requests.post(
+            f"{st.session_state.backend}/ai_grading/job_status",
+            json={"job_ids": list(job_ids)},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json().get("jobs", {})
+    except requests.RequestException:
+        return {}
+
+def fetch_job_summaries(job_ids, timeout=5):
+    """Fetch job summaries (completion time, counts, aggregate scores) in one request."""
+    if not job_ids:
+        return {}
+    try:
+        response = requests.post(
+            f"{st.session_state.backend}/ai_grading/job_summaries",
+            json={"job_ids": list(job_ids)},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json().get("jobs", {})
+    except requests.RequestException:
+        return {}
+
 def render_tabs():
     """Render main tabs"""
     tab1, tab2 = st.tabs(["✅ Completed Grading", "📊 Overview"])
@@ -220,27 +255,24 @@ def render_completed_records():
             reverse=True
         )
         
-        for job_id in sorted_job_ids:
-            if job_id.startswith("MOCK_JOB_"):
-                continue  # Mock tasks handled above
+        real_job_ids = [job_id for job_id in sorted_job_ids if not job_id.startswith("MOCK_JOB_")]
+        # Query backend for the latest status and completion time of all tasks in one request
+        summaries = fetch_job_summaries(real_job_ids)
 
+        for job_id in real_job_ids:
             task_info = st.session_state.jobs[job_id]
-            status = "pending"  # Default status
-            try:
-                # Query backend for the latest task status
-                result = requests.get(f"{st.session_state.backend}/ai_grading/grade_result/{job_id}", timeout=3)
-                if result.ok:
-                    status = result.json().get("status", "pending")
-            except requests.RequestException:
-                status = "error" # Network request failed
+            summary = summaries.get(job_id, {})
 
             # Only add tasks with status "completed" to display list
-            if status == "completed":
+            if summary.get("status") == "completed":
+                completed_at = summary.get("completed_at")
                 all_completed_display[job_id] = {
                     "task_name": task_info.get("name", "Unknown Task"),
                     "submitted_at": task_info.get("submitted_at", "Unknown Time"),
-                    "completed_at": "Just now", # Could fetch accurate completion time from backend
-                    "status": "completed"
+                    "completed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(completed_at)) if completed_at else "Just now",
+                    "status": "completed",
+                    "student_count": summary.get("student_count", 0),
+                    "average_percentage": summary.get("average_percentage")
                 }
 
     if not all_completed_display:
@@ -255,6 +287,11 @@ def render_completed_records():
     # --- Change 4: Adjust display and navigation logic ---
     # Iterate through the safely constructed all_completed_display dictionary to show records.
     for job_id, record in sorted_records_list:
+        summary_text = ""
+        if record.get("student_count"):
+            summary_text = f" | <strong>Students:</strong> {record['student_count']}"
+            if record.get("average_percentage") is not None:
+                summary_text += f" | <strong>Average:</strong> {record['average_percentage']:.1f}%"
         with st.container():
             st.markdown(f"""
             <div style="background: white; padding: 1.5rem; border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); margin: 1rem 0; border-left: 4px solid #10B981;">
@@ -263,7 +300,7 @@ def render_completed_records():
                         <h3 style="color: #1E3A8A; margin: 0 0 0.5rem 0;">✅ {record['task_name']}</h3>
                         <p style="color: #64748B; margin: 0; font-size: 0.9rem;">
                             <strong>Submitted At:</strong> {record['submitted_at']} | 
-                            <strong>Completed At:</strong> {record['completed_at']}
+                            <strong>Completed At:</strong> {record['completed_at']}{summary_text}
                         </p>
                     </div>
                     <div>
@@ -360,33 +397,14 @@ def render_statistics_overview():
     
     # Calculate completed tasks from jobs
     if "jobs" in st.session_state and st.session_state.jobs:
-        # Create a copy of the keys to avoid "dictionary changed size during iteration" error
-        job_ids = list(st.session_state.jobs.keys())
-        for job_id in job_ids:
-            # Check if job_id still exists (in case it was deleted during iteration)
-            if job_id not in st.session_state.jobs:
-                continue
-                
-            # Skip mock jobs entirely
-            if job_id.startswith("MOCK_JOB_"):
-                continue
-                
-            task_info = st.session_state.jobs[job_id]
-            
-            # Check if this is a mock job
-            is_mock = task_info.get("is_mock", False)
-            
-            if is_mock:
-                continue
-            
-            try:
-                result = requests.get(f"{st.session_state.backend}/ai_grading/grade_result/{job_id}", timeout=5)
-                result.raise_for_status()
-                status = result.json().get("status", "Unknown")
-                if status == "completed":
-                    completed_count += 1
-            except:
-                continue
+        # Skip mock jobs entirely
+        job_ids = [
+            job_id for job_id, task_info in list(st.session_state.jobs.items())
+            if not job_id.startswith("MOCK_JOB_") and not task_info.get("is_mock", False)
+        ]
+        # One status request for all jobs instead of fetching every full result
+        statuses = fetch_job_statuses(job_ids)
+        completed_count += sum(1 for status in statuses.values() if status.get("status") == "completed")
     
     # Add mock data to statistics
     if 'sample_data' in st.session_state and st.session_state.sample_data:
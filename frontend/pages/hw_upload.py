@@ -3,6 +3,7 @@ import requests
 # import os
 # from PIL import Image
 import time
+import json
 from utils import *
 
 # --- Page basic settings ---
@@ -120,6 +121,9 @@ def render_upload_section():
                     # st.session_state.processed_data = response.json()      
                     students = response.json()                            
                     st.session_state.processed_data = students   #以stu_id为key索引
+                    # 被后端跳过的文件（过大或无法识别编码），在预览页提示
+                    st.session_state.skipped_files = json.loads(response.headers.get("X-Skipped-Files", "[]"))
+                    st.session_state.skipped_count = int(response.headers.get("X-Skipped-Count", "0"))
 
                     # print(st.session_state.processed_data)
           
@@ -130,10 +130,13 @@ def render_question_overview():
             # 为题干编辑和评分标准编辑分别创建独立的session state
             edit_stem_key = f"edit_stem_{q_id}"
             edit_criterion_key = f"edit_criterion_{q_id}"
+            edit_reference_key = f"edit_reference_{q_id}"
             if edit_stem_key not in st.session_state:
                 st.session_state[edit_stem_key] = False
             if edit_criterion_key not in st.session_state:
                 st.session_state[edit_criterion_key] = False
+            if edit_reference_key not in st.session_state:
+                st.session_state[edit_reference_key] = False
 
             # --- 模式1: 编辑题干 ---
             if st.session_state[edit_stem_key]:
@@ -182,8 +185,32 @@ def render_question_overview():
                     if st.button("❌ Cancel", key=f"cancel_criterion_btn_{q_id}", use_container_width=True):
                         st.session_state[edit_criterion_key] = False
                         st.rerun()
+
+            # --- 模式3: 编辑参考答案（编程题的测试用例用它校验） ---
+            elif st.session_state[edit_reference_key]:
+                st.markdown(f"**Editing Reference Solution: {q.get('number', '')}**")
+                new_reference = st.text_area("Edit reference solution (used to check the generated test cases)",
+                                             value=q.get('reference_solution', ''), key=f"q_reference_{q_id}", height=200)
+
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("✅ Save Reference", key=f"save_reference_btn_{q_id}", type="primary", use_container_width=True):
+                        if isinstance(st.session_state.prob_data, dict):
+                            if q_id in st.session_state.prob_data:
+                                st.session_state.prob_data[q_id]['reference_solution'] = new_reference
+                            elif 'problems' in st.session_state.prob_data:
+                                # Handle old format
+                                if isinstance(st.session_state.prob_data['problems'], dict) and q_id in st.session_state.prob_data['problems']:
+                                    st.session_state.prob_data['problems'][q_id]['reference_solution'] = new_reference
+                        st.session_state.prob_changed = True
+                        st.session_state[edit_reference_key] = False
+                        st.rerun()
+                with col2:
+                    if st.button("❌ Cancel", key=f"cancel_reference_btn_{q_id}", use_container_width=True):
+                        st.session_state[edit_reference_key] = False
+                        st.rerun()
             
-            # --- 模式3: 正常显示 ---
+            # --- 模式4: 正常显示 ---
             else:
                 col1, col2, col3 = st.columns([0.2, 0.65, 0.15])
                 with col1:
@@ -219,6 +246,9 @@ def render_question_overview():
                     st.markdown(f"**{q.get('number', 'N/A')}:** {q.get('stem', 'Stem content is empty')}")
                     # 新增：显示评分标准
                     st.markdown(f"**Scoring Criteria:** *{q.get('criterion', 'Empty')}*")
+                    if q.get('type') == "编程题" and q.get('reference_solution'):
+                        st.markdown("**Reference Solution:**")
+                        st.code(q['reference_solution'])
 
                 with col3:
                     if st.button("✏️ Edit Stem", key=f"edit_stem_btn_{q_id}"):
@@ -228,6 +258,9 @@ def render_question_overview():
                     if st.button("✏️ Edit Criteria", key=f"edit_criterion_btn_{q_id}"):
                         st.session_state[edit_criterion_key] = True
                         st.rerun()
+                    if q.get('type') == "编程题" and st.button("✏️ Edit Reference", key=f"edit_reference_btn_{q_id}"):
+                        st.session_state[edit_reference_key] = True
+                        st.rerun()
 
 
 
@@ -61,6 +61,17 @@ if 'processed_data' not in st.session_state or not st.session_state.get('process
     # st.page_link("pages/hw_upload.py", label="Return to Answer Upload Page", icon="📤")
     st.stop()
 
+SKIPPED_REASONS = {
+    "too_large": "file too large",
+    "decode_error": "unrecognized text encoding",
+}
+if st.session_state.get('skipped_files'):
+    skipped_count = st.session_state.get('skipped_count', len(st.session_state.skipped_files))
+    st.warning(f"{skipped_count} file(s) in the upload were skipped. Re-save them as UTF-8 text and upload them separately if needed.")
+    with st.expander("Skipped files"):
+        for item in st.session_state.skipped_files:
+            st.write(f"- {item['filename']}: {SKIPPED_REASONS.get(item['reason'], item['reason'])}")
+
 
 # --- Sidebar Navigation ---
 with st.sidebar:
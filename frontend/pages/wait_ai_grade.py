@@ -215,7 +215,7 @@ if 'checking_job_id' in st.session_state:
     if st.button("🔄 Refresh Status"):
         try:
             response = requests.get(
-                f"{st.session_state.backend}/ai_grading/grade_result/{job_id}",
+                f"{st.session_state.backend}/ai_grading/job_status/{job_id}",
                 timeout=10
             )
             if response.status_code == 200:
@@ -248,7 +248,7 @@ if 'checking_job_id' in st.session_state:
     # Auto-check status with backend reconnection capability
     try:
         response = requests.get(
-            f"{st.session_state.backend}/ai_grading/grade_result/{job_id}",
+            f"{st.session_state.backend}/ai_grading/job_status/{job_id}",
             timeout=10
         )
         if response.status_code == 200:
@@ -258,7 +258,15 @@ if 'checking_job_id' in st.session_state:
             
             # Update display based on status
             if status == "pending":
-                status_container.info("🕒 Task is processing, please wait...")
+                if result.get("total"):
+                    eta = result.get("eta_seconds")
+                    eta_text = f", about {int(eta)}s remaining" if eta else ""
+                    status_container.info(
+                        f"🕒 Task is processing: {result.get('done', 0)}/{result['total']} students graded"
+                        f" ({result.get('failed', 0)} failed){eta_text}, please wait..."
+                    )
+                else:
+                    status_container.info("🕒 Task is processing, please wait...")
             elif status == "completed":
                 success_message = "✅ Task completed! Please go to Grading Results page to view"
                 status_container.success(success_message)
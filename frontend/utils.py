@@ -179,9 +179,11 @@ def update_ans():
 
 def get_master_poller_html(jobs_json: str, backend_url: str) -> str:
     """
-    Generate a "master" polling script.
+    Generate a "master" job watcher script.
     This script receives a JSON object containing all task details,
-    and internally starts polling for each job_id.
+    and subscribes to the backend's progress event stream (SSE) for each job_id.
+    The backend pushes a single small event when a job finishes, so idle tabs
+    no longer poll the full result payload.
     """
     be = backend_url.rstrip("/")
     # jobs_json is now a JSON string of a dictionary, for example:
@@ -199,42 +201,43 @@ def get_master_poller_html(jobs_json: str, backend_url: str) -> str:
             jobsData = {{}};
         }}
 
-        // Get all task IDs to be polled (i.e., the keys of the object)
+        // Get all task IDs to watch (i.e., the keys of the object)
         const jobIds = Object.keys(jobsData);
 
         if (jobIds.length === 0) {{
             return;
         }}
 
-        // Define a function to start polling for a single task
-        // <-- Receives job_id and the corresponding task details object
-        const startPollingForJob = (jobId, taskDetails) => {{
+        // Notify the user once and jump to the results page
+        const onJobCompleted = (jobId, taskDetails) => {{
             const completedKey = `job-completed-${{jobId}}`;
-
             if (sessionStorage.getItem(completedKey)) {{
                 return;
             }}
+            // --- Core modification: Generate user-friendly popup message ---
+            const taskName = taskDetails.name || "Unnamed task";
+            const submittedAt = taskDetails.submitted_at || "Unknown time";
+            alert("The task you submitted at [" + submittedAt + "]: " + taskName + " has been successfully completed! Please jump to the grading results page to view");
+            // Mark as completed to prevent duplicate popups
+            sessionStorage.setItem(completedKey, 'true');
+            // --- New feature: Refresh current page ---
+            window.parent.location.href = '/pages/grade_results.py';
+            // -----------------------------
+        }};
 
+        // Fallback for browsers without EventSource: poll the job status
+        const startPollingForJob = (jobId, taskDetails) => {{
             const intervalId = setInterval(async () => {{
                 try {{
-                    // The polling URL still only uses job_id
-                    const resp = await fetch(backend + '/ai_grading/grade_result/' + jobId);
+                    const resp = await fetch(backend + '/ai_grading/job_metadata/' + jobId);
                     if (!resp.ok) return;
 
                     const data = await resp.json();
                     if (data && data.status === 'completed') {{
                         clearInterval(intervalId);
-                        if (!sessionStorage.getItem(completedKey)) {{
-                            // --- Core modification: Generate user-friendly popup message ---
-                            const taskName = taskDetails.name || "Unnamed task";
-                            const submittedAt = taskDetails.submitted_at || "Unknown time";
-                            alert("The task you submitted at [" + submittedAt + "]: " + taskName + " has been successfully completed! Please jump to the grading results page to view");
-                            // Mark as completed to prevent duplicate popups
-                            sessionStorage.setItem(completedKey, 'true');
-                            // --- New feature: Refresh current page ---
-                            window.parent.location.href = '/pages/grade_results.py';
-                            // -----------------------------
-                        }}
+                        onJobCompleted(jobId, taskDetails);
+                    }} else if (data && (data.status === 'error' || data.status === 'not_found')) {{
+                        clearInterval(intervalId);
                     }}
                 }} catch (err) {{
                     // Silently handle errors
@@ -242,9 +245,40 @@ def get_master_poller_html(jobs_json: str, backend_url: str) -> str:
             }}, 3000);
         }};
 
-        // Iterate through all task IDs, start polling for each one, and pass in their detailed information
+        // Define a function to start watching a single task
+        // <-- Receives job_id and the corresponding task details object
+        const startWatchingJob = (jobId, taskDetails) => {{
+            const completedKey = `job-completed-${{jobId}}`;
+
+            if (sessionStorage.getItem(completedKey)) {{
+                return;
+            }}
+
+            if (!window.EventSource) {{
+                startPollingForJob(jobId, taskDetails);
+                return;
+            }}
+
+            // EventSource reconnects on its own after network errors
+            const source = new EventSource(backend + '/ai_grading/events/' + jobId);
+            source.addEventListener('completed', () => {{
+                source.close();
+                onJobCompleted(jobId, taskDetails);
+            }});
+            source.addEventListener('error', (event) => {{
+                // Job-level error event (connection errors carry no data)
+                if (event.data) {{
+                    source.close();
+                }}
+            }});
+            source.addEventListener('not_found', () => {{
+                source.close();
+            }});
+        }};
+
+        // Iterate through all task IDs, start watching each one, and pass in their detailed information
         jobIds.forEach(jobId => {{
-            startPollingForJob(jobId, jobsData[jobId]);
+            startWatchingJob(jobId, jobsData[jobId]);
         }});
 
     }})();
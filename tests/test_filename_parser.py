@@ -0,0 +1,17 @@
+"""Student id and name parsing from submission filenames."""
+import pytest
+
+from backend.filename_parser import parse_student_filename
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("PB20111639_张三.txt", ("PB20111639", "张三")),
+    ("hw/作业1_PB20111639_张三.txt", ("PB20111639", "张三")),
+    ("PB20111639张三.txt", ("PB20111639", "张三")),
+    ("张三PB20111639.txt", ("PB20111639", "张三")),
+    ("2021012345欧阳·娜娜.txt", ("2021012345", "欧阳·娜娜")),
+    ("PB20111639.txt", ("PB20111639", "")),
+    ("作业1.txt", ("", "")),
+])
+def test_default_templates(filename, expected):
+    assert parse_student_filename(filename, "default") == expected
@@ -0,0 +1,30 @@
+"""Grading cache versions and multi-key lookups."""
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from backend.correct.prompt_utils import get_template_version
+from backend.grading_cache import GradingCache, get_prompt_template_version
+from backend.models import Correction
+
+
+def correction(score):
+    return Correction(q_id="q1", type="概念题", score=score, max_score=10.0, confidence=0.9,
+                      comment="ok", steps=[], complete=True)
+
+
+def test_batched_version_covers_the_batch_template():
+    single = get_prompt_template_version("concept")
+    batched = get_prompt_template_version("concept", batched=True)
+    assert single == get_template_version("concept")
+    assert batched == f"{single}+{get_template_version('batch')}"
+
+
+def test_get_returns_first_hit_and_counts_one_lookup():
+    cache = GradingCache(":memory:", 10)
+    cache.put_sync("batched", correction(3.0))
+    assert cache.get_sync("single", "batched").score == 3.0
+    cache.put_sync("single", correction(7.0))
+    assert cache.get_sync("single", "batched").score == 7.0
+    assert cache.get_sync("other", "missing") is None
+    assert (cache.hits, cache.misses) == (2, 1)
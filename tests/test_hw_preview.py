@@ -0,0 +1,40 @@
+"""Answer segmentation: student ids taken from filenames when the LLM finds none."""
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.routers.hw_preview import FALLBACK_ID_KEY, analyze_submissions
+
+PROBLEMS = {"q1": {"q_id": "q1", "number": "1", "type": "计算题", "stem": "求 6 * 7。"}}
+
+
+class AnonymousChatModel(BaseChatModel):
+    """Segments every submission but never recognises the student."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "anonymous-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        answer = {"stu_id": "", "stu_name": "", "stu_ans": [
+            {"q_id": "q1", "number": "1", "type": "计算题", "content": "42", "flag": []}]}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(answer)))])
+
+
+def test_fallback_ids_are_basenames_and_unique():
+    files = [{"filename": f"{folder}/作业1.txt", "content": "1. 42"} for folder in ("a", "b", "c")]
+    store = {}
+    students = asyncio.run(analyze_submissions(files, PROBLEMS, store, llm_factory=AnonymousChatModel))
+    assert list(students) == ["作业1", "作业1_2", "作业1_3"]
+    assert all(stu["stu_id"] == stu_id and FALLBACK_ID_KEY not in stu for stu_id, stu in students.items())
+    assert store == students
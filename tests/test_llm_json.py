@@ -0,0 +1,88 @@
+"""extract_json against a corpus of real-world LLM output shapes, plus a seeded random round trip."""
+import os
+import json
+import random
+import string
+
+import pytest
+
+from backend.llm_json import _parse_value, extract_json
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "data", "llm_json")
+CORPUS = sorted(name[:-4] for name in os.listdir(CORPUS_DIR) if name.endswith(".txt"))
+# Corpus entries that are parsed as a top-level array rather than the default (object first)
+CONTAINERS = {"array_only": list}
+FUZZ_CASES = int(os.getenv("LLM_JSON_FUZZ_CASES", "500"))
+FUZZ_SEED = int(os.getenv("LLM_JSON_FUZZ_SEED", "20261016"))
+# No control characters directly before a letter: "\n" + "abla" would read as LaTeX \nabla,
+# the documented trade-off of the LaTeX heuristic
+_ALPHABET = string.ascii_letters + string.digits + " .,:;!?'\"\\/{}[]()$^_-+=*%#@" + "αβ∑∫√→中文答案"
+
+
+def _load(name, suffix):
+    with open(os.path.join(CORPUS_DIR, name + suffix), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", CORPUS)
+def test_corpus(name):
+    expected = json.loads(_load(name, ".json"))
+    assert extract_json(_load(name, ".txt"), container=CONTAINERS.get(name)) == expected
+
+
+def random_string(rng):
+    text = "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 24)))
+    return text + ("\n" if rng.random() < 0.2 else "")
+
+
+def random_value(rng, depth=0):
+    kind = rng.randint(0, 7 if depth < 4 else 4)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return round(rng.uniform(-1000, 1000), rng.randint(0, 6))
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind in (3, 4):
+        return random_string(rng)
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 5))]
+    return random_object(rng, depth + 1)
+
+
+def random_object(rng, depth=0):
+    return {random_string(rng): random_value(rng, depth) for _ in range(rng.randint(0, 6))}
+
+
+def random_document(rng):
+    value = random_object(rng)
+    text = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2, 4]))
+    return value, text
+
+
+def test_fuzz_round_trip():
+    rng = random.Random(FUZZ_SEED)
+    for _ in range(FUZZ_CASES):
+        value, text = random_document(rng)
+        wrapped = rng.choice(["", "Result:\n```json\n", "说明文字 "]) + text + rng.choice(["", "\n```", "\nDone."])
+        assert extract_json(wrapped, container=dict) == value, text
+        # The tolerant scanner alone must agree with the standard decoder on valid JSON
+        assert _parse_value(text, 0, 0)[0] == value, text
+
+
+def test_fuzz_truncation_never_crashes():
+    rng = random.Random(FUZZ_SEED + 1)
+    for _ in range(FUZZ_CASES):
+        _, text = random_document(rng)
+        prefix = text[:rng.randint(1, len(text))]
+        try:
+            result = extract_json(prefix, container=dict)
+        except ValueError:
+            continue
+        assert isinstance(result, dict), prefix
+
+
+@pytest.mark.parametrize("text", ["[" * 10000, "[" * 10000 + "]" * 10000, '{"score": ' + "[" * 10000 + "}"])
+def test_deep_nesting_raises_value_error(text):
+    with pytest.raises(ValueError):
+        extract_json(text)
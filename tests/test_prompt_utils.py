@@ -0,0 +1,63 @@
+"""Every argument of every prepare_*_prompt helper must reach its rendered prompt."""
+import pytest
+
+from backend.correct.prompt_utils import (
+    MissingPlaceholderError,
+    PromptTemplate,
+    prepare_batch_prompt,
+    prepare_calc_prompt,
+    prepare_concept_prompt,
+    prepare_programming_prompt,
+    prepare_proof_prompt,
+    prepare_test_suite_prompt,
+)
+
+
+def assert_contains(prompt, expected):
+    missing = [value for value in expected if value not in prompt]
+    assert not missing, f"missing from prompt: {missing}"
+
+
+def test_concept_prompt():
+    prompt = prepare_concept_prompt("concept", ["<CONTEXT>"], "<PROBLEM>", "<ANSWER>", "<RUBRIC>")
+    assert_contains(prompt, ["<CONTEXT>", "<PROBLEM>", "<ANSWER>", "<RUBRIC>"])
+
+
+def test_calc_prompt():
+    prompt = prepare_calc_prompt("calc", "<PROBLEM>", "<ANSWER>", "<CORRECT>", "<RUBRIC>")
+    assert_contains(prompt, ["<PROBLEM>", "<ANSWER>", "<CORRECT>", "<RUBRIC>"])
+
+
+def test_proof_prompt():
+    prompt = prepare_proof_prompt("proof", "<PROBLEM>", [{"content": "<STEP>"}], "<RUBRIC>")
+    assert_contains(prompt, ["<PROBLEM>", "<STEP>", "<RUBRIC>"])
+    # proof_node reads the overall score from "score"
+    assert '"score"' in prompt and "overall_score" not in prompt
+
+
+def test_programming_prompt():
+    execution_result = {"pass_rate": 0.5, "coverage": 0.25, "output": "<STDOUT>", "error": "<STDERR>",
+                        "logs": "<LOGS>", "functions": ["solve(a, b)"]}
+    prompt = prepare_programming_prompt("programming", "<PROBLEM>", "<CODE>",
+                                        [{"input": "<IN>", "expected_output": "<OUT>"}], execution_result, "<RUBRIC>")
+    assert_contains(prompt, ["<PROBLEM>", "<CODE>", "<IN>", "<OUT>", "50.00%", "25.00%",
+                             "<STDOUT>", "<STDERR>", "<LOGS>", "solve(a, b)", "<RUBRIC>"])
+
+
+def test_batch_prompt_keeps_braces_in_answers():
+    prompt = prepare_batch_prompt("batch", "<TYPE>", ["<CONTEXT>"], "<PROBLEM>", "<CORRECT>", "<RUBRIC>",
+                                  [{"answer_id": "A1", "text": "<ANSWER> {problem}"}])
+    assert_contains(prompt, ["<TYPE>", "<CONTEXT>", "<PROBLEM>", "<CORRECT>", "<RUBRIC>", "<ANSWER> {problem}",
+                             "1 different"])
+
+
+def test_test_suite_prompt():
+    prompt = prepare_test_suite_prompt("test_suite", "<PROBLEM>", "<RUBRIC>", "<REFERENCE>", 9173)
+    assert_contains(prompt, ["<PROBLEM>", "<RUBRIC>", "<REFERENCE>", "9173"])
+
+
+def test_missing_placeholder_raises():
+    template = PromptTemplate("t", "t.txt", 'Grade {answer} as {"score": 1}')
+    assert template.render(answer="x") == 'Grade x as {"score": 1}'
+    with pytest.raises(MissingPlaceholderError, match="answer"):
+        template.render()
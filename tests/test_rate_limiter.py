@@ -0,0 +1,44 @@
+"""Adaptive concurrency limit: slow start, spike tolerance and backoff."""
+from backend import rate_limiter
+from backend.rate_limiter import AdaptiveConcurrencyLimiter
+
+
+def limiter(initial=8, max_limit=64):
+    return AdaptiveConcurrencyLimiter(initial, 1, max_limit)
+
+
+def test_slow_start_doubles_each_window_until_the_cap():
+    window = limiter()
+    for _ in range(8):
+        window._adjust(1.0, False)
+    assert window.limit == 16
+    for _ in range(100):
+        window._adjust(1.0, False)
+    assert window.limit == 64
+
+
+def test_single_slow_response_does_not_back_off():
+    window = limiter()
+    window._adjust(1.0, False)
+    window._adjust(1.0 * rate_limiter.LATENCY_SPIKE_FACTOR * 2, False)
+    window._adjust(1.0, False)
+    assert window.limit == 10 and window.slow_start
+
+
+def test_consecutive_spikes_back_off_and_end_slow_start():
+    window = limiter()
+    window._adjust(1.0, False)
+    for _ in range(rate_limiter.LATENCY_SPIKE_COUNT):
+        window._adjust(100.0, False)
+    assert window.limit == 9 * rate_limiter.BACKOFF_RATIO
+    assert not window.slow_start
+    before = window.limit
+    window._adjust(30.0, False)
+    assert window.limit == before + 1.0 / before
+
+
+def test_throttling_backs_off_once_per_cooldown():
+    window = limiter()
+    window._adjust(1.0, True)
+    window._adjust(1.0, True)
+    assert window.limit == 8 * rate_limiter.BACKOFF_RATIO
@@ -0,0 +1,110 @@
+"""Sandbox limits and isolation against hostile submissions, in both execution modes."""
+import os
+import asyncio
+
+import pytest
+
+from backend.correct import sandbox
+from backend.correct.sandbox import PROJECT_ROOT, run_cases
+
+MODES = ["cold", "warm"] if hasattr(os, "fork") else ["cold"]
+# Process and filesystem containment come from the namespaces, not from rlimits alone
+isolated_only = pytest.mark.skipif(not sandbox._isolated(), reason="SANDBOX_ISOLATION=none")
+
+
+@pytest.fixture(scope="module")
+def run():
+    """Run code in one event loop for the whole module, so the warm pool is started once."""
+    if sandbox._isolated():
+        _, error = sandbox._probe_sandbox()
+        if error:
+            pytest.skip(f"sandbox isolation unavailable on this host: {error}")
+    loop = asyncio.new_event_loop()
+
+    def _run(code, mode, stdin="", expected=""):
+        results, _ = loop.run_until_complete(
+            run_cases(code, [sandbox.TestCase(input=stdin, expected_output=expected, description="")], mode))
+        return results[0]
+
+    yield _run
+    loop.close()
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("code, stdin, expected, status", [
+    ("print(sum(map(int, input().split())))", "2 3", "5", "passed"),
+    ("print(sum(map(int, input().split())) + 1)", "2 3", "5", "wrong_answer"),
+    ("raise SystemExit(3)", "", "", "runtime_error"),
+    ("while True:\n    pass", "", "", "timeout"),
+    ("import time\ntime.sleep(60)", "", "", "timeout"),
+    ("x = bytearray(4 * 1024 ** 3)", "", "", "memory_error"),
+    ("while True:\n    print('x' * 4096)", "", "", "output_limit"),
+])
+def test_statuses(run, mode, code, stdin, expected, status):
+    assert run(code, mode, stdin, expected).status == status
+
+
+@isolated_only
+@pytest.mark.parametrize("mode", MODES)
+def test_fork_bomb_is_capped(run, mode):
+    code = (
+        "import os, time\n"
+        "count = 0\n"
+        "try:\n"
+        "    while True:\n"
+        "        if os.fork() == 0:\n"
+        "            time.sleep(30)\n"
+        "            os._exit(0)\n"
+        "        count += 1\n"
+        "except OSError:\n"
+        "    print(count)\n"
+    )
+    result = run(code, mode)
+    assert result.status == "passed", result.stderr
+    assert int(result.stdout) < sandbox.SANDBOX_MAX_PROCESSES
+
+
+@isolated_only
+@pytest.mark.parametrize("mode", MODES)
+def test_detached_children_do_not_survive(run, mode):
+    marker = f"{os.getpid()}.{len(mode)}17"
+    code = (
+        "import os\n"
+        "if os.fork() == 0:\n"
+        "    os.setsid()\n"
+        f"    os.execvp('sleep', ['sleep', '{marker}'])\n"
+        "print('parent done')\n"
+    )
+    assert run(code, mode).status == "passed"
+    survivors = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if marker.encode() in f.read():
+                    with open(f"/proc/{pid}/stat") as stat:
+                        # Zombies waiting to be reaped are already dead
+                        if stat.read().rsplit(")", 1)[1].split()[0] != "Z":
+                            survivors.append(pid)
+        except OSError:
+            continue
+    assert not survivors
+
+
+@isolated_only
+@pytest.mark.parametrize("mode", MODES)
+def test_filesystem_is_read_only_and_hides_the_project(run, mode):
+    code = (
+        "import os\n"
+        f"print(os.path.exists({os.path.join(PROJECT_ROOT, 'backend')!r}))\n"
+        "for path in ('/usr/sandbox-escape', os.path.expanduser('~/sandbox-escape'), 'inside.txt'):\n"
+        "    try:\n"
+        "        open(path, 'w').close()\n"
+        "        print('writable', path)\n"
+        "    except OSError:\n"
+        "        print('denied', path)\n"
+    )
+    result = run(code, mode)
+    lines = result.stdout.split("\n")
+    assert lines[0] == "False"
+    assert lines[1].startswith("denied") and lines[2].startswith("denied")
+    assert lines[3] == "writable inside.txt"
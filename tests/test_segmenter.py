@@ -0,0 +1,33 @@
+"""Rule-based segmentation: clean submissions are accepted, ambiguous ones are not."""
+from backend.segmenter import AMBIGUOUS_FLAG, SEGMENT_CONFIDENCE_THRESHOLD, segment_submission
+
+PROBLEMS = [{"q_id": f"q{n}", "number": f"{n}.", "type": "计算题"} for n in range(1, 13)]
+
+
+def submission(answers):
+    return "\n".join(f"{n}. {text}" for n, text in enumerate(answers, start=1))
+
+
+def test_clean_submission_is_accepted():
+    stu_ans, confidence = segment_submission(submission([f"answer {n}" for n in range(1, 13)]), PROBLEMS)
+    assert confidence == 1.0
+    assert [ans["content"] for ans in stu_ans] == [f"answer {n}" for n in range(1, 13)]
+    assert all(ans["flag"] == [] for ans in stu_ans)
+
+
+def test_ambiguity_blocks_the_rule_path_with_many_questions():
+    # Q2's answer contains a "3)" list item, so Q3's header is taken from inside Q2's answer
+    answers = [f"answer {n}" for n in range(1, 13)]
+    answers[1] = "first part\n3) an enumerated step of question 2"
+    stu_ans, confidence = segment_submission(submission(answers), PROBLEMS)
+    assert confidence < SEGMENT_CONFIDENCE_THRESHOLD
+    assert AMBIGUOUS_FLAG in stu_ans[1]["flag"] and AMBIGUOUS_FLAG in stu_ans[2]["flag"]
+    assert all(ans["flag"] == [] for index, ans in enumerate(stu_ans) if index not in (1, 2))
+
+
+def test_missing_question_lowers_confidence():
+    answers = [f"answer {n}" for n in range(1, 13)]
+    text = "\n".join(f"{n}. {a}" for n, a in enumerate(answers, start=1) if n != 5)
+    stu_ans, confidence = segment_submission(text, PROBLEMS)
+    assert stu_ans[4]["content"] == ""
+    assert confidence == round(11 / 12, 3)
@@ -0,0 +1,53 @@
+"""Per-problem test suites: reference-solution validation and failure caching."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+
+from backend.correct import sandbox, test_suite
+from backend.correct.test_suite import get_test_suite, suite_fingerprint, validate_against_reference
+
+REFERENCE = "def add(a, b):\n    return a + b\n"
+
+
+@pytest.fixture
+def problem():
+    return {"stem": "Write add(a, b).", "criterion": "Full marks if all cases pass.", "reference_solution": REFERENCE}
+
+
+def test_reference_corrects_and_drops_cases(problem):
+    if sandbox._isolated() and sandbox._probe_sandbox()[1]:
+        pytest.skip("sandbox isolation unavailable on this host")
+    suite = test_suite.TestSuite(fingerprint=suite_fingerprint(problem), mode="function", function_name="add", test_cases=[
+        sandbox.TestCase(input="[1, 2]", expected_output="3", description="right"),
+        sandbox.TestCase(input="[2, 2]", expected_output="5", description="wrong expectation"),
+        sandbox.TestCase(input="[1, 'x']", expected_output="'1x'", description="reference raises"),
+    ])
+    validated = asyncio.run(validate_against_reference(suite, REFERENCE))
+    assert validated.validated
+    assert [(case.input, case.expected_output) for case in validated.test_cases] == [("[1, 2]", "3"), ("[2, 2]", "4")]
+
+
+def test_failed_generation_is_cached_until_retry_after(problem, monkeypatch):
+    calls = []
+
+    async def failing_generation(problem, llm):
+        calls.append(1)
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(test_suite, "generate_test_suite", failing_generation)
+    monkeypatch.setattr(test_suite, "_failures", {})
+
+    async def grade_twice():
+        assert await get_test_suite("q1", problem, llm=None) is None
+        assert await get_test_suite("q1", problem, llm=None) is None
+
+    asyncio.run(grade_twice())
+    assert len(calls) == 1
+    # An edited problem is a different suite and is generated again
+    asyncio.run(get_test_suite("q1", dict(problem, stem="Write add(a, b) for ints."), llm=None))
+    assert len(calls) == 2
+    monkeypatch.setattr(test_suite, "TEST_SUITE_RETRY_AFTER", 0.0)
+    asyncio.run(get_test_suite("q1", problem, llm=None))
+    assert len(calls) == 3